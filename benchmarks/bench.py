@@ -0,0 +1,284 @@
+"""
+Microbenchmarks for heliostat's resolution and patching hot paths.
+
+Every benchmark runs against synthetic fixtures (see ``fixtures.py``) at a
+range of sizes, so no network access or real rocks checkout is needed.
+Results are saved as JSON and can be compared against an earlier run:
+
+    python benchmarks/bench.py --output before.json
+    python benchmarks/bench.py --compare before.json --threshold 0.2
+"""
+
+import argparse
+import gzip
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+from collections.abc import Callable
+from contextlib import ExitStack
+from pathlib import Path
+from unittest.mock import patch
+
+from fixtures import (
+    family_name,
+    make_rock,
+    make_rocks_repo,
+    make_sources,
+    make_sources_gz,
+    source_binaries,
+)
+
+from heliostat import component
+from heliostat.cli.rock import _get_patched
+from heliostat.component import Target, parse_sources
+from heliostat.resources.ctr import image_digest
+from heliostat.rocks import SunbeamRockRepo
+from heliostat.types import Release, Series
+
+ROCK_COUNTS = [12, 48, 192]
+SOURCE_COUNTS = [100, 1000, 5000]
+LAYER_SIZES = [1 << 20, 8 << 20, 32 << 20]
+
+RESULTS_DIR = Path(__file__).parent / "results"
+
+Benchmark = tuple[str, Callable[[], object]]
+
+
+def best_time(func: Callable[[], object], repeat: int) -> float:
+    """Return the best time per call in seconds."""
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+
+def repo_benchmarks(
+    workdir: Path, n_rocks: int
+) -> tuple[list[Benchmark], list[str]]:
+    path = make_rocks_repo(workdir / f"repo-{n_rocks}", n_rocks)
+    warm_repo = SunbeamRockRepo(path)
+    # Resolve a handful of sources, as `rock build --source` would
+    binpkgs = [b for i in range(3) for b in source_binaries(f"svc{i:04d}")]
+
+    def rocks_for_packages(repo: SunbeamRockRepo):
+        return list(
+            repo.rocks_for_packages(
+                "svc0000",
+                series=Series.NOBLE,
+                release=Release.EPOXY,
+                consolidated=True,
+            )
+        )
+
+    rocks = list(warm_repo.rocks())
+
+    return [
+        (
+            f"rocks_for_packages[cold,N={n_rocks}]",
+            lambda: rocks_for_packages(SunbeamRockRepo(path)),
+        ),
+        (
+            f"rocks_for_packages[warm,N={n_rocks}]",
+            lambda: rocks_for_packages(warm_repo),
+        ),
+        (
+            f"_consolidate[N={n_rocks}]",
+            lambda: list(warm_repo._consolidate(rocks)),
+        ),
+        (
+            f"_get_patched[N={n_rocks}]",
+            lambda: [
+                _get_patched(
+                    rock.rockcraft_yaml(),
+                    ppa="team/ppa",
+                    release=Release.EPOXY,
+                    series=Series.NOBLE,
+                    version_suffix="heliostat",
+                )
+                for rock in rocks
+            ],
+        ),
+    ], binpkgs
+
+
+def patch_benchmarks(workdir: Path) -> list[Benchmark]:
+    path = make_rocks_repo(workdir / "repo-patch", 3)
+    rockcraft = SunbeamRockRepo(path).rock("svc0000-consolidated")
+    rockcraft = rockcraft.rockcraft_yaml()
+    return [
+        (
+            "RockcraftFile.patch",
+            lambda: _get_patched(
+                rockcraft,
+                ppa="team/ppa",
+                release=Release.EPOXY,
+                series=Series.NOBLE,
+                version_suffix="heliostat",
+            ),
+        )
+    ]
+
+
+def sources_benchmarks(n_sources: int) -> list[Benchmark]:
+    data = make_sources(n_sources)
+    compressed = make_sources_gz(n_sources)
+    return [
+        (f"parse_sources[M={n_sources}]", lambda: parse_sources(data)),
+        (
+            f"parse_sources_gz[M={n_sources}]",
+            lambda: parse_sources(gzip.decompress(compressed).decode("utf-8")),
+        ),
+    ]
+
+
+def resolve_benchmarks(workdir: Path, n_sources: int) -> list[Benchmark]:
+    """Resolve every tenth source from a local file:// mirror."""
+    mirror = workdir / f"mirror-{n_sources}"
+    index = mirror / "dists/noble-updates/epoxy/main/source/Sources.gz"
+    index.parent.mkdir(parents=True)
+    index.write_bytes(make_sources_gz(n_sources))
+    sources = [family_name(i) for i in range(0, n_sources, 10)]
+    targets = [Target(Series.NOBLE, Release.EPOXY)]
+
+    def resolve():
+        # Go to the mirror and the parsed index on disk every time
+        component.clear_index_cache()
+        with patch.object(
+            component, "UCA_BASE_URL", f"{mirror.as_uri()}/dists/"
+        ):
+            return component.resolve(sources, targets)
+
+    return [(f"resolve[M={n_sources},mirror]", resolve)]
+
+
+def digest_benchmarks(workdir: Path, layer_size: int) -> list[Benchmark]:
+    rock = workdir / f"bench-{layer_size}_1.0_amd64.rock"
+    make_rock(rock, [layer_size, layer_size // 4, 4096])
+    return [
+        (
+            f"image_digest[layer={layer_size >> 20}MiB]",
+            lambda: image_digest(rock),
+        )
+    ]
+
+
+def run(repeat: int, quick: bool, selected: str | None) -> dict[str, float]:
+    results = {}
+    rock_counts = ROCK_COUNTS[:1] if quick else ROCK_COUNTS
+    source_counts = SOURCE_COUNTS[:1] if quick else SOURCE_COUNTS
+    layer_sizes = LAYER_SIZES[:1] if quick else LAYER_SIZES
+
+    with ExitStack() as stack:
+        workdir = Path(stack.enter_context(tempfile.TemporaryDirectory()))
+        benchmarks = patch_benchmarks(workdir)
+        binpkgs: list[str] = []
+        for n_rocks in rock_counts:
+            repo_benches, binpkgs = repo_benchmarks(workdir, n_rocks)
+            benchmarks.extend(repo_benches)
+        for n_sources in source_counts:
+            benchmarks.extend(sources_benchmarks(n_sources))
+            benchmarks.extend(resolve_benchmarks(workdir, n_sources))
+        for layer_size in layer_sizes:
+            benchmarks.extend(digest_benchmarks(workdir, layer_size))
+
+        # Keep parsed indexes out of the real cache
+        stack.enter_context(
+            patch.dict(os.environ, {"XDG_CACHE_HOME": str(workdir / "cache")})
+        )
+        # rocks_for_packages would otherwise ask madison or the UCA
+        stack.enter_context(
+            patch("heliostat.rocks.package_list", return_value=binpkgs)
+        )
+
+        for name, func in benchmarks:
+            if selected and selected not in name:
+                continue
+            results[name] = best_time(func, repeat)
+            print(f"{name:45s} {results[name] * 1000:10.3f} ms")
+    return results
+
+
+def metadata() -> dict[str, str]:
+    try:
+        commit = subprocess.check_output(
+            ["git", "rev-parse", "HEAD"],
+            cwd=Path(__file__).parent,
+            text=True,
+            stderr=subprocess.DEVNULL,
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = "unknown"
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    }
+
+
+def compare(
+    results: dict[str, float], baseline_path: Path, threshold: float
+) -> bool:
+    """Print the change against the baseline, returning False on any
+    regression larger than ``threshold``."""
+    baseline = json.loads(baseline_path.read_text())["results"]
+    ok = True
+    print(f"\nCompared with {baseline_path}:")
+    for name, seconds in results.items():
+        if name not in baseline:
+            continue
+        ratio = seconds / baseline[name]
+        marker = ""
+        if ratio > 1 + threshold:
+            marker = "  REGRESSION"
+            ok = False
+        print(f"{name:45s} {ratio:6.2f}x{marker}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--quick", action="store_true", help="Only run the smallest sizes"
+    )
+    parser.add_argument(
+        "-k", dest="selected", help="Only run benchmarks containing this"
+    )
+    parser.add_argument(
+        "--output",
+        type=Path,
+        help="Where to save results (Default: benchmarks/results/<time>.json)",
+    )
+    parser.add_argument("--compare", type=Path, help="Baseline results file")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.25,
+        help="Allowed slowdown against the baseline (Default: 0.25)",
+    )
+    options = parser.parse_args()
+
+    results = run(options.repeat, options.quick, options.selected)
+
+    output = options.output
+    if output is None:
+        RESULTS_DIR.mkdir(exist_ok=True)
+        output = RESULTS_DIR / f"{time.strftime('%Y%m%d-%H%M%S')}.json"
+    output.write_text(
+        json.dumps({"meta": metadata(), "results": results}, indent=2)
+    )
+    print(f"\nSaved results to {output}")
+
+    if options.compare and not compare(
+        results, options.compare, options.threshold
+    ):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+"""
+Stand-in ``rockcraft``, ``ctr``, ``juju`` and ``ssh`` executables for
+simulations.
+
+``simulate.py`` installs wrappers which run this script with the name of the
+tool as the first argument. Each tool sleeps for a configurable time, fails
+at a configurable rate and appends an event to ``$SIM_STATE_DIR/events.jsonl``
+so the scenario runner can analyse what happened. Behaviour is controlled by
+environment variables:
+
+``SIM_<TOOL>_LATENCY``       base duration of a call in seconds
+``SIM_<TOOL>_FAILURE_RATE``  probability in [0, 1] that a call fails
+``SIM_ARTIFACT_SIZE``        size in bytes of the main layer of built rocks
+``SIM_CTR_BANDWIDTH``        bytes per second that ``ctr import`` achieves
+``SIM_SEED``                 seed for failures, so runs are reproducible
+
+The ``ssh`` stand-in runs the remote command locally after
+``SIM_SSH_LATENCY`` seconds, so ``--builder ssh://simN?jobs=N`` simulates a
+build farm.
+"""
+
+import hashlib
+import json
+import os
+import random
+import re
+import subprocess
+import sys
+import tarfile
+import time
+from pathlib import Path
+
+from fixtures import make_rock
+
+
+def env_float(name: str, default: float) -> float:
+    return float(os.environ.get(name, default))
+
+
+def state_dir() -> Path:
+    path = Path(os.environ["SIM_STATE_DIR"])
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def record(tool: str, args: list[str], start: float, ok: bool, **extra):
+    event = {
+        "tool": tool,
+        "args": args,
+        "start": start,
+        "end": time.time(),
+        "ok": ok,
+        **extra,
+    }
+    with (state_dir() / "events.jsonl").open("a") as f:
+        f.write(json.dumps(event) + "\n")
+
+
+def rock_weight(name: str) -> float:
+    """A stable per-rock multiplier so that some rocks take much longer."""
+    if name.endswith("-consolidated"):
+        return 3.0
+    digest = hashlib.sha256(name.encode()).digest()
+    return 0.5 + digest[0] / 255 * 1.5
+
+
+def should_fail(tool: str, key: str) -> bool:
+    rate = env_float(f"SIM_{tool.upper()}_FAILURE_RATE", 0.0)
+    seed = f"{os.environ.get('SIM_SEED', '0')}:{tool}:{key}"
+    return random.Random(seed).random() < rate
+
+
+def rockcraft(args: list[str]) -> int:
+    start = time.time()
+    if args[:1] != ["pack"]:
+        print(f"fake rockcraft: unsupported command {args}", file=sys.stderr)
+        return 2
+
+    text = Path("rockcraft.yaml").read_text()
+    fields = {}
+    for key in ("name", "version"):
+        match = re.search(rf"^{key}:\s*\"?([^\"\s]+)", text, re.M)
+        if match is None:
+            print(
+                f"fake rockcraft: no {key} in rockcraft.yaml", file=sys.stderr
+            )
+            return 2
+        fields[key] = match.group(1)
+    name, version = fields["name"], fields["version"]
+
+    time.sleep(env_float("SIM_ROCKCRAFT_LATENCY", 0.1) * rock_weight(name))
+    if should_fail("rockcraft", name):
+        record("rockcraft", args, start, False, rock=name)
+        print(f"fake rockcraft: failed to pack {name}", file=sys.stderr)
+        return 1
+
+    size = int(env_float("SIM_ARTIFACT_SIZE", 1 << 20) * rock_weight(name))
+    artifact = Path(f"{name}_{version}_amd64.rock")
+    seed = int.from_bytes(hashlib.sha256(name.encode()).digest()[:4])
+    make_rock(artifact, [size, 4096], seed=seed)
+    record("rockcraft", args, start, True, rock=name, bytes=size)
+    return 0
+
+
+def ctr(args: list[str]) -> int:
+    start = time.time()
+    # Drop the global --address/--namespace options
+    while args and args[0].startswith("--"):
+        args = args[2:]
+    images = state_dir() / "ctr-images.txt"
+
+    if args[:3] == ["images", "ls", "-q"]:
+        if images.exists():
+            sys.stdout.write(images.read_text())
+        record("ctr", args, start, True)
+        return 0
+
+    if args[:2] == ["images", "import"]:
+        rock = Path(args[-1])
+        base_name = args[args.index("--base-name") + 1]
+        size = rock.stat().st_size
+        bandwidth = env_float("SIM_CTR_BANDWIDTH", 200 << 20)
+        time.sleep(env_float("SIM_CTR_LATENCY", 0.05) + size / bandwidth)
+        if should_fail("ctr", rock.name):
+            record("ctr", args, start, False, bytes=size)
+            return 1
+        index = json.loads(_read_index(rock))
+        digest = index["manifests"][0]["digest"]
+        with images.open("a") as f:
+            f.write(f"{base_name}@{digest}\n")
+        record("ctr", args, start, True, bytes=size)
+        return 0
+
+    print(f"fake ctr: unsupported command {args}", file=sys.stderr)
+    return 2
+
+
+def _read_index(rock: Path) -> bytes:
+    with tarfile.open(rock) as tar:
+        f = tar.extractfile("index.json")
+        assert f is not None
+        return f.read()
+
+
+def juju(args: list[str]) -> int:
+    start = time.time()
+    if args[:1] != ["attach-resource"]:
+        print(f"fake juju: unsupported command {args}", file=sys.stderr)
+        return 2
+    charm = args[3]
+    time.sleep(env_float("SIM_JUJU_LATENCY", 0.05))
+    ok = not should_fail("juju", charm)
+    record("juju", args, start, ok, charm=charm)
+    return 0 if ok else 1
+
+
+def ssh(args: list[str]) -> int:
+    start = time.time()
+    # Drop options such as -o BatchMode=yes and -p PORT
+    while args and args[0].startswith("-"):
+        args = args[2:]
+    host, command = args[0], args[1]
+    time.sleep(env_float("SIM_SSH_LATENCY", 0.01))
+    returncode = subprocess.call(["sh", "-c", command])
+    record("ssh", args, start, returncode == 0, host=host)
+    return returncode
+
+
+TOOLS = {"rockcraft": rockcraft, "ctr": ctr, "juju": juju, "ssh": ssh}
+
+
+def main():
+    tool, *args = sys.argv[1:]
+    sys.exit(TOOLS[tool](args))
+
+
+if __name__ == "__main__":
+    main()
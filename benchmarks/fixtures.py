@@ -0,0 +1,188 @@
+"""
+Synthetic fixtures for benchmarking heliostat without network access.
+
+The generated data mimics the shape of the real inputs: a checkout of
+ubuntu-openstack-rocks with a ``rocks/<name>/rockcraft.yaml`` per rock, a UCA
+``Sources`` index and built ``.rock`` OCI archives.
+"""
+
+import gzip
+import hashlib
+import io
+import json
+import random
+import tarfile
+from pathlib import Path
+
+ROCKS_PER_FAMILY = ("api", "scheduler", "consolidated")
+
+ROCKCRAFT_TEMPLATE = """\
+name: {name}
+summary: Synthetic rock {name}
+description: Synthetic rock used for benchmarking heliostat
+version: "2025.1"
+license: Apache-2.0
+base: ubuntu@24.04
+platforms:
+  amd64:
+package-repositories:
+  - type: apt
+    cloud: epoxy
+    priority: always
+services:
+  {name}:
+    override: replace
+    command: /usr/bin/{name}
+    startup: enabled
+parts:
+  {family}:
+    plugin: nil
+    overlay-packages:
+{packages}
+"""
+
+SOURCES_TEMPLATE = """\
+Package: {source}
+Binary: {binaries}
+Version: 2:{version}-0ubuntu1~cloud0
+Maintainer: Ubuntu Developers <ubuntu-devel-discuss@lists.ubuntu.com>
+Build-Depends: debhelper-compat (= 13), dh-python, python3-all
+Architecture: all
+Standards-Version: 4.6.2
+Format: 3.0 (quilt)
+Files:
+ 0123456789abcdef0123456789abcdef 2048 {source}_{version}.dsc
+Package-List:
+{package_list}
+Directory: pool/main/{initial}/{source}
+Priority: optional
+Section: misc
+"""
+
+
+def family_name(index: int) -> str:
+    return f"svc{index:04d}"
+
+
+def source_binaries(source: str) -> list[str]:
+    return [
+        f"{source}-api",
+        f"{source}-scheduler",
+        f"{source}-common",
+        f"python3-{source}",
+    ]
+
+
+def make_rocks_repo(path: Path, n_rocks: int) -> Path:
+    """Create a fake ubuntu-openstack-rocks checkout with ``n_rocks`` rocks.
+
+    Rocks come in families of an api, scheduler and consolidated rock which
+    depend on the binaries of the family's source package.
+    """
+    rocks_dir = path / "rocks"
+    rocks_dir.mkdir(parents=True, exist_ok=True)
+    for i in range(n_rocks):
+        family = family_name(i // len(ROCKS_PER_FAMILY))
+        kind = ROCKS_PER_FAMILY[i % len(ROCKS_PER_FAMILY)]
+        name = f"{family}-{kind}"
+        binaries = source_binaries(family)
+        if kind == "api":
+            packages = [binaries[0], binaries[2]]
+        elif kind == "scheduler":
+            packages = [binaries[1], binaries[2]]
+        else:
+            packages = binaries
+        packages = ["sudo", "python3-pymysql", *packages]
+        rock_dir = rocks_dir / name
+        rock_dir.mkdir(exist_ok=True)
+        (rock_dir / "rockcraft.yaml").write_text(
+            ROCKCRAFT_TEMPLATE.format(
+                name=name,
+                family=family,
+                packages="\n".join(f"      - {p}" for p in packages),
+            )
+        )
+    return path
+
+
+def make_sources(n_sources: int) -> str:
+    """Return a Sources index with ``n_sources`` paragraphs."""
+    paragraphs = []
+    for i in range(n_sources):
+        source = family_name(i)
+        binaries = source_binaries(source)
+        paragraphs.append(
+            SOURCES_TEMPLATE.format(
+                source=source,
+                binaries=", ".join(binaries),
+                version=f"{26 + i % 3}.{i % 7}.0",
+                package_list="\n".join(
+                    f" {b} deb python optional arch=all" for b in binaries
+                ),
+                initial=source[0],
+            )
+        )
+    return "\n".join(paragraphs)
+
+
+def make_sources_gz(n_sources: int) -> bytes:
+    return gzip.compress(make_sources(n_sources).encode("utf-8"))
+
+
+def _digest(data: bytes) -> str:
+    return "sha256:" + hashlib.sha256(data).hexdigest()
+
+
+def make_rock(path: Path, layer_sizes: list[int], seed: int = 0) -> str:
+    """Write a ``.rock`` OCI archive with random layers of the given sizes.
+
+    Returns the digest of the image manifest.
+    """
+    rng = random.Random(seed)
+    layers = [rng.randbytes(size) for size in layer_sizes]
+    config = json.dumps({"architecture": "amd64", "os": "linux"}).encode()
+    manifest = json.dumps(
+        {
+            "schemaVersion": 2,
+            "mediaType": "application/vnd.oci.image.manifest.v1+json",
+            "config": {
+                "mediaType": "application/vnd.oci.image.config.v1+json",
+                "digest": _digest(config),
+                "size": len(config),
+            },
+            "layers": [
+                {
+                    "mediaType": "application/vnd.oci.image.layer.v1.tar",
+                    "digest": _digest(layer),
+                    "size": len(layer),
+                }
+                for layer in layers
+            ],
+        }
+    ).encode()
+    index = json.dumps(
+        {
+            "schemaVersion": 2,
+            "manifests": [
+                {
+                    "mediaType": "application/vnd.oci.image.manifest.v1+json",
+                    "digest": _digest(manifest),
+                    "size": len(manifest),
+                }
+            ],
+        }
+    ).encode()
+
+    files = {"oci-layout": b'{"imageLayoutVersion": "1.0.0"}'}
+    for blob in [config, *layers, manifest]:
+        files[f"blobs/sha256/{_digest(blob).split(':')[1]}"] = blob
+    # Storing index.json last is the worst case for image_digest, which
+    # has to scan past every blob to find it
+    files["index.json"] = index
+
+    with tarfile.open(path, "w") as tar:
+        for name, data in files.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+    return _digest(manifest)
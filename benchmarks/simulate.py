@@ -0,0 +1,261 @@
+"""
+End-to-end load simulation of heliostat's build and rollout orchestration.
+
+A synthetic ubuntu-openstack-rocks repository is served from a local git
+remote and the ``rockcraft``, ``ctr`` and ``juju`` binaries are replaced with
+the stand-ins in ``fakebin.py``, so a full ``rock build`` of 100+ rocks
+followed by a ``charm attach`` rollout can be run on any Linux machine:
+
+    python benchmarks/simulate.py --rocks 120 --rockcraft-latency 0.2
+    python benchmarks/simulate.py --build-arg=--jobs=8 --failure-rate 0.02
+    python benchmarks/simulate.py --build-arg=--builder=ssh://sim1?jobs=4 \
+        --build-arg=--builder=ssh://sim2?jobs=4
+
+The report covers wall time, throughput, worker utilisation, time spent in
+each fake tool and failures, and can also be saved as JSON.
+"""
+
+import argparse
+import json
+import os
+import shlex
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from fixtures import make_rocks_repo
+
+BENCH_DIR = Path(__file__).parent
+REPO_NAME = "ubuntu-openstack-rocks"
+BRANCHES = ["main", "stable/2024.1", "stable/2023.1"]
+
+HELIOSTAT = [
+    sys.executable,
+    "-c",
+    "from heliostat.cli import main; main(prog_name='heliostat')",
+]
+
+
+def git(*args: str, cwd: Path):
+    subprocess.check_call(
+        ["git", *args],
+        cwd=cwd,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+
+def make_remote(workdir: Path, n_rocks: int) -> Path:
+    """Create a git remote of synthetic rocks with the release branches."""
+    source = make_rocks_repo(workdir / "source", n_rocks)
+    git("init", "--quiet", "--initial-branch=main", cwd=source)
+    git("add", ".", cwd=source)
+    git(
+        "-c",
+        "user.name=heliostat",
+        "-c",
+        "user.email=heliostat@localhost",
+        "commit",
+        "--quiet",
+        "-m",
+        "Synthetic rocks",
+        cwd=source,
+    )
+    for branch in BRANCHES[1:]:
+        git("branch", branch, cwd=source)
+    return source
+
+
+def seed_cache(cache_home: Path, remote: Path):
+    """Pre-clone the synthetic remote where heliostat expects its clone.
+
+    ``ensure_repo`` then only fetches from the local remote.
+    """
+    clone = cache_home / "heliostat" / REPO_NAME
+    clone.parent.mkdir(parents=True, exist_ok=True)
+    git("clone", "--quiet", str(remote), str(clone), cwd=cache_home)
+
+
+def install_fakes(bin_dir: Path) -> dict[str, str]:
+    bin_dir.mkdir(parents=True, exist_ok=True)
+    env = {}
+    for tool in ("rockcraft", "ctr", "juju", "ssh"):
+        wrapper = bin_dir / tool
+        wrapper.write_text(
+            "#!/bin/sh\n"
+            f"exec {shlex.quote(sys.executable)} "
+            f'{shlex.quote(str(BENCH_DIR / "fakebin.py"))} {tool} "$@"\n'
+        )
+        wrapper.chmod(0o755)
+        env[f"HELIOSTAT_{tool.upper()}"] = str(wrapper)
+    return env
+
+
+def run_heliostat(
+    args: list[str], env: dict[str, str]
+) -> tuple[float, subprocess.CompletedProcess]:
+    start = time.monotonic()
+    result = subprocess.run(
+        HELIOSTAT + args, env=env, capture_output=True, text=True
+    )
+    return time.monotonic() - start, result
+
+
+def load_events(state_dir: Path) -> list[dict]:
+    events_file = state_dir / "events.jsonl"
+    if not events_file.exists():
+        return []
+    return [json.loads(line) for line in events_file.read_text().splitlines()]
+
+
+def tool_summary(events: list[dict], tool: str) -> dict[str, float]:
+    calls = [e for e in events if e["tool"] == tool]
+    busy = sum(e["end"] - e["start"] for e in calls)
+    return {
+        "calls": len(calls),
+        "failures": sum(not e["ok"] for e in calls),
+        "busy_seconds": round(busy, 3),
+        "bytes": sum(e.get("bytes", 0) for e in calls),
+    }
+
+
+def simulate(options: argparse.Namespace, workdir: Path) -> dict:
+    state_dir = workdir / "state"
+    output_dir = workdir / "out"
+    output_dir.mkdir()
+
+    remote = make_remote(workdir, options.rocks)
+    seed_cache(workdir / "cache", remote)
+
+    env = {
+        **os.environ,
+        **install_fakes(workdir / "bin"),
+        # Commands run through the fake ssh find the fake rockcraft
+        "PATH": f"{workdir / 'bin'}{os.pathsep}{os.environ['PATH']}",
+        "HELIOSTAT_SUDO": "",
+        "XDG_CACHE_HOME": str(workdir / "cache"),
+        "SIM_STATE_DIR": str(state_dir),
+        "SIM_SEED": str(options.seed),
+        "SIM_ARTIFACT_SIZE": str(options.artifact_size),
+        "SIM_ROCKCRAFT_LATENCY": str(options.rockcraft_latency),
+        "SIM_CTR_LATENCY": str(options.ctr_latency),
+        "SIM_JUJU_LATENCY": str(options.juju_latency),
+        "SIM_SSH_LATENCY": str(options.ssh_latency),
+        "SIM_ROCKCRAFT_FAILURE_RATE": str(options.failure_rate),
+        "SIM_CTR_FAILURE_RATE": str(options.failure_rate),
+        "SIM_JUJU_FAILURE_RATE": str(options.failure_rate),
+    }
+
+    rock_names = sorted(p.name for p in (remote / "rocks").iterdir())
+    build_args = ["rock", "build", "--output-dir", str(output_dir)]
+    for name in rock_names:
+        build_args += ["--rock", name]
+    build_args += options.build_arg
+
+    build_wall, build = run_heliostat(build_args, env)
+    if build.returncode != 0:
+        print(build.stdout[-2000:], build.stderr[-2000:], file=sys.stderr)
+
+    rocks = sorted(output_dir.glob("*.rock"))
+
+    def attach(rock: Path) -> bool:
+        name = rock.name.split("_")[0]
+        family = name.split("-")[0]
+        _, result = run_heliostat(
+            ["charm", "attach", f"{family}-k8s", str(rock), f"{name}-image"],
+            env,
+        )
+        return result.returncode == 0
+
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=options.attach_jobs) as pool:
+        attached = list(pool.map(attach, rocks))
+    attach_wall = time.monotonic() - start
+
+    events = load_events(state_dir)
+    rockcraft = tool_summary(events, "rockcraft")
+    report = {
+        "rocks": options.rocks,
+        "build": {
+            "exit_code": build.returncode,
+            "wall_seconds": round(build_wall, 3),
+            "artifacts": len(rocks),
+            "rocks_per_minute": round(len(rocks) / build_wall * 60, 2),
+            # How many rockcraft processes were busy on average
+            "utilisation": round(rockcraft["busy_seconds"] / build_wall, 2),
+        },
+        "attach": {
+            "wall_seconds": round(attach_wall, 3),
+            "succeeded": sum(attached),
+            "failed": len(attached) - sum(attached),
+        },
+        "tools": {
+            tool: tool_summary(events, tool)
+            for tool in ("rockcraft", "ctr", "juju", "ssh")
+        },
+        "workdir": str(workdir),
+    }
+    return report
+
+
+def print_report(report: dict):
+    build, attach = report["build"], report["attach"]
+    print(f"Simulated {report['rocks']} rocks in {report['workdir']}")
+    print(
+        f"build:  {build['wall_seconds']:8.2f}s wall, "
+        f"{build['artifacts']} artifacts, "
+        f"{build['rocks_per_minute']} rocks/min, "
+        f"utilisation {build['utilisation']}, exit {build['exit_code']}"
+    )
+    print(
+        f"attach: {attach['wall_seconds']:8.2f}s wall, "
+        f"{attach['succeeded']} ok, {attach['failed']} failed"
+    )
+    for tool, summary in report["tools"].items():
+        print(
+            f"{tool:>9}: {summary['calls']} calls, "
+            f"{summary['failures']} failed, "
+            f"{summary['busy_seconds']}s busy, {summary['bytes']} bytes"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rocks", type=int, default=120)
+    parser.add_argument("--rockcraft-latency", type=float, default=0.1)
+    parser.add_argument("--ctr-latency", type=float, default=0.02)
+    parser.add_argument("--juju-latency", type=float, default=0.02)
+    parser.add_argument("--ssh-latency", type=float, default=0.01)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--artifact-size", type=int, default=256 << 10)
+    parser.add_argument("--attach-jobs", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--build-arg",
+        action="append",
+        default=[],
+        help="Extra argument for `heliostat rock build` (repeatable)",
+    )
+    parser.add_argument("--output", type=Path, help="Save the report as JSON")
+    parser.add_argument(
+        "--keep", action="store_true", help="Keep the simulation directory"
+    )
+    options = parser.parse_args()
+
+    if options.keep:
+        report = simulate(
+            options, Path(tempfile.mkdtemp(prefix="heliostat-sim-"))
+        )
+    else:
+        with tempfile.TemporaryDirectory(prefix="heliostat-sim-") as workdir:
+            report = simulate(options, Path(workdir))
+    print_report(report)
+    if options.output:
+        options.output.write_text(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
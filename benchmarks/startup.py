@@ -0,0 +1,94 @@
+"""
+Measure the cold startup cost of the heliostat CLI with ``-X importtime``.
+
+Each scenario runs the CLI in a fresh interpreter and sums the import time
+of everything imported after ``site``, i.e. everything the command itself
+pulls in. The best of ``--repeat`` runs is compared against ``--budget-ms``
+and the script exits non-zero if any scenario is over budget or imports one
+of the heavy dependencies which should only be loaded on demand.
+
+    python benchmarks/startup.py --budget-ms 250
+"""
+
+import argparse
+import subprocess
+import sys
+
+SCENARIOS = [
+    ["--help"],
+    ["rock", "--help"],
+    ["rock", "list", "--help"],
+    ["package", "show", "--help"],
+    ["charm", "attach", "--help"],
+]
+
+# Only needed once a command actually fetches, parses or pushes something
+HEAVY_MODULES = {"requests", "ruamel.yaml", "debian.deb822", "urllib3"}
+
+RUNNER = (
+    "import sys; from heliostat.cli import main; "
+    "main(args=sys.argv[1:], prog_name='heliostat')"
+)
+
+
+def import_times(args: list[str]) -> tuple[dict[str, int], set[str]]:
+    """Run the CLI and collect its imports.
+
+    Returns the cumulative import time in µs of each top-level import made
+    after ``site``, along with the name of every module imported.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", RUNNER, *args],
+        capture_output=True,
+        text=True,
+    )
+    times: dict[str, int] = {}
+    modules: set[str] = set()
+    after_site = False
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        modules.add(name.strip())
+        if name.strip() == "site":
+            after_site = True
+        # Nested imports are indented and already included in their parent
+        elif after_site and not name.startswith("  "):
+            times[name.strip()] = int(cumulative)
+    return times, modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--budget-ms", type=float, default=250.0)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--top", type=int, default=5, help="Show the N slowest imports"
+    )
+    options = parser.parse_args()
+
+    failed = False
+    for args in SCENARIOS:
+        runs = [import_times(args) for _ in range(options.repeat)]
+        best, modules = min(runs, key=lambda run: sum(run[0].values()))
+        total_ms = sum(best.values()) / 1000
+        heavy = HEAVY_MODULES & modules
+
+        status = "ok"
+        if total_ms > options.budget_ms:
+            status = "OVER BUDGET"
+            failed = True
+        if heavy:
+            status = f"IMPORTS {', '.join(sorted(heavy))}"
+            failed = True
+
+        print(f"heliostat {' '.join(args)}: {total_ms:.1f} ms [{status}]")
+        slowest = sorted(best.items(), key=lambda kv: kv[1], reverse=True)
+        for name, micros in slowest[: options.top]:
+            print(f"    {micros / 1000:8.1f} ms  {name}")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
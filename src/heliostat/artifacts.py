@@ -0,0 +1,92 @@
+"""
+Records of what went into the rocks in an output directory.
+
+Every successful build leaves ``.heliostat/<rock>.json`` next to its
+artifacts, so later builds can tell whether a rock is still current
+without building it again.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import time
+from pathlib import Path
+
+import msgspec
+
+from heliostat.fetch import write_atomic
+from heliostat.types import Release, Series
+
+RECORD_DIR = ".heliostat"
+
+
+class ArtifactRecord(msgspec.Struct, omit_defaults=True):
+    rock: str
+    release: Release
+    series: Series
+    artifacts: list[str]
+    # Newest available version of each overlay package at build time, when
+    # built incrementally
+    packages: dict[str, str] | None = None
+    ppa: str | None = None
+    # Fingerprint of the build directory and upstream commit
+    inputs: str | None = None
+    built: float = msgspec.field(default_factory=time.time)
+
+    def artifacts_exist(self, output_dir: Path) -> bool:
+        return bool(self.artifacts) and all(
+            (output_dir / name).exists() for name in self.artifacts
+        )
+
+    def changed_packages(self, versions: dict[str, str]) -> list[str]:
+        """The packages whose version differs from ``versions``."""
+        packages = self.packages or {}
+        return sorted(
+            package
+            for package in packages.keys() | versions.keys()
+            if packages.get(package) != versions.get(package)
+        )
+
+
+def fingerprint(build_dir: Path, commit: str | None) -> str:
+    """Hash the files of a build directory, ready for ``rockcraft pack``,
+    together with the upstream commit the rock was taken from."""
+    digest = hashlib.sha256(f"{commit}\n".encode())
+    for path in sorted(build_dir.rglob("*")):
+        if path.is_file():
+            digest.update(f"{path.relative_to(build_dir)}\n".encode())
+            digest.update(hashlib.sha256(path.read_bytes()).digest())
+    return digest.hexdigest()
+
+
+def record_path(output_dir: Path, rock: str) -> Path:
+    return output_dir / RECORD_DIR / f"{rock}.json"
+
+
+def load_record(output_dir: Path, rock: str) -> ArtifactRecord | None:
+    try:
+        return msgspec.json.decode(
+            record_path(output_dir, rock).read_bytes(), type=ArtifactRecord
+        )
+    except (FileNotFoundError, msgspec.DecodeError):
+        return None
+
+
+def load_records(output_dir: Path) -> list[ArtifactRecord]:
+    """The records of every rock built into ``output_dir``."""
+    records = []
+    for path in sorted((output_dir / RECORD_DIR).glob("*.json")):
+        record = load_record(output_dir, path.stem)
+        if record is not None:
+            records.append(record)
+    return records
+
+
+def save_record(output_dir: Path, record: ArtifactRecord):
+    write_atomic(
+        record_path(output_dir, record.rock), msgspec.json.encode(record)
+    )
+
+
+def remove_record(output_dir: Path, rock: str):
+    record_path(output_dir, rock).unlink(missing_ok=True)
@@ -0,0 +1,174 @@
+"""
+A build queue shared by everyone building rocks on one host.
+
+``heliostat build-queue`` listens on a Unix socket and ``rock build
+--builder queue`` sends it the build directory of each rock. Identical
+build directories, e.g. the same rock, PPA and release requested by two
+people at once, are built once while the build runs and the rocks are sent
+to every client waiting for them, and at most a fixed number of builds run
+on the host at a time. Finished builds are not reused, as the packages they
+installed may have been updated since.
+"""
+
+from __future__ import annotations
+
+import os
+import shutil
+import socketserver
+import tempfile
+import threading
+from concurrent.futures import Future
+from pathlib import Path
+from typing import cast
+
+import msgspec
+
+from heliostat.artifacts import fingerprint
+from heliostat.executors import (
+    BuildError,
+    BuildRequest,
+    Executor,
+    LocalExecutor,
+)
+
+
+class Build:
+    """A build directory being built for one or more clients."""
+
+    def __init__(self, build_dir: Path):
+        self.build_dir = build_dir
+        self.future: Future[list[Path]] = Future()
+        # Clients which have not been sent the rocks yet
+        self.clients = 1
+
+
+class BuildQueue:
+    def __init__(self, jobs: int = 1, executor: Executor | None = None):
+        self.executor = executor or LocalExecutor()
+        self._slots = threading.Semaphore(jobs)
+        self._lock = threading.Lock()
+        self._building: dict[str, Build] = {}
+
+    def submit(
+        self, rock_name: str, files: dict[str, bytes]
+    ) -> tuple[str, Build]:
+        """Queue the build of a build directory, unless an identical one is
+        being built already. Returns whether the build was ``queued`` or
+        ``joined``, and the build, to be released once its rocks have been
+        sent."""
+        build_dir = Path(tempfile.mkdtemp(prefix=f"heliostat-{rock_name}"))
+        try:
+            for name, content in files.items():
+                path = build_dir / name
+                if not path.resolve().is_relative_to(build_dir.resolve()):
+                    raise ValueError(f"Invalid path in build: {name}")
+                path.parent.mkdir(parents=True, exist_ok=True)
+                path.write_bytes(content)
+            key = fingerprint(build_dir, None)
+
+            with self._lock:
+                build = self._building.get(key)
+                if build is not None:
+                    build.clients += 1
+                    shutil.rmtree(build_dir)
+                    return "joined", build
+                build = self._building[key] = Build(build_dir)
+        except BaseException:
+            shutil.rmtree(build_dir, ignore_errors=True)
+            raise
+
+        threading.Thread(
+            target=self._build, args=(key, rock_name, build), daemon=True
+        ).start()
+        return "queued", build
+
+    def _build(self, key: str, rock_name: str, build: Build):
+        try:
+            with self._slots:
+                rocks = self.executor.pack(rock_name, build.build_dir)
+            build.future.set_result(rocks)
+        except Exception as e:
+            build.future.set_exception(e)
+        finally:
+            with self._lock:
+                # Later requests build again
+                del self._building[key]
+                unused = build.clients == 0
+            if unused:
+                shutil.rmtree(build.build_dir, ignore_errors=True)
+
+    def release(self, build: Build):
+        """Record that a client is done with a build, removing the build
+        directory once every client is and the build has finished."""
+        with self._lock:
+            build.clients -= 1
+            unused = build.clients == 0 and build.future.done()
+        if unused:
+            shutil.rmtree(build.build_dir, ignore_errors=True)
+
+
+class Handler(socketserver.StreamRequestHandler):
+    def send(self, message: dict):
+        self.wfile.write(msgspec.json.encode(message) + b"\n")
+        self.wfile.flush()
+
+    def handle(self):
+        queue = cast(Server, self.server).queue
+        try:
+            request = msgspec.json.decode(
+                self.rfile.readline(), type=BuildRequest
+            )
+            status, build = queue.submit(request.rock, request.files)
+        except (msgspec.DecodeError, ValueError) as e:
+            self.send({"error": f"Invalid request: {e}", "returncode": 2})
+            return
+        try:
+            self.send({"status": status})
+            self.send_rocks(build.future)
+        finally:
+            queue.release(build)
+
+    def send_rocks(self, future: Future[list[Path]]):
+        try:
+            rocks = future.result()
+        except BuildError as e:
+            self.send({"error": str(e), "returncode": e.returncode})
+            return
+        except Exception as e:
+            self.send({"error": f"{type(e).__name__}: {e}", "returncode": 1})
+            return
+        for rock in rocks:
+            self.send({"artifact": rock.name, "size": rock.stat().st_size})
+            with rock.open("rb") as f:
+                shutil.copyfileobj(f, self.wfile)
+        self.send({"done": True})
+
+
+class Server(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path: Path, queue: BuildQueue):
+        self.queue = queue
+        if path.exists():
+            path.unlink()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        super().__init__(str(path), Handler)
+
+    def server_bind(self):
+        # Shared with the group of the user running the queue. Create the
+        # socket with these permissions rather than chmod it afterwards,
+        # which would leave it open to others in between.
+        umask = os.umask(0o117)
+        try:
+            super().server_bind()
+        finally:
+            os.umask(umask)
+
+
+def serve(path: Path, jobs: int):
+    """Serve builds on ``path`` until interrupted."""
+    with Server(path, BuildQueue(jobs)) as server:
+        try:
+            server.serve_forever()
+        finally:
+            path.unlink(missing_ok=True)
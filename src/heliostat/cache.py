@@ -0,0 +1,256 @@
+"""
+Size accounting and least-recently-used eviction for heliostat's cache.
+
+Everything heliostat keeps lives under ``fetch.cache_dir()`` and is sorted
+into categories, each of which can be capped in size with
+``HELIOSTAT_CACHE_MAX_<CATEGORY>`` (e.g. ``HELIOSTAT_CACHE_MAX_REPOS=5G``).
+Code which reuses a cache entry marks it with ``fetch.mark_used``, so the
+modification time of an entry is when it was last used.
+"""
+
+from __future__ import annotations
+
+import os
+import re
+import shutil
+import subprocess
+import time
+from collections.abc import Iterable, Mapping
+from dataclasses import dataclass
+from enum import StrEnum
+from pathlib import Path
+
+from heliostat.fetch import cache_dir
+
+
+class Category(StrEnum):
+    REPOS = "repos"
+    INDEXES = "indexes"
+    CATALOG = "catalog"
+    CHARMS = "charms"
+    LOGS = "logs"
+
+
+CATEGORIES = {
+    Category.REPOS: "Clones of git repos and their per-branch worktrees",
+    Category.INDEXES: "Downloaded and parsed package indexes",
+    Category.CATALOG: "Parsed rockcraft.yaml files, by repo commit",
+    Category.CHARMS: "Channels and resources of charms on Charmhub",
+    Category.LOGS: "Output of rock builds",
+}
+
+CAP_ENV_PREFIX = "HELIOSTAT_CACHE_MAX_"
+
+_UNITS = {"": 1, "K": 1 << 10, "M": 1 << 20, "G": 1 << 30, "T": 1 << 40}
+
+
+def parse_size(value: str) -> int:
+    """Parse a size like ``512M``, ``2G`` or ``1.5GiB`` into bytes."""
+    match = re.fullmatch(
+        r"\s*(\d+(?:\.\d+)?)\s*([KMGT]?)(?:i?B)?\s*", value, re.IGNORECASE
+    )
+    if match is None:
+        raise ValueError(f"Invalid size '{value}'")
+    number, unit = match.groups()
+    return int(float(number) * _UNITS[unit.upper()])
+
+
+def format_size(size: float) -> str:
+    if size < 1024:
+        return f"{size:.0f} B"
+    for unit in ("KiB", "MiB", "GiB"):
+        size /= 1024
+        if size < 1024:
+            return f"{size:.1f} {unit}"
+    return f"{size / 1024:.1f} TiB"
+
+
+def cap(category: Category) -> int | None:
+    """The configured size cap of a category, if any."""
+    value = os.environ.get(f"{CAP_ENV_PREFIX}{category.upper()}")
+    return parse_size(value) if value else None
+
+
+def caps_configured() -> bool:
+    return any(key.startswith(CAP_ENV_PREFIX) for key in os.environ)
+
+
+def _disk_usage(path: Path) -> tuple[int, float]:
+    """The total size of the files under ``path`` and the newest mtime of
+    the top level entry."""
+    stat = path.lstat()
+    if not path.is_dir() or path.is_symlink():
+        return stat.st_size, stat.st_mtime
+
+    size = 0
+    stack = [path]
+    while stack:
+        with os.scandir(stack.pop()) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(Path(entry.path))
+                else:
+                    size += entry.stat(follow_symlinks=False).st_size
+    return size, stat.st_mtime
+
+
+@dataclass
+class CacheEntry:
+    category: Category
+    name: str
+    paths: list[Path]
+    size: int
+    last_used: float
+    # A clone whose worktrees are removed along with it
+    worktrees: Path | None = None
+
+    def remove(self):
+        for path in self.paths:
+            if path.is_dir() and not path.is_symlink():
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                path.unlink(missing_ok=True)
+        if self.worktrees is not None:
+            shutil.rmtree(self.worktrees, ignore_errors=True)
+        elif self.category == Category.REPOS:
+            # Let the clone forget about the removed worktree
+            clone = cache_dir() / self.paths[0].parent.name
+            subprocess.run(
+                ["git", "worktree", "prune"],
+                cwd=clone,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+            )
+
+
+def _entry(
+    category: Category, name: str, *paths: Path, **kwargs
+) -> CacheEntry:
+    size, last_used = 0, 0.0
+    for path in paths:
+        path_size, mtime = _disk_usage(path)
+        size += path_size
+        last_used = max(last_used, mtime)
+    return CacheEntry(category, name, list(paths), size, last_used, **kwargs)
+
+
+def _repo_entries(root: Path) -> Iterable[CacheEntry]:
+    worktrees_root = root / "worktrees"
+    for clone in sorted(root.iterdir()):
+        if not (clone / ".git").is_dir():
+            continue
+        worktrees = worktrees_root / clone.name
+        branch_entries = []
+        if worktrees.is_dir():
+            for worktree in sorted(worktrees.iterdir()):
+                branch_entries.append(
+                    _entry(
+                        Category.REPOS,
+                        f"{clone.name}@{worktree.name}",
+                        worktree,
+                    )
+                )
+        yield from branch_entries
+        entry = _entry(Category.REPOS, clone.name, clone, worktrees=worktrees)
+        # A clone is in use as long as any of its worktrees is
+        entry.last_used = max(
+            [entry.last_used, *(e.last_used for e in branch_entries)]
+        )
+        yield entry
+
+
+def _index_entries(root: Path) -> Iterable[CacheEntry]:
+    # A download is stored as <url hash>.data, with its validators and
+    # parsed form alongside it
+    groups: dict[str, list[Path]] = {}
+    for path in sorted((root / "indexes").glob("*")):
+        groups.setdefault(path.name.split(".")[0], []).append(path)
+    for key, paths in groups.items():
+        yield _entry(Category.INDEXES, key, *paths)
+
+
+def _dir_entries(category: Category, directory: Path) -> Iterable[CacheEntry]:
+    for path in sorted(directory.glob("*")):
+        yield _entry(category, path.name, path)
+
+
+def entries(category: Category) -> list[CacheEntry]:
+    root = cache_dir()
+    if not root.exists():
+        return []
+    match category:
+        case Category.REPOS:
+            found = _repo_entries(root)
+        case Category.INDEXES:
+            found = _index_entries(root)
+        case Category.CATALOG | Category.CHARMS | Category.LOGS:
+            found = _dir_entries(category, root / category)
+    return list(found)
+
+
+@dataclass
+class CategoryStats:
+    category: Category
+    entries: int
+    size: int
+    cap: int | None
+    oldest: float | None
+
+
+def stats() -> list[CategoryStats]:
+    result = []
+    for category in CATEGORIES:
+        found = entries(category)
+        result.append(
+            CategoryStats(
+                category,
+                len(found),
+                sum(e.size for e in found),
+                cap(category),
+                min((e.last_used for e in found), default=None),
+            )
+        )
+    return result
+
+
+def gc(
+    caps: Mapping[Category, int] | None = None, dry_run: bool = False
+) -> list[CacheEntry]:
+    """Evict the least recently used entries of every category which is
+    over its cap. Returns the evicted entries."""
+    evicted = []
+    for category in CATEGORIES:
+        limit = caps.get(category) if caps is not None else None
+        if limit is None:
+            limit = cap(category)
+        if limit is None:
+            continue
+        found = sorted(entries(category), key=lambda e: e.last_used)
+        total = sum(e.size for e in found)
+        for entry in found:
+            if total <= limit:
+                break
+            total -= entry.size
+            evicted.append(entry)
+            if not dry_run:
+                entry.remove()
+    return evicted
+
+
+def prune(
+    categories: Iterable[Category],
+    older_than: float | None = None,
+    dry_run: bool = False,
+) -> list[CacheEntry]:
+    """Remove the entries of ``categories`` which have not been used for
+    ``older_than`` seconds, or all of them. Returns the removed entries."""
+    cutoff = time.time() - older_than if older_than is not None else None
+    removed = []
+    for category in categories:
+        for entry in entries(category):
+            if cutoff is not None and entry.last_used >= cutoff:
+                continue
+            removed.append(entry)
+            if not dry_run:
+                entry.remove()
+    return removed
@@ -0,0 +1,46 @@
+"""
+A parsed summary of every rock at a commit of ubuntu-openstack-rocks.
+
+Resolving source packages to rocks needs the overlay packages of every rock,
+which means parsing every rockcraft.yaml. The result only depends on the
+commit, so it is kept on disk and shared by all later runs. Catalogs written
+by older versions of heliostat fail to decode and are rebuilt.
+"""
+
+from __future__ import annotations
+
+from collections.abc import Iterable
+from pathlib import Path
+from typing import Any
+
+import msgspec
+
+from heliostat.fetch import cache_dir, mark_used, write_atomic
+
+
+class RockRecord(msgspec.Struct, array_like=True):
+    name: str
+    family: str
+    base: str | None
+    version: str | None
+    # As written in the rockcraft.yaml
+    repositories: list[dict[str, Any]]
+    deps: list[str]
+
+
+def catalog_path(commit: str) -> Path:
+    return cache_dir() / "catalog" / f"{commit}.json"
+
+
+def load_catalog(commit: str) -> dict[str, RockRecord] | None:
+    path = catalog_path(commit)
+    try:
+        records = msgspec.json.decode(path.read_bytes(), type=list[RockRecord])
+    except (FileNotFoundError, msgspec.DecodeError):
+        return None
+    mark_used(path)
+    return {record.name: record for record in records}
+
+
+def save_catalog(commit: str, records: Iterable[RockRecord]):
+    write_atomic(catalog_path(commit), msgspec.json.encode(list(records)))
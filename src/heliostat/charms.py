@@ -0,0 +1,159 @@
+"""
+Channels and resources of the sunbeam charms, as published on Charmhub.
+
+One lookup returns every channel of a charm, so the metadata is kept on disk
+under ``cache_dir()/charms`` and shared by the manifests of every release.
+"""
+
+from __future__ import annotations
+
+import os
+import time
+import warnings
+from collections.abc import Iterable
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import msgspec
+
+from heliostat import fetch
+from heliostat.trace import span
+
+CHARMHUB_URL = os.environ.get(
+    "HELIOSTAT_CHARMHUB_URL", "https://api.charmhub.io"
+).rstrip("/")
+
+# How long the channels of a charm may be reused before asking Charmhub
+# again, in seconds. Tracks and their resources rarely change.
+CHARM_INFO_MAX_AGE = 24 * 60 * 60.0
+
+# The charms of a sunbeam control plane which follow the OpenStack release
+SUNBEAM_CHARMS = (
+    "aodh-k8s",
+    "barbican-k8s",
+    "ceilometer-k8s",
+    "cinder-ceph-k8s",
+    "cinder-k8s",
+    "designate-k8s",
+    "glance-k8s",
+    "gnocchi-k8s",
+    "heat-k8s",
+    "horizon-k8s",
+    "keystone-k8s",
+    "magnum-k8s",
+    "masakari-k8s",
+    "neutron-k8s",
+    "nova-k8s",
+    "octavia-k8s",
+    "placement-k8s",
+    "watcher-k8s",
+)
+
+
+class CharmInfo(msgspec.Struct):
+    name: str
+    # The oci-image resources of the charm in each channel, e.g.
+    # "2024.1/stable" -> ["cinder-api-image", "cinder-scheduler-image"]
+    channels: dict[str, list[str]]
+    fetched: float = msgspec.field(default_factory=time.time)
+
+
+class _Channel(msgspec.Struct):
+    name: str
+
+
+class _Resource(msgspec.Struct):
+    name: str
+    type: str
+
+
+class _ChannelMapEntry(msgspec.Struct):
+    channel: _Channel
+    resources: list[_Resource] = []
+
+
+class _InfoResponse(msgspec.Struct):
+    name: str
+    channel_map: list[_ChannelMapEntry] = msgspec.field(name="channel-map")
+
+
+def charm_info_path(name: str) -> Path:
+    return fetch.cache_dir() / "charms" / f"{name}.json"
+
+
+def _load_cached(path: Path, max_age: float | None) -> CharmInfo | None:
+    try:
+        info = msgspec.json.decode(path.read_bytes(), type=CharmInfo)
+    except (FileNotFoundError, msgspec.DecodeError):
+        return None
+    # Not the mtime, which records when the entry was last used
+    if max_age is not None and time.time() - info.fetched > max_age:
+        return None
+    return info
+
+
+def _fetch_info(name: str) -> CharmInfo:
+    # requests is slow to import, so only pay for it when actually fetching
+    import requests
+
+    with span("charmhub info", charm=name):
+        response = requests.get(
+            f"{CHARMHUB_URL}/v2/charms/info/{name}",
+            params={
+                "fields": "channel-map.channel.name,"
+                "channel-map.resources.name,channel-map.resources.type"
+            },
+        )
+        response.raise_for_status()
+    data = msgspec.json.decode(response.content, type=_InfoResponse)
+    channels: dict[str, list[str]] = {}
+    for entry in data.channel_map:
+        resources = channels.setdefault(entry.channel.name, [])
+        resources.extend(
+            r.name
+            for r in entry.resources
+            if r.type == "oci-image" and r.name not in resources
+        )
+    return CharmInfo(data.name, channels)
+
+
+def charm_info(name: str) -> CharmInfo:
+    """The channels and resources of a charm, from the cache if it is fresh.
+
+    When offline, or when Charmhub cannot be reached, whatever is cached is
+    used however old it is.
+    """
+    path = charm_info_path(name)
+    info = _load_cached(path, CHARM_INFO_MAX_AGE)
+    if info is not None:
+        fetch.mark_used(path)
+        return info
+
+    if fetch.OFFLINE:
+        info = _load_cached(path, None)
+        if info is None:
+            raise RuntimeError(
+                f"{name} has not been looked up and heliostat is offline"
+            )
+        return info
+
+    import requests
+
+    try:
+        info = _fetch_info(name)
+    except requests.ConnectionError as e:
+        info = _load_cached(path, None)
+        if info is None:
+            raise
+        warnings.warn(f"Using cached {name}: {e}", fetch.StaleCacheWarning)
+        return info
+    fetch.write_atomic(path, msgspec.json.encode(info))
+    return info
+
+
+def charm_infos(names: Iterable[str], jobs: int = 8) -> dict[str, CharmInfo]:
+    """Look up many charms at once, asking Charmhub only for those which are
+    not cached."""
+    names = list(dict.fromkeys(names))
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        return dict(zip(names, pool.map(charm_info, names)))
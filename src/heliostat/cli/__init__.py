@@ -1,16 +1,301 @@
+import importlib
+import time
+from collections.abc import Generator
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Annotated
+
 import typer
+from typer.core import TyperGroup
+
+from heliostat import metrics, trace
+from heliostat.client import socket_path
+from heliostat.types import Release, Series
+
+
+class LazyGroup(TyperGroup):
+    """A group which only imports a subcommand's module when it is run.
+
+    Listing the subcommands, e.g. for ``--help`` or shell completion, uses
+    placeholders carrying just the help text, so none of the subcommand
+    modules or their dependencies are imported.
+    """
+
+    # name -> (module, attribute, help)
+    LAZY_COMMANDS = {
+        "rock": (
+            "heliostat.cli.rock",
+            "rock_app",
+            "Inspect, patch and build sunbeam rocks.",
+        ),
+        "package": (
+            "heliostat.cli.package",
+            "package_app",
+            "Resolve source packages to binary packages and rocks.",
+        ),
+        "charm": (
+            "heliostat.cli.charm",
+            "charm_app",
+            "Make rocks available to the deployed sunbeam charms.",
+        ),
+        "manifest": (
+            "heliostat.cli.manifest",
+            "manifest_app",
+            "Generate sunbeam manifests for a release.",
+        ),
+        "cache": (
+            "heliostat.cli.cache",
+            "cache_app",
+            "Inspect and clean up heliostat's cache.",
+        ),
+    }
+
+    _resolving = False
+
+    def list_commands(self, ctx):
+        eager = super().list_commands(ctx)
+        return [
+            *self.LAZY_COMMANDS,
+            *(n for n in eager if n not in self.LAZY_COMMANDS),
+        ]
+
+    def get_command(self, ctx, cmd_name):
+        if cmd_name not in self.LAZY_COMMANDS or cmd_name in self.commands:
+            return super().get_command(ctx, cmd_name)
 
-from . import charm, package, rock
+        module, attribute, help_text = self.LAZY_COMMANDS[cmd_name]
+        if not self._resolving:
+            return TyperGroup(name=cmd_name, help=help_text)
 
-main = typer.Typer()
-main.add_typer(rock.rock_app, name="rock")
-main.add_typer(package.package_app, name="package")
-main.add_typer(charm.charm_app, name="charm")
+        app = getattr(importlib.import_module(module), attribute)
+        command = typer.main.get_command(app)
+        command.help = command.help or help_text
+        self.commands[cmd_name] = command
+        return command
+
+    def resolve_command(self, ctx, args):
+        self._resolving = True
+        try:
+            return super().resolve_command(ctx, args)
+        finally:
+            self._resolving = False
+
+
+main = typer.Typer(cls=LazyGroup)
 
 
 @main.callback(no_args_is_help=True)
-def _setup():
-    pass
+def _setup(
+    ctx: typer.Context,
+    trace_file: Annotated[
+        Path | None,
+        typer.Option(
+            "--trace",
+            help="Write a Chrome trace-event JSON file of where the time "
+            "went and print a summary when the command finishes",
+        ),
+    ] = None,
+    metrics_file: Annotated[
+        Path | None,
+        typer.Option(
+            "--metrics",
+            help="Write Prometheus metrics for this run to a file for the "
+            "node_exporter textfile collector",
+        ),
+    ] = None,
+    offline: Annotated[
+        bool,
+        typer.Option(
+            "--offline",
+            help="Only use cached repos and package indexes, e.g. from "
+            "`heliostat prefetch` (Default: $HELIOSTAT_OFFLINE)",
+        ),
+    ] = False,
+):
+    if offline:
+        from heliostat import fetch
+
+        fetch.OFFLINE = True
+    from heliostat import cache
+
+    ctx.with_resource(_stale_cache_warnings())
+    if cache.caps_configured():
+        # Keep the cache within its caps without anyone running `cache gc`
+        ctx.call_on_close(cache.gc)
+    if metrics_file is not None:
+        metrics.enable()
+        start = time.monotonic()
+        ctx.call_on_close(
+            lambda: _finish_metrics(
+                metrics_file, ctx.invoked_subcommand, start
+            )
+        )
+    if trace_file is not None:
+        trace.enable()
+        ctx.call_on_close(lambda: trace.finish(trace_file))
+        ctx.with_resource(trace.span(f"heliostat {ctx.invoked_subcommand}"))
+
+
+@contextmanager
+def _stale_cache_warnings() -> Generator[None]:
+    """Print each fallback to a cached copy as a plain message once the
+    command is done."""
+    import warnings
+
+    from heliostat.fetch import StaleCacheWarning
+
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter("always", StaleCacheWarning)
+        yield
+    for warning in caught:
+        if issubclass(warning.category, StaleCacheWarning):
+            typer.echo(str(warning.message), err=True)
+        else:
+            warnings.showwarning(
+                warning.message,
+                warning.category,
+                warning.filename,
+                warning.lineno,
+                warning.file,
+                warning.line,
+            )
+
+
+def _finish_metrics(path: Path, command: str | None, start: float):
+    metrics.set_value(
+        "heliostat_run_duration_seconds",
+        time.monotonic() - start,
+        command=command,
+    )
+    metrics.set_value(
+        "heliostat_run_timestamp_seconds", time.time(), command=command
+    )
+    metrics.finish(path)
+
+
+def _validate_ppas(ppas: list[str] | None) -> list[str]:
+    from heliostat.cli.rock import validate_ppa
+
+    return [ppa for ppa in map(validate_ppa, ppas or []) if ppa is not None]
+
+
+@main.command()
+def prefetch(
+    releases: Annotated[
+        list[Release] | None,
+        typer.Option(
+            "--release",
+            help="Release to prefetch, may be repeated (Default: epoxy)",
+        ),
+    ] = None,
+    series: Annotated[
+        list[Series] | None,
+        typer.Option(
+            "--series",
+            help="Series to prefetch, may be repeated (Default: noble)",
+        ),
+    ] = None,
+    ppas: Annotated[
+        list[str] | None,
+        typer.Option(
+            "--ppa",
+            callback=_validate_ppas,
+            help="PPA whose packages to prefetch for incremental builds, "
+            "may be repeated",
+        ),
+    ] = None,
+    jobs: Annotated[
+        int,
+        typer.Option(
+            "-j", "--jobs", min=1, help="Number of downloads to run at once"
+        ),
+    ] = 8,
+):
+    """Fill the caches for a matrix of releases and series.
+
+    Clones the rocks repo and checks out the branch of every release, parses
+    the rocks, downloads and parses the package indexes, including those of
+    any PPAs, and looks up the channels of the sunbeam charms, so that later
+    commands can run with --offline.
+    """
+    from heliostat.prefetch import prefetch as run_prefetch
+
+    failed = False
+    for result in run_prefetch(
+        releases or [Release.default()],
+        series or [Series.default()],
+        ppas or [],
+        jobs=jobs,
+    ):
+        if result.error is None:
+            typer.echo(f"{result.task}: {result.summary}")
+        else:
+            failed = True
+            typer.echo(f"{result.task}: failed: {result.error}", err=True)
+    if failed:
+        raise typer.Exit(1)
+
+
+@main.command()
+def serve(
+    socket: Annotated[
+        Path | None,
+        typer.Option(
+            help="Unix socket to listen on "
+            "(Default: $HELIOSTAT_SOCKET or $XDG_RUNTIME_DIR/heliostat.sock)",
+        ),
+    ] = None,
+    refresh: Annotated[
+        float,
+        typer.Option(
+            help="Seconds to reuse fetched repos and package indexes before "
+            "refreshing them",
+        ),
+    ] = 300.0,
+):
+    """Keep repos, rocks and package indexes warm for heliostat-client."""
+    from heliostat.daemon import serve as run_server
+
+    path = socket or socket_path()
+    typer.echo(f"Listening on {path}")
+    try:
+        run_server(path, refresh_interval=refresh)
+    except KeyboardInterrupt:
+        pass
+
+
+@main.command(name="build-queue")
+def build_queue(
+    socket: Annotated[
+        Path | None,
+        typer.Option(
+            help="Unix socket to listen on (Default: $HELIOSTAT_BUILD_QUEUE, "
+            "otherwise heliostat-build-queue.sock in $XDG_RUNTIME_DIR or "
+            "/run/heliostat/build-queue.sock)",
+        ),
+    ] = None,
+    jobs: Annotated[
+        int,
+        typer.Option(
+            "-j", "--jobs", min=1, help="Number of rocks to build at once"
+        ),
+    ] = 2,
+):
+    """Build rocks for everyone on this host, merging identical builds.
+
+    `rock build --builder queue` sends builds here. Builds of identical
+    rockcraft.yaml and workaround files requested while one of them is
+    running are built once, and the rocks are sent to every client.
+    """
+    from heliostat.buildqueue import serve as run_queue
+    from heliostat.executors import build_queue_path
+
+    path = socket or build_queue_path()
+    typer.echo(f"Listening on {path}")
+    try:
+        run_queue(path, jobs=jobs)
+    except KeyboardInterrupt:
+        pass
 
 
 if __name__ == "__main__":
@@ -0,0 +1,108 @@
+from datetime import datetime
+from typing import Annotated
+
+import typer
+
+from heliostat import cache
+from heliostat.cache import Category
+
+cache_app = typer.Typer()
+
+CategoriesArgument = Annotated[
+    list[Category] | None,
+    typer.Argument(help="Categories to clean up (Default: all)"),
+]
+
+
+def _print_removed(entries: list[cache.CacheEntry], verb: str):
+    for entry in entries:
+        typer.echo(
+            f"{verb} {entry.category}/{entry.name} "
+            f"({cache.format_size(entry.size)})"
+        )
+    total = sum(entry.size for entry in entries)
+    typer.echo(
+        f"{verb} {len(entries)} entries, {cache.format_size(total)} in total"
+    )
+
+
+def _parse_caps(values: list[str]) -> dict[Category, int]:
+    caps = {}
+    for value in values:
+        category, sep, size = value.partition("=")
+        try:
+            if not sep:
+                raise ValueError(f"Expected CATEGORY=SIZE, got '{value}'")
+            caps[Category(category)] = cache.parse_size(size)
+        except ValueError as e:
+            raise typer.BadParameter(str(e), param_hint="--max-size")
+    return caps
+
+
+@cache_app.command()
+def stats():
+    """Show how much space each category of the cache uses."""
+    from rich.console import Console
+    from rich.table import Table
+
+    table = Table(title=f"heliostat cache ({cache.cache_dir()})")
+    table.add_column("Category")
+    table.add_column("Entries", justify="right")
+    table.add_column("Size", justify="right")
+    table.add_column("Cap", justify="right")
+    table.add_column("Least recently used")
+    for row in cache.stats():
+        table.add_row(
+            row.category,
+            str(row.entries),
+            cache.format_size(row.size),
+            cache.format_size(row.cap) if row.cap is not None else "-",
+            (
+                f"{datetime.fromtimestamp(row.oldest):%Y-%m-%d %H:%M}"
+                if row.oldest is not None
+                else "-"
+            ),
+        )
+    Console().print(table)
+
+
+@cache_app.command()
+def prune(
+    categories: CategoriesArgument = None,
+    older_than: Annotated[
+        float,
+        typer.Option(help="Remove entries not used for this many days"),
+    ] = 30.0,
+    all_entries: Annotated[
+        bool,
+        typer.Option("--all", help="Remove every entry, however recent"),
+    ] = False,
+    dry_run: Annotated[
+        bool, typer.Option(help="Only list what would be removed")
+    ] = False,
+):
+    """Remove cache entries which have not been used recently."""
+    removed = cache.prune(
+        categories or list(Category),
+        older_than=None if all_entries else older_than * 86400,
+        dry_run=dry_run,
+    )
+    _print_removed(removed, "Would remove" if dry_run else "Removed")
+
+
+@cache_app.command()
+def gc(
+    max_size: Annotated[
+        list[str] | None,
+        typer.Option(
+            help="Cap a category, e.g. repos=5G, may be repeated "
+            f"(Default: ${cache.CAP_ENV_PREFIX}<CATEGORY>)",
+        ),
+    ] = None,
+    dry_run: Annotated[
+        bool, typer.Option(help="Only list what would be evicted")
+    ] = False,
+):
+    """Evict the least recently used entries of categories over their cap."""
+    evicted = cache.gc(_parse_caps(max_size or []), dry_run=dry_run)
+    _print_removed(evicted, "Would evict" if dry_run else "Evicted")
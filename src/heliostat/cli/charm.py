@@ -1,16 +1,83 @@
 from pathlib import Path
+from typing import Annotated
 
 import typer
 
+from heliostat.resources import registry
 from heliostat.resources.juju import attach_rock
 
 charm_app = typer.Typer()
 
+RegistryOption = Annotated[
+    str | None,
+    typer.Option(
+        "--registry",
+        help="Push the rock to this OCI registry (host:port) instead of "
+        "importing it into the local containerd with ctr",
+    ),
+]
+
+InsecureOption = Annotated[
+    bool,
+    typer.Option(
+        "--insecure",
+        help="Talk to the registry over plain http, e.g. to the local one "
+        "started by `heliostat charm registry`",
+    ),
+]
+
 
 @charm_app.command()
 def attach(
     charm: str,
     rock: Path,
     resource_name: str,
+    registry_host: RegistryOption = None,
+    insecure: InsecureOption = False,
 ):
-    attach_rock(charm, rock, resource_name)
+    attach_rock(
+        charm,
+        rock,
+        resource_name,
+        registry_host=registry_host,
+        insecure=insecure,
+    )
+
+
+@charm_app.command()
+def push(
+    rock: Path,
+    registry_host: Annotated[
+        str,
+        typer.Option("--registry", help="OCI registry to push to (host:port)"),
+    ] = registry.DEFAULT_REGISTRY,
+    insecure: InsecureOption = False,
+):
+    """Push a rock to an OCI registry, uploading only missing blobs."""
+    rock_name = rock.name.split("_")[0]
+    stats = registry.push_rock(
+        rock, rock_name, registry_host, insecure=insecure
+    )
+    typer.echo(registry.image_name(rock_name, registry_host))
+    typer.echo(
+        f"Uploaded {stats.uploaded} blobs ({stats.uploaded_bytes} bytes), "
+        f"mounted {stats.mounted}, already present {stats.existing}"
+    )
+
+
+@charm_app.command(name="registry")
+def registry_cmd(
+    port: Annotated[
+        int, typer.Option(help="Host port to publish the registry on")
+    ] = 5000,
+):
+    """Start a local OCI registry container for charms to pull rocks from.
+
+    The registry serves plain http, so push to it with --insecure.
+    """
+    try:
+        host = registry.start_registry(port)
+    except RuntimeError as e:
+        typer.echo(str(e))
+        raise typer.Exit(code=1)
+    typer.echo(host)
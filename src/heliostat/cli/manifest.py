@@ -0,0 +1,116 @@
+from pathlib import Path
+from typing import Annotated
+
+import typer
+
+from heliostat.charms import SUNBEAM_CHARMS
+from heliostat.types import Release
+
+manifest_app = typer.Typer()
+
+
+def _built_rocks(rocks_dir: Path, release: Release) -> list[Path]:
+    """The rocks built for ``release`` into ``rocks_dir``, or every rock in
+    it when heliostat has no record of the builds."""
+    from heliostat.artifacts import load_records
+
+    records = load_records(rocks_dir)
+    if not records:
+        return sorted(rocks_dir.glob("*.rock"))
+    return [
+        rocks_dir / artifact
+        for record in records
+        if record.release == release
+        for artifact in record.artifacts
+        if artifact.endswith(".rock")
+    ]
+
+
+@manifest_app.command()
+def generate(
+    release: Annotated[Release, typer.Option()] = Release.default(),
+    risk: Annotated[
+        str,
+        typer.Option(
+            help="Risk of the charm channels. Charms not released at this "
+            "risk use the next less stable one.",
+        ),
+    ] = "stable",
+    charms: Annotated[
+        list[str] | None,
+        typer.Option(
+            "--charm",
+            help="Charm to pin, may be repeated (Default: the sunbeam "
+            "control plane charms)",
+        ),
+    ] = None,
+    rocks_dir: Annotated[
+        Path | None,
+        typer.Option(
+            "--rocks-dir",
+            file_okay=False,
+            exists=True,
+            help="Output directory of `rock build`, whose rocks are matched "
+            "to the charms that take them",
+        ),
+    ] = None,
+    output: Annotated[
+        Path | None,
+        typer.Option(
+            "-o",
+            "--output",
+            help="Write the manifest to this file (Default: stdout)",
+        ),
+    ] = None,
+):
+    """Generate a sunbeam manifest pinning the charms to a release.
+
+    The channels of each charm are looked up on Charmhub once and cached, so
+    generating the manifests of many releases needs no further lookups. The
+    `heliostat charm attach` commands for the built rocks are printed to
+    stderr.
+    """
+    from heliostat.manifest import RISKS
+    from heliostat.manifest import generate as generate_manifest
+
+    if risk not in RISKS:
+        raise typer.BadParameter(
+            f"Expected one of {', '.join(RISKS)}", param_hint="--risk"
+        )
+
+    rocks = _built_rocks(rocks_dir, release) if rocks_dir else []
+    try:
+        manifest = generate_manifest(
+            release, risk=risk, charms=charms or SUNBEAM_CHARMS, rocks=rocks
+        )
+    except (OSError, RuntimeError) as e:
+        typer.echo(f"Failed to look up the charms: {e}", err=True)
+        raise typer.Exit(1)
+
+    for warning in manifest.warnings:
+        typer.echo(warning, err=True)
+    for attachment in manifest.attachments:
+        typer.echo(
+            f"heliostat charm attach {attachment.application} "
+            f"{attachment.rock} "
+            f"{attachment.resource}",
+            err=True,
+        )
+
+    from ruamel.yaml import YAML
+
+    yaml = YAML()
+    if output is None:
+        from io import StringIO
+
+        with StringIO() as f:
+            yaml.dump(manifest.to_yaml(), f)
+            typer.echo(f.getvalue(), nl=False)
+    else:
+        with output.open("w") as f:
+            yaml.dump(manifest.to_yaml(), f)
+
+
+@manifest_app.callback(no_args_is_help=True)
+def _setup():
+    pass
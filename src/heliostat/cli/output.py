@@ -0,0 +1,17 @@
+from collections.abc import Iterable
+
+import msgspec
+import typer
+
+from heliostat.types import OutputFormat
+
+
+def echo_json(items: Iterable[object], format: OutputFormat):
+    """Print ``items`` as one JSON array, or as one JSON document per line
+    as they come."""
+    if format == OutputFormat.JSONL:
+        encoder = msgspec.json.Encoder()
+        for item in items:
+            typer.echo(encoder.encode(item).decode())
+    else:
+        typer.echo(msgspec.json.encode(list(items)).decode())
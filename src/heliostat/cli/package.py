@@ -1,33 +1,112 @@
+from typing import Annotated
+
+import msgspec
 import typer
 
-from heliostat.component import package_list
+from heliostat.component import SourcePackage, Target, resolve
 from heliostat.rocks import SunbeamRockRepo
-from heliostat.types import Release, Series
+from heliostat.types import OutputFormat, Release, Series
 
 package_app = typer.Typer()
 
 
+class SourceInfo(msgspec.Struct):
+    source: str
+    series: Series
+    release: Release
+    version: str | None
+    binaries: list[str]
+
+
 @package_app.command()
 def show(
-    source: str,
-    series: Series = Series.default(),
-    release: Release = Release.default(),
+    sources: list[str],
+    series: Annotated[
+        list[Series] | None,
+        typer.Option(help="Series to look in, may be repeated"),
+    ] = None,
+    release: Annotated[
+        list[Release] | None,
+        typer.Option(help="Release to look in, may be repeated"),
+    ] = None,
+    format: Annotated[
+        OutputFormat,
+        typer.Option(
+            help="Print the binaries as text, or the version and binaries "
+            "of each source as a JSON array or JSON lines",
+        ),
+    ] = OutputFormat.TEXT,
 ):
-    """List all binary packages built from this source package."""
-    for binpkg in package_list([source], series=series, release=release):
-        typer.echo(binpkg)
+    """List all binary packages built from these source packages."""
+    targets = [
+        Target(s, r)
+        for r in release or [Release.default()]
+        for s in series or [Series.default()]
+    ]
+    resolved = resolve(sources, targets)
+
+    if format != OutputFormat.TEXT:
+        from heliostat.cli.output import echo_json
+
+        empty = SourcePackage(None, [])
+        echo_json(
+            (
+                SourceInfo(
+                    source,
+                    target.series,
+                    target.release,
+                    found.get(source, empty).version,
+                    found.get(source, empty).binaries,
+                )
+                for target, found in resolved.items()
+                for source in sources
+            ),
+            format,
+        )
+        return
+
+    for target, found in resolved.items():
+        if len(targets) > 1:
+            typer.echo(f"# {target.release}/{target.series}")
+        for package in found.values():
+            for binpkg in package.binaries:
+                typer.echo(binpkg)
 
 
 @package_app.command()
 def rocks(
     sources: list[str],
-    series: Series = Series.default(),
-    release: Release = Release.default(),
+    series: Annotated[
+        list[Series] | None,
+        typer.Option(help="Series to look in, may be repeated"),
+    ] = None,
+    release: Annotated[
+        list[Release] | None,
+        typer.Option(help="Release to look in, may be repeated"),
+    ] = None,
     consolidated: bool = False,
 ):
-    """List all rocks built from this source package."""
-    repo = SunbeamRockRepo.ensure(release=release)
-    for rock in repo.rocks_for_packages(
-        *sources, series=series, release=release, consolidated=consolidated
-    ):
-        typer.echo(rock.name)
+    """List all rocks built from these source packages.
+
+    With several releases or series, every package index is read once and
+    the rocks are listed under a header for each release and series.
+    """
+    targets = [
+        Target(s, r)
+        for r in release or [Release.default()]
+        for s in series or [Series.default()]
+    ]
+    resolved = resolve(sources, targets)
+    repos: dict[Release, SunbeamRockRepo] = {}
+    for r in dict.fromkeys(target.release for target in targets):
+        # Fetching updates the branches of every release, so fetch once
+        repos[r] = SunbeamRockRepo.ensure(release=r, fetch=not repos)
+    for target, found in resolved.items():
+        if len(targets) > 1:
+            typer.echo(f"# {target.release}/{target.series}")
+        repo = repos[target.release]
+        binpkgs = {b for package in found.values() for b in package.binaries}
+        for rock in repo.rocks_for_binaries(
+            binpkgs, consolidated=consolidated
+        ):
+            typer.echo(rock.name)
@@ -1,25 +1,57 @@
+import contextlib
+import functools
 import itertools
+import os
 import re
 import shutil
-import subprocess
+import sys
+import time
+from collections.abc import Iterable
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from datetime import datetime, timedelta
 from io import StringIO
 from pathlib import Path
 from tempfile import TemporaryDirectory
 from typing import Annotated
 
 import typer
-from ruamel.yaml import YAML
 
+from heliostat import metrics
+from heliostat.artifacts import (
+    ArtifactRecord,
+    fingerprint,
+    load_record,
+    load_records,
+    save_record,
+)
+from heliostat.executors import (
+    BuildError,
+    Executor,
+    HostPool,
+    LocalExecutor,
+    QueueExecutor,
+)
+from heliostat.history import (
+    BuildHistory,
+    ScheduledBuild,
+    makespan,
+    schedule,
+)
 from heliostat.rocks import (
     AddPpa,
     RockcraftFile,
+    RockInfo,
     SetBase,
     SetUcaRelease,
     SetVersionString,
+    SunbeamRock,
     SunbeamRockRepo,
 )
-from heliostat.types import Release, Series
-from heliostat.workarounds import Workaround, get_workarounds
+from heliostat.supervisor import BuildLog, StatusBoard, capture
+from heliostat.trace import span, traced
+from heliostat.types import OutputFormat, Release, Series
+from heliostat.workarounds import SlimRock, Workaround, get_workarounds
 
 rock_app = typer.Typer()
 
@@ -60,17 +92,54 @@ def list_cmd(release: Annotated[Release, typer.Option()] = Release.default()):
 
 @rock_app.command()
 def show(
-    rock_name: str,
+    rock_names: Annotated[list[str] | None, typer.Argument()] = None,
     release: Annotated[Release, typer.Option()] = Release.default(),
+    all_rocks: Annotated[
+        bool, typer.Option("--all", help="Show every rock")
+    ] = False,
+    consolidated: Annotated[
+        bool,
+        typer.Option(
+            help="With --all, only show the consolidated rock of families "
+            "which have one",
+        ),
+    ] = False,
+    format: Annotated[
+        OutputFormat,
+        typer.Option(
+            help="Print the repositories, dependencies, base, version and "
+            "family of each rock as text, a JSON array or JSON lines",
+        ),
+    ] = OutputFormat.TEXT,
 ):
-    rock = _get_rock(rock_name, release=release)
-    typer.echo(f"Rock: {rock.name}")
-    typer.echo("Repositories:")
-    for pkg_repo in rock.rockcraft_yaml().repositories():
-        typer.echo(pkg_repo)
-    typer.echo("Dependencies:")
-    for dep in rock.rockcraft_yaml().deps():
-        typer.echo(dep)
+    """Show the package repositories and dependencies of rocks."""
+    if not rock_names and not all_rocks:
+        raise typer.BadParameter("Give the name of a rock or --all")
+
+    repo = SunbeamRockRepo.ensure(release=release)
+    if all_rocks:
+        rocks = list(repo.rocks(consolidated=consolidated))
+    else:
+        rocks = [_get_rock(name, repo=repo) for name in rock_names or []]
+
+    if format != OutputFormat.TEXT:
+        from heliostat.cli.output import echo_json
+
+        catalog = repo.catalog()
+        echo_json(
+            (RockInfo.from_record(catalog[rock.name]) for rock in rocks),
+            format,
+        )
+        return
+
+    for rock in rocks:
+        typer.echo(f"Rock: {rock.name}")
+        typer.echo("Repositories:")
+        for pkg_repo in rock.rockcraft_yaml().repositories():
+            typer.echo(pkg_repo)
+        typer.echo("Dependencies:")
+        for dep in rock.rockcraft_yaml().deps():
+            typer.echo(dep)
 
 
 @rock_app.command()
@@ -106,6 +175,13 @@ def patch(
             " between sunbeam charms and unsupported openstack versions",
         ),
     ] = True,
+    slim: Annotated[
+        bool,
+        typer.Option(
+            help="Strip docs, man pages, locales and apt lists which the rock "
+            "does not need at runtime",
+        ),
+    ] = False,
 ):
     rock = _get_rock(rock_name, release=release)
 
@@ -113,6 +189,8 @@ def patch(
         workarounds = get_workarounds(rock, release, series)
     else:
         workarounds = []
+    if slim:
+        workarounds.append(SlimRock())
     rockcraft = _get_patched(
         rock.rockcraft_yaml(),
         ppa=ppa,
@@ -122,6 +200,8 @@ def patch(
         workarounds=workarounds,
     )
 
+    from ruamel.yaml import YAML
+
     yaml = YAML()
     if output is None:
         with StringIO() as f:
@@ -185,19 +265,268 @@ def build(
             " between sunbeam charms and unsupported openstack versions",
         ),
     ] = True,
+    slim: Annotated[
+        bool,
+        typer.Option(
+            help="Strip docs, man pages, locales and apt lists which the rock "
+            "does not need at runtime",
+        ),
+    ] = False,
+    jobs: Annotated[
+        int,
+        typer.Option(
+            "-j",
+            "--jobs",
+            min=1,
+            help="Number of rocks to build in parallel. Rocks which took "
+            "longest to build in the past are started first.",
+        ),
+    ] = 1,
+    builders: Annotated[
+        list[str] | None,
+        typer.Option(
+            "--builder",
+            help="Where to run rockcraft: local, ssh://[user@]host[:port] or "
+            "queue for the shared build queue of this host, with ?jobs=N to "
+            "build N rocks on it at once. May be repeated to spread builds "
+            "over a build farm. (Default: the build queue at "
+            "$HELIOSTAT_BUILD_QUEUE if set, otherwise local, with --jobs)",
+        ),
+    ] = None,
+    incremental: Annotated[
+        bool,
+        typer.Option(
+            help="Skip rocks whose overlay packages have the same versions "
+            "in the archive, cloud archive and PPA as when they were last "
+            "built into the output directory",
+        ),
+    ] = False,
+    dry_run: Annotated[
+        bool,
+        typer.Option(
+            help="Only print the build order and the estimated finish time",
+        ),
+    ] = False,
 ):
     output_dir = output_dir or Path.cwd()
+    try:
+        if builders:
+            hosts = HostPool.from_specs(builders)
+        elif os.environ.get("HELIOSTAT_BUILD_QUEUE"):
+            hosts = HostPool([(QueueExecutor(), jobs)])
+        else:
+            hosts = HostPool([(LocalExecutor(), jobs)])
+    except ValueError as e:
+        raise typer.BadParameter(str(e), param_hint="--builder")
+    jobs = hosts.capacity
 
     repo = SunbeamRockRepo.ensure(release=release)
+    pending = _build_jobs(
+        repo.rocks(set(rocks)),
+        repo.rocks_for_packages(*sources, series=series, release=release),
+        commit=repo.commit(),
+        ppa=ppa,
+        release=release,
+        series=series,
+        suffix=suffix,
+        enable_workarounds=enable_workarounds,
+        slim=slim,
+    )
+
+    if incremental:
+        for job in list(pending.values()):
+            if _is_current(job, output_dir, release, series, ppa):
+                del pending[job.rock_name]
+
+    history = BuildHistory()
+    plan = schedule(pending.items(), history, release, series, jobs)
+
+    if dry_run:
+        _print_plan(plan, jobs)
+        return
+
+    # Show a live status of the builds on a terminal, otherwise the output
+    # of each build as it comes, labelled with its rock when interleaved
+    live = jobs > 1 and sys.stdout.isatty()
+    logs = {}
+    for scheduled in plan:
+        name = scheduled.item.rock_name
+        if live:
+            echo = None
+        elif jobs == 1:
+            echo = typer.echo
+        else:
+            echo = functools.partial(_echo_labelled, name)
+        logs[name] = BuildLog(name, echo=echo)
+
+    def run(job: BuildJob):
+        log = logs[job.rock_name]
+        with hosts.acquire() as executor:
+            log.builder = executor.name
+            _build_one(
+                job, output_dir, release, series, ppa, history, executor, log
+            )
+
+    if jobs == 1:
+        for scheduled in plan:
+            run(scheduled.item)
+        return
+
+    failed = False
+    with contextlib.ExitStack() as stack:
+        if live:
+            from rich.live import Live
+
+            board = StatusBoard(list(logs.values()))
+            stack.enter_context(
+                Live(get_renderable=board.render, refresh_per_second=4)
+            )
+        pool = stack.enter_context(ThreadPoolExecutor(max_workers=jobs))
+        futures = [pool.submit(run, scheduled.item) for scheduled in plan]
+        for future in as_completed(futures):
+            # Builds cancelled after an earlier failure never ran
+            if future.cancelled():
+                continue
+            try:
+                future.result()
+            except typer.Exit:
+                # Let running builds finish, but don't start any more
+                failed = True
+                for other in futures:
+                    other.cancel()
+    if failed:
+        raise typer.Exit(1)
+
+
+def _echo_labelled(rock_name: str, line: str):
+    typer.echo(f"{rock_name} | {line}")
 
-    for rock in itertools.chain(
+
+@rock_app.command()
+def outdated(
+    rocks: Annotated[
+        list[str],
+        typer.Option(
+            "--rock",
+            help="Name of the rock to check (Default: every rock built into "
+            "the output directory)",
+        ),
+    ] = [],
+    sources: Annotated[
+        list[str],
+        typer.Option(
+            "--source",
+            help="Check the rocks built from this source package",
+        ),
+    ] = [],
+    output_dir: Annotated[
+        Path | None,
+        typer.Option(
+            "-o",
+            "--output-dir",
+            help="Output directory of the built rocks "
+            "(Default: current working directory)",
+        ),
+    ] = None,
+    ppa: Annotated[
+        str | None,
+        typer.Option(
+            callback=validate_ppa,
+        ),
+    ] = None,
+    release: Annotated[Release, typer.Option()] = Release.default(),
+    series: Annotated[Series, typer.Option()] = Series.default(),
+    suffix: Annotated[
+        str,
+        typer.Option(
+            help="Version suffix for the rock",
+        ),
+    ] = "heliostat",
+    enable_workarounds: Annotated[
+        bool,
+        typer.Option(
+            help="Automatically apply workarounds for common incompatibilities"
+            " between sunbeam charms and unsupported openstack versions",
+        ),
+    ] = True,
+    slim: Annotated[
+        bool,
+        typer.Option(
+            help="Strip docs, man pages, locales and apt lists which the rock "
+            "does not need at runtime",
+        ),
+    ] = False,
+    quiet: Annotated[
+        bool,
+        typer.Option(
+            "-q", "--quiet", help="Only print the names of outdated rocks"
+        ),
+    ] = False,
+):
+    """List the rocks whose built artifacts no longer match their inputs.
+
+    A rock is current when the patched rockcraft.yaml, the files added by
+    workarounds and the upstream commit are the same as when it was built
+    into the output directory, with the same options as given here. Nothing
+    is built.
+    """
+    output_dir = output_dir or Path.cwd()
+    if not rocks and not sources:
+        rocks = [record.rock for record in load_records(output_dir)]
+
+    repo = SunbeamRockRepo.ensure(release=release)
+    jobs = _build_jobs(
         repo.rocks(set(rocks)),
         repo.rocks_for_packages(*sources, series=series, release=release),
-    ):
+        commit=repo.commit(),
+        ppa=ppa,
+        release=release,
+        series=series,
+        suffix=suffix,
+        enable_workarounds=enable_workarounds,
+        slim=slim,
+    )
+    for job in jobs.values():
+        reason = _outdated_reason(job, output_dir, release, series, ppa)
+        if quiet:
+            if reason is not None:
+                typer.echo(job.rock_name)
+        else:
+            typer.echo(f"{job.rock_name}: {reason or 'up to date'}")
+
+
+@dataclass
+class BuildJob:
+    rock_name: str
+    rockcraft: RockcraftFile
+    workarounds: list[Workaround]
+    # Fingerprint of the build directory and upstream commit
+    inputs: str | None = None
+    # Versions of the overlay packages, when building incrementally
+    packages: dict[str, str] | None = None
+
+
+def _build_jobs(
+    *rocks: Iterable[SunbeamRock],
+    commit: str | None,
+    ppa: str | None,
+    release: Release,
+    series: Series,
+    suffix: str,
+    enable_workarounds: bool,
+    slim: bool,
+) -> dict[str, BuildJob]:
+    """Patch each of ``rocks`` once, by name."""
+    jobs: dict[str, BuildJob] = {}
+    for rock in itertools.chain(*rocks):
+        if rock.name in jobs:
+            continue
         if enable_workarounds:
             workarounds = get_workarounds(rock, release, series)
         else:
             workarounds = []
+        if slim:
+            workarounds.append(SlimRock())
         rockcraft = _get_patched(
             rock.rockcraft_yaml(),
             ppa=ppa,
@@ -206,8 +535,236 @@ def build(
             version_suffix=suffix,
             workarounds=workarounds,
         )
+        job = jobs[rock.name] = BuildJob(rock.name, rockcraft, workarounds)
+        with TemporaryDirectory(prefix="heliostat") as build_dir:
+            _prepare_build_dir(Path(build_dir), rockcraft, workarounds)
+            job.inputs = fingerprint(Path(build_dir), commit)
+    return jobs
+
+
+def _is_current(
+    job: BuildJob,
+    output_dir: Path,
+    release: Release,
+    series: Series,
+    ppa: str | None,
+) -> bool:
+    """Whether the last build of the rock in ``output_dir`` has the same
+    package versions as would be installed now."""
+    from heliostat.component import binary_versions
+
+    labels = {"rock": job.rock_name, "release": release, "series": series}
+    try:
+        job.packages = binary_versions(
+            job.rockcraft.deps(), series=series, release=release, ppa=ppa
+        )
+    except (OSError, RuntimeError) as e:
+        typer.echo(f"{job.rock_name}: rebuilding, failed to get versions: {e}")
+        return False
+
+    record = load_record(output_dir, job.rock_name)
+    if (
+        record is None
+        or record.packages is None
+        or (record.release, record.series, record.ppa)
+        != (release, series, ppa)
+        or not record.artifacts_exist(output_dir)
+    ):
+        typer.echo(f"{job.rock_name}: rebuilding, no matching earlier build")
+        return False
+
+    if record.inputs != job.inputs:
+        typer.echo(f"{job.rock_name}: rebuilding, inputs changed")
+        return False
+
+    changed = record.changed_packages(job.packages)
+    if changed:
+        typer.echo(
+            f"{job.rock_name}: rebuilding, {', '.join(changed)} changed"
+        )
+        return False
+
+    typer.echo(f"{job.rock_name}: up to date")
+    metrics.inc(
+        "heliostat_rock_build_rocks_total", value=1, result="skipped", **labels
+    )
+    return True
+
+
+def _outdated_reason(
+    job: BuildJob,
+    output_dir: Path,
+    release: Release,
+    series: Series,
+    ppa: str | None,
+) -> str | None:
+    record = load_record(output_dir, job.rock_name)
+    if record is None:
+        return "not built"
+    if not record.artifacts_exist(output_dir):
+        return "artifacts missing"
+    if (record.release, record.series) != (release, series):
+        return f"built for {record.release}/{record.series}"
+    if record.ppa != ppa:
+        return f"built with {record.ppa or 'no PPA'}"
+    if record.inputs is None:
+        return "built without a fingerprint"
+    if record.inputs != job.inputs:
+        return "inputs changed"
+    return None
+
+
+def _format_duration(seconds: float) -> str:
+    minutes, seconds = divmod(round(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return f"{hours}h{minutes:02d}m{seconds:02d}s"
+    if minutes:
+        return f"{minutes}m{seconds:02d}s"
+    return f"{seconds}s"
+
+
+def _print_plan(plan: list[ScheduledBuild[BuildJob]], jobs: int):
+    width = max((len(b.name) for b in plan), default=4)
+    typer.echo(f"{'Rock':<{width}}  {'Estimate':>9}  {'Start':>9}")
+    for scheduled in plan:
+        estimate = _format_duration(scheduled.estimate)
+        if not scheduled.known:
+            estimate = f"~{estimate}"
+        typer.echo(
+            f"{scheduled.name:<{width}}  {estimate:>9}  "
+            f"{'+' + _format_duration(scheduled.start):>9}"
+        )
 
-        do_build(rock.name, rockcraft, output_dir, workarounds=workarounds)
+    total = makespan(plan)
+    finish = datetime.now() + timedelta(seconds=total)
+    typer.echo(
+        f"Estimated finish in {_format_duration(total)} with {jobs} "
+        f"job{'s' if jobs > 1 else ''} (at {finish:%H:%M})"
+    )
+    if any(not b.known for b in plan):
+        typer.echo(
+            "~ marks rocks without build history, assumed to take as long "
+            "as the slowest known rock"
+        )
+
+
+def _build_one(
+    job: BuildJob,
+    output_dir: Path,
+    release: Release,
+    series: Series,
+    ppa: str | None,
+    history: BuildHistory,
+    executor: Executor,
+    log: BuildLog | None = None,
+):
+    labels = {"rock": job.rock_name, "release": release, "series": series}
+    start = time.monotonic()
+    try:
+        artifacts = do_build(
+            job.rock_name,
+            job.rockcraft,
+            output_dir,
+            workarounds=job.workarounds,
+            executor=executor,
+            log=log,
+        )
+    except typer.Exit:
+        metrics.inc(
+            "heliostat_rock_build_rocks_total",
+            value=1,
+            result="failed",
+            **labels,
+        )
+        raise
+    duration = time.monotonic() - start
+    size = sum(artifact.stat().st_size for artifact in artifacts)
+    history.record(job.rock_name, release, series, duration, size)
+    save_record(
+        output_dir,
+        ArtifactRecord(
+            job.rock_name,
+            release,
+            series,
+            [artifact.name for artifact in artifacts],
+            job.packages,
+            ppa=ppa,
+            inputs=job.inputs,
+        ),
+    )
+
+    metrics.set_value(
+        "heliostat_rock_build_duration_seconds", duration, **labels
+    )
+    metrics.inc(
+        "heliostat_rock_build_rocks_total", value=1, result="built", **labels
+    )
+    for artifact in artifacts:
+        metrics.set_value(
+            "heliostat_rock_build_artifact_bytes",
+            artifact.stat().st_size,
+            artifact=artifact.name,
+            **labels,
+        )
+
+
+@rock_app.command()
+def inspect(
+    rock_path: Annotated[Path, typer.Argument(exists=True, dir_okay=False)],
+    depth: Annotated[
+        int, typer.Option(min=1, help="Directory depth to sum sizes at")
+    ] = 2,
+    top: Annotated[
+        int, typer.Option(min=1, help="Number of directories to show")
+    ] = 15,
+):
+    """Show how much each layer and directory of a built rock takes up."""
+    from rich.console import Console
+    from rich.table import Table
+
+    from heliostat.cache import format_size
+    from heliostat.resources.layers import PYCACHE, analyse
+
+    usage = analyse(rock_path, depth=depth)
+    console = Console()
+
+    layers = Table(title=f"Layers of {rock_path.name}")
+    layers.add_column("Digest")
+    layers.add_column("Stored", justify="right")
+    layers.add_column("Unpacked", justify="right")
+    layers.add_column("Files", justify="right")
+    for layer in usage.layers:
+        layers.add_row(
+            layer.digest.split(":")[-1][:12],
+            format_size(layer.compressed),
+            format_size(layer.size),
+            str(layer.files),
+        )
+    console.print(layers)
+
+    directories = Table(title=f"Largest directories ({depth} levels)")
+    directories.add_column("Directory")
+    directories.add_column("Size", justify="right")
+    directories.add_column("Share", justify="right")
+    total = usage.size or 1
+    for directory, size in usage.directories.most_common(top):
+        directories.add_row(
+            directory, format_size(size), f"{size / total:.1%}"
+        )
+    console.print(directories)
+
+    slimmable = Table(title="Content rarely needed at runtime")
+    slimmable.add_column("Category")
+    slimmable.add_column("Size", justify="right")
+    slimmable.add_column("Share", justify="right")
+    for category, size in usage.categories.most_common():
+        slimmable.add_row(category, format_size(size), f"{size / total:.1%}")
+    console.print(slimmable)
+    if set(usage.categories) - {PYCACHE}:
+        console.print(
+            "Rebuild with --slim to strip docs, locales and apt lists."
+        )
 
 
 def do_build(
@@ -215,22 +772,56 @@ def do_build(
     rockcraft: RockcraftFile,
     output_dir: Path,
     workarounds: list[Workaround],
-):
-    with TemporaryDirectory(suffix=rock_name, prefix="heliostat") as build_dir:
+    executor: Executor | None = None,
+    log: BuildLog | None = None,
+) -> list[Path]:
+    """Build the rock and return the artifacts copied to ``output_dir``.
+
+    The output of rockcraft is kept in ``log``, by default one which also
+    echoes it.
+    """
+    executor = executor or LocalExecutor()
+    log = log or BuildLog(rock_name, echo=typer.echo)
+    with (
+        span("build", rock=rock_name, builder=executor.name),
+        TemporaryDirectory(suffix=rock_name, prefix="heliostat") as build_dir,
+    ):
         build_dir = Path(build_dir)
-        for workaround in workarounds:
-            workaround.pre_build(build_dir)
-        yaml = YAML()
-        yaml.dump(rockcraft.yaml, build_dir / "rockcraft.yaml")
+        _prepare_build_dir(build_dir, rockcraft, workarounds)
         try:
-            subprocess.check_call(["rockcraft", "pack"], cwd=build_dir)
-        except subprocess.CalledProcessError as e:
-            typer.echo(f"Build failed with error code {e.returncode}")
+            with capture(log):
+                built = executor.pack(rock_name, build_dir)
+        except BuildError as e:
+            # Output which was not shown as it came
+            if log.echo is None and log.tail:
+                typer.echo(f"Last lines of output of {rock_name}:", err=True)
+                for line in log.tail:
+                    typer.echo(f"  {line}", err=True)
+            typer.echo(f"Build failed with error code {e.returncode}: {e}")
+            # Nothing is captured when the build never ran, e.g. when its
+            # builder could not be reached
+            if log.tail:
+                typer.echo(f"Full output in {log.path}", err=True)
             raise typer.Exit(1)
-        for file in build_dir.glob("*.rock"):
-            shutil.copy(build_dir / file, output_dir)
+        artifacts = []
+        with span("copy artifacts", rock=rock_name):
+            for file in built:
+                artifacts.append(Path(shutil.copy(file, output_dir)))
+        return artifacts
+
+
+def _prepare_build_dir(
+    build_dir: Path, rockcraft: RockcraftFile, workarounds: list[Workaround]
+):
+    for workaround in workarounds:
+        workaround.pre_build(build_dir)
+    from ruamel.yaml import YAML
+
+    yaml = YAML()
+    yaml.dump(rockcraft.yaml, build_dir / "rockcraft.yaml")
 
 
+@traced("_get_patched")
 def _get_patched(
     rock: RockcraftFile,
     ppa: str | None,
@@ -0,0 +1,77 @@
+"""
+Thin client which forwards commands to a running ``heliostat serve``.
+
+This module deliberately only imports from the standard library so that
+forwarding a command costs little more than starting the interpreter. When no
+server is listening the command is run in-process instead.
+"""
+
+import json
+import os
+import socket
+import sys
+from pathlib import Path
+from typing import TextIO
+
+FORWARDED_COMMANDS = {"rock", "package", "charm"}
+
+
+def socket_path() -> Path:
+    if path := os.environ.get("HELIOSTAT_SOCKET"):
+        return Path(path)
+    if runtime_dir := os.environ.get("XDG_RUNTIME_DIR"):
+        return Path(runtime_dir) / "heliostat.sock"
+    return Path(f"/tmp/heliostat-{os.getuid()}.sock")
+
+
+def _connect(path: Path) -> socket.socket | None:
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(str(path))
+    except (FileNotFoundError, ConnectionRefusedError):
+        sock.close()
+        return None
+    return sock
+
+
+def forward(
+    argv: list[str],
+    path: Path | None = None,
+    stdout: TextIO | None = None,
+    stderr: TextIO | None = None,
+) -> int | None:
+    """Run ``argv`` on the server, returning ``None`` if none is running."""
+    sock = _connect(path or socket_path())
+    if sock is None:
+        return None
+
+    stdout = stdout or sys.stdout
+    stderr = stderr or sys.stderr
+
+    with sock, sock.makefile("rwb") as stream:
+        request = {"argv": argv, "cwd": os.getcwd()}
+        stream.write(json.dumps(request).encode() + b"\n")
+        stream.flush()
+        for line in stream:
+            message = json.loads(line)
+            if "stdout" in message:
+                stdout.write(message["stdout"])
+                stdout.flush()
+            if "stderr" in message:
+                stderr.write(message["stderr"])
+                stderr.flush()
+            if "exit" in message:
+                return message["exit"]
+    return 1
+
+
+def main():
+    argv = sys.argv[1:]
+    if argv and argv[0] in FORWARDED_COMMANDS:
+        code = forward(argv)
+        if code is not None:
+            sys.exit(code)
+
+    from heliostat.cli import main as cli
+
+    cli(args=argv, prog_name="heliostat")
@@ -1,12 +1,89 @@
+from __future__ import annotations
+
 import gzip
-from collections.abc import Iterable
+import hashlib
+import os
+import threading
+import time
+import warnings
+from collections.abc import Callable, Iterable
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+from urllib.parse import urlparse
 
-import requests
-from debian import deb822
+import msgspec
 
+from heliostat import fetch, metrics
+from heliostat.trace import span, traced
 from heliostat.types import Pocket, Release, Series
 
-UCA_BASE_URL = "https://ubuntu-cloud.archive.canonical.com/ubuntu/dists/"
+
+def _mirror(env: str, default: str, suffix: str = "") -> str:
+    """The base URL of an archive, which ``env`` may point at a mirror,
+    given as a URL or as the path of a local directory."""
+    url = os.environ.get(env) or default
+    if url.startswith("/"):
+        url = Path(url).as_uri()
+    return f"{url.rstrip('/')}/{suffix}"
+
+
+# The roots of the archives, laid out like the public archives with a
+# ``dists`` directory, e.g. as mirrored by apt-mirror or debmirror
+UCA_BASE_URL = _mirror(
+    "HELIOSTAT_UCA_MIRROR",
+    "https://ubuntu-cloud.archive.canonical.com/ubuntu",
+    "dists/",
+)
+ARCHIVE_BASE_URL = _mirror(
+    "HELIOSTAT_ARCHIVE_MIRROR", "http://archive.ubuntu.com/ubuntu", "dists/"
+)
+ARCHIVE_COMPONENTS = ("main", "universe")
+PPA_BASE_URL = _mirror(
+    "HELIOSTAT_PPA_MIRROR", "https://ppa.launchpadcontent.net"
+)
+ARCH = "amd64"
+# Where sources of the default release are looked up. With a mirror of the
+# archive and no madison set, they are looked up in the mirror's Sources
+# indexes instead, so that resolving packages never leaves the mirror.
+MADISON_URL: str | None = (
+    os.environ.get(
+        "HELIOSTAT_MADISON_URL",
+        ""
+        if os.environ.get("HELIOSTAT_ARCHIVE_MIRROR")
+        else "https://ubuntu-archive-team.ubuntu.com/madison.cgi",
+    )
+    or None
+)
+
+# How long a downloaded and parsed index may be reused, in seconds. Long
+# running processes such as ``heliostat serve`` may adjust this.
+INDEX_MAX_AGE: float = 300.0
+
+_index_cache: dict[Any, tuple[float, Any]] = {}
+# Held while loading a key, so concurrent callers wait for a single load
+_index_locks: dict[Any, threading.Lock] = {}
+_index_locks_guard = threading.Lock()
+
+
+def _cached[T](key: Any, load: Callable[[], T]) -> T:
+    """Return the cached value for ``key`` unless it has expired."""
+    with _index_locks_guard:
+        lock = _index_locks.setdefault(key, threading.Lock())
+    with lock:
+        cached = _index_cache.get(key)
+        if cached is not None and time.monotonic() - cached[0] < INDEX_MAX_AGE:
+            metrics.inc("heliostat_package_index_requests_total", result="hit")
+            return cached[1]
+        metrics.inc("heliostat_package_index_requests_total", result="miss")
+        value = load()
+        _index_cache[key] = (time.monotonic(), value)
+    return value
+
+
+def clear_index_cache():
+    _index_cache.clear()
 
 
 def uca_sources_url(
@@ -15,31 +92,391 @@ def uca_sources_url(
     return f"{UCA_BASE_URL}{series}-{pocket}/{release}/main/source/Sources.gz"
 
 
-def uca_packages(sources: set[str], series: Series, release: Release):
-    url = uca_sources_url(series, release)
-    response = requests.get(url)
-    response.raise_for_status()
+class SourcePackage(msgspec.Struct, array_like=True):
+    """The binaries built from a source package and its newest version."""
+
+    version: str | None
+    binaries: list[str]
 
-    data = gzip.decompress(response.content).decode("utf-8")
+    def merge(self, other: SourcePackage):
+        self.binaries.extend(
+            b for b in other.binaries if b not in self.binaries
+        )
+        if other.version is not None and (
+            self.version is None or _newer(other.version, self.version)
+        ):
+            self.version = other.version
 
+
+def _newer(version: str, than: str) -> bool:
+    from debian.debian_support import version_compare
+
+    return version_compare(version, than) > 0
+
+
+@traced("parse_sources")
+def parse_sources(data: str) -> dict[str, SourcePackage]:
+    """Map each source package in a Sources index to its binary packages."""
+    from debian import deb822
+
+    index: dict[str, SourcePackage] = {}
     for source_pkg in deb822.Sources.iter_paragraphs(data, use_apt_pkg=False):
-        if source_pkg["Package"] in sources:
-            yield from (pkg["package"] for pkg in source_pkg["Package-List"])
+        package = SourcePackage(
+            source_pkg.get("Version"),
+            [pkg["package"] for pkg in source_pkg["Package-List"]],
+        )
+        if source_pkg["Package"] in index:
+            index[source_pkg["Package"]].merge(package)
+        else:
+            package.binaries = list(dict.fromkeys(package.binaries))
+            index[source_pkg["Package"]] = package
+    return index
+
+
+def index_cache_dir() -> Path:
+    return fetch.cache_dir() / "indexes"
+
+
+def _cache_file(url: str, suffix: str) -> Path:
+    name = hashlib.sha256(url.encode()).hexdigest()[:32]
+    return index_cache_dir() / f"{name}{suffix}"
+
+
+class _Validators(msgspec.Struct, omit_defaults=True):
+    """HTTP validators of a downloaded file, for conditional requests."""
+
+    etag: str | None = None
+    last_modified: str | None = None
+
+
+def is_downloaded(url: str) -> bool:
+    return _cache_file(url, ".data").exists()
+
+
+def _download(url: str) -> bytes:
+    """Download ``url``, keeping a copy on disk.
+
+    The copy is revalidated with a conditional request, used as is when
+    offline and used as a fallback when the server cannot be reached.
+    ``file://`` URLs of local mirrors are read directly.
+    """
+    if url.startswith("file://"):
+        # urllib.request pulls in http.client and ssl, keep it off startup
+        from urllib.request import url2pathname
+
+        with span("read", url=url):
+            return Path(url2pathname(urlparse(url).path)).read_bytes()
+
+    path = _cache_file(url, ".data")
+    validators_path = _cache_file(url, ".validators.json")
+    if fetch.OFFLINE:
+        try:
+            data = path.read_bytes()
+            fetch.mark_used(path)
+            return data
+        except FileNotFoundError:
+            raise RuntimeError(
+                f"{url} has not been downloaded and heliostat is offline"
+            ) from None
+
+    # requests is slow to import, so only pay for it when actually fetching
+    import requests
+
+    headers = {}
+    if path.exists() and validators_path.exists():
+        validators = msgspec.json.decode(
+            validators_path.read_bytes(), type=_Validators
+        )
+        if validators.etag:
+            headers["If-None-Match"] = validators.etag
+        if validators.last_modified:
+            headers["If-Modified-Since"] = validators.last_modified
+
+    with span("download", url=url):
+        try:
+            response = requests.get(url, headers=headers)
+        except requests.ConnectionError as e:
+            if not path.exists():
+                raise
+            warnings.warn(f"Using cached {url}: {e}", fetch.StaleCacheWarning)
+            fetch.mark_used(path)
+            return path.read_bytes()
+        if response.status_code == 304:
+            fetch.mark_used(path)
+            return path.read_bytes()
+        response.raise_for_status()
+
+    fetch.write_atomic(path, response.content)
+    fetch.write_atomic(
+        validators_path,
+        msgspec.json.encode(
+            _Validators(
+                etag=response.headers.get("ETag"),
+                last_modified=response.headers.get("Last-Modified"),
+            )
+        ),
+    )
+    return response.content
+
+
+def _load_index[T](
+    url: str, parse: Callable[[str], T], index_type: type[T]
+) -> T:
+    """Download and parse a gzipped index, reusing an earlier parse of the
+    same file from disk."""
+    data = _download(url)
+    digest = hashlib.sha256(data).hexdigest()
+    parsed_path = _cache_file(url, ".parsed.json")
+    try:
+        # Only decode the index itself if it was parsed from this file
+        cached_digest, raw = msgspec.json.decode(
+            parsed_path.read_bytes(), type=tuple[str, msgspec.Raw]
+        )
+        if cached_digest == digest:
+            return msgspec.json.decode(raw, type=index_type)
+    except (FileNotFoundError, msgspec.DecodeError):
+        pass
+
+    index = parse(gzip.decompress(data).decode("utf-8"))
+    fetch.write_atomic(parsed_path, msgspec.json.encode((digest, index)))
+    return index
+
+
+def _load_sources_index(url: str) -> dict[str, SourcePackage]:
+    return _load_index(url, parse_sources, dict[str, SourcePackage])
+
+
+def uca_index(
+    series: Series, release: Release, pocket: Pocket = Pocket.UPDATES
+) -> dict[str, SourcePackage]:
+    url = uca_sources_url(series, release, pocket)
+    return _cached(url, lambda: _load_sources_index(url))
+
+
+def uca_packages(sources: set[str], series: Series, release: Release):
+    for source, package in uca_index(series, release).items():
+        if source in sources:
+            yield from package.binaries
+
+
+def _keep_newest(versions: dict[str, str], package: str, version: str):
+    current = versions.get(package)
+    if current is None or _newer(version, current):
+        versions[package] = version
+
+
+@traced("parse_packages")
+def parse_packages(data: str) -> dict[str, str]:
+    """Map each binary package in a Packages index to its newest version."""
+    versions: dict[str, str] = {}
+    package = version = None
+    # Only two fields are needed, so scanning lines is much faster than
+    # parsing every paragraph with deb822
+    for line in [*data.splitlines(), ""]:
+        if line.startswith("Package:"):
+            package = line[8:].strip()
+        elif line.startswith("Version:"):
+            version = line[8:].strip()
+        elif not line:
+            if package and version:
+                _keep_newest(versions, package, version)
+            package = version = None
+    return versions
+
+
+def packages_index(url: str) -> dict[str, str]:
+    return _cached(
+        ("packages", url),
+        lambda: _load_index(url, parse_packages, dict[str, str]),
+    )
+
+
+def uca_packages_url(
+    series: Series, release: Release, pocket: Pocket = Pocket.UPDATES
+) -> str:
+    return (
+        f"{UCA_BASE_URL}{series}-{pocket}/{release}/main/"
+        f"binary-{ARCH}/Packages.gz"
+    )
+
+
+def archive_packages_urls(series: Series) -> list[str]:
+    return [
+        f"{ARCHIVE_BASE_URL}{suite}/{component}/binary-{ARCH}/Packages.gz"
+        for suite in (series, f"{series}-{Pocket.UPDATES}")
+        for component in ARCHIVE_COMPONENTS
+    ]
+
+
+def ppa_packages_url(ppa: str, series: Series) -> str:
+    return (
+        f"{PPA_BASE_URL}{ppa}/ubuntu/dists/{series}/main/"
+        f"binary-{ARCH}/Packages.gz"
+    )
+
+
+def packages_urls(
+    series: Series, release: Release, ppa: str | None = None
+) -> list[str]:
+    """The Packages indexes a rock built for ``series`` and ``release``
+    installs from, with ``ppa`` if given."""
+    urls = archive_packages_urls(series)
+    if release != series.default_release():
+        urls.append(uca_packages_url(series, release))
+    if ppa:
+        urls.append(ppa_packages_url(ppa, series))
+    return urls
+
+
+def binary_versions(
+    packages: Iterable[str],
+    series: Series,
+    release: Release,
+    ppa: str | None = None,
+) -> dict[str, str]:
+    """The newest version of each binary package available to a rock built
+    for ``series`` and ``release``, with packages from ``ppa`` if given.
+
+    Packages which are in none of the indexes are left out.
+    """
+    wanted = set(packages)
+    versions: dict[str, str] = {}
+    for url in packages_urls(series, release, ppa):
+        index = packages_index(url)
+        for package in wanted.intersection(index):
+            _keep_newest(versions, package, index[package])
+    return versions
+
+
+def archive_sources_urls(series: Series) -> list[str]:
+    return [
+        f"{ARCHIVE_BASE_URL}{suite}/{component}/source/Sources.gz"
+        for suite in (series, f"{series}-{Pocket.UPDATES}")
+        for component in ARCHIVE_COMPONENTS
+    ]
+
+
+def archive_index(series: Series) -> dict[str, SourcePackage]:
+    """Map the source packages of the Ubuntu archive to their binaries.
+
+    Covers the release and updates pockets of main and universe, which is
+    what madison answers for sources that are not in the cloud archive.
+    """
+
+    def load():
+        index: dict[str, SourcePackage] = {}
+        for url in archive_sources_urls(series):
+            for source, package in _load_sources_index(url).items():
+                if source in index:
+                    index[source].merge(package)
+                else:
+                    index[source] = SourcePackage(
+                        package.version, list(package.binaries)
+                    )
+        return index
+
+    return _cached(("archive", series), load)
 
 
 def rmadison_url(source: str, series: Series):
-    return f"https://ubuntu-archive-team.ubuntu.com/madison.cgi?package={source}&a=&c=&s={series}&S=on&text=on"
+    return f"{MADISON_URL}?package={source}&a=&c=&s={series}&S=on&text=on"
+
+
+def _load_madison(url: str) -> SourcePackage:
+    package = SourcePackage(None, [])
+    for line in _download(url).decode("utf-8").splitlines():
+        if "|" not in line:
+            continue
+        name, version, *_ = (field.strip() for field in line.split("|"))
+        if line.endswith("source"):
+            package.merge(SourcePackage(version, []))
+        elif name not in package.binaries:
+            package.binaries.append(name)
+    return package
+
+
+def madison_source(
+    source: str, series: Series = Series.default()
+) -> SourcePackage:
+    if MADISON_URL is None:
+        return archive_index(series).get(source, SourcePackage(None, []))
+    url = rmadison_url(source, series)
+    if fetch.OFFLINE and not is_downloaded(url):
+        # Fall back to the archive indexes left by `heliostat prefetch`
+        return archive_index(series).get(source, SourcePackage(None, []))
+    return _cached(url, lambda: _load_madison(url))
 
 
 def madison_packages(
     source: str, series: Series = Series.default()
 ) -> Iterable[str]:
-    url = rmadison_url(source, series)
-    response = requests.get(url)
-    response.raise_for_status()
-    for line in response.text.splitlines():
-        if not line.endswith("source"):
-            yield line.split("|")[0].strip()
+    yield from madison_source(source, series).binaries
+
+
+@dataclass(frozen=True)
+class Target:
+    """A series and release, and the pocket of the cloud archive, to
+    resolve source packages for."""
+
+    series: Series
+    release: Release
+    pocket: Pocket = Pocket.UPDATES
+
+    @property
+    def uses_archive(self) -> bool:
+        return self.release == self.series.default_release()
+
+
+def resolve(
+    sources: Iterable[str], targets: Iterable[Target], jobs: int = 8
+) -> dict[Target, dict[str, SourcePackage]]:
+    """Resolve many source packages for many targets at once.
+
+    Maps each target to the sources found for it, with their binaries and
+    version. Every underlying index is read once however many targets share
+    it, and the reads run concurrently: one cloud archive index per series,
+    release and pocket, and for default releases either one madison lookup
+    per source and series or, without madison, the archive indexes of the
+    series.
+    """
+    sources = list(dict.fromkeys(sources))
+    targets = list(dict.fromkeys(targets))
+
+    loads: dict[tuple, Callable[[], Any]] = {}
+    for target in targets:
+        if target.uses_archive and MADISON_URL is None:
+            loads[("archive", target.series)] = lambda series=target.series: (
+                archive_index(series)
+            )
+        elif target.uses_archive:
+            for source in sources:
+                loads[("madison", source, target.series)] = (
+                    lambda source=source, series=target.series: madison_source(
+                        source, series
+                    )
+                )
+        else:
+            loads[("uca", target)] = lambda target=target: uca_index(
+                target.series, target.release, target.pocket
+            )
+
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        futures = {key: pool.submit(load) for key, load in loads.items()}
+        loaded = {key: future.result() for key, future in futures.items()}
+
+    result: dict[Target, dict[str, SourcePackage]] = {}
+    for target in targets:
+        found = result[target] = {}
+        for source in sources:
+            if target.uses_archive and MADISON_URL is None:
+                package = loaded[("archive", target.series)].get(source)
+            elif target.uses_archive:
+                package = loaded[("madison", source, target.series)]
+            else:
+                package = loaded[("uca", target)].get(source)
+            if package is not None and package.binaries:
+                found[source] = package
+    return result
 
 
 def package_list(
@@ -47,9 +484,6 @@ def package_list(
     series: Series,
     release: Release,
 ) -> Iterable[str]:
-    if release == series.default_release():
-        for src_package in src_packages:
-            yield from madison_packages(src_package, series)
-        return
-
-    yield from uca_packages(set(src_packages), series, release)
+    target = Target(series, release)
+    for package in resolve(src_packages, [target])[target].values():
+        yield from package.binaries
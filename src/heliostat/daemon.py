@@ -0,0 +1,115 @@
+"""
+A long-running heliostat server listening on a Unix socket.
+
+The server runs the regular CLI in-process, so the rock repositories, parsed
+rockcraft.yaml files and package indexes stay warm between requests. Requests
+are handled one at a time since commands share the working directory and the
+checked out repository.
+"""
+
+import io
+import json
+import os
+import socketserver
+import threading
+from contextlib import redirect_stderr, redirect_stdout
+from pathlib import Path
+from typing import cast
+
+from heliostat import component
+from heliostat.client import FORWARDED_COMMANDS
+from heliostat.rocks import SunbeamRockRepo
+
+
+class _MessageWriter(io.TextIOBase):
+    """A text stream which forwards everything written to the client."""
+
+    def __init__(self, stream, key: str):
+        self.stream = stream
+        self.key = key
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, text: str | bytes) -> int:
+        # click writes bytes when it cannot find a text stream to wrap
+        if isinstance(text, bytes):
+            text = text.decode("utf-8", errors="replace")
+        if text:
+            self.stream.write(json.dumps({self.key: text}).encode() + b"\n")
+            self.stream.flush()
+        return len(text)
+
+
+class Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        server = cast(Server, self.server)
+        request = json.loads(self.rfile.readline())
+        argv = request["argv"]
+        with server.lock:
+            code = server.run(
+                argv,
+                Path(request["cwd"]),
+                _MessageWriter(self.wfile, "stdout"),
+                _MessageWriter(self.wfile, "stderr"),
+            )
+        self.wfile.write(json.dumps({"exit": code}).encode() + b"\n")
+
+
+class Server(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path: Path):
+        self.lock = threading.Lock()
+        if path.exists():
+            path.unlink()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        super().__init__(str(path), Handler)
+
+    def server_bind(self):
+        # Create the socket with its final permissions rather than chmod it
+        # afterwards, which would leave it open to others in between
+        umask = os.umask(0o177)
+        try:
+            super().server_bind()
+        finally:
+            os.umask(umask)
+
+    def run(
+        self,
+        argv: list[str],
+        cwd: Path,
+        stdout: io.TextIOBase,
+        stderr: io.TextIOBase,
+    ) -> int:
+        from heliostat.cli import main
+
+        if not argv or argv[0] not in FORWARDED_COMMANDS:
+            stderr.write(f"Command not supported by server: {argv}\n")
+            return 2
+
+        previous = Path.cwd()
+        try:
+            os.chdir(cwd)
+            with redirect_stdout(stdout), redirect_stderr(stderr):
+                main(args=argv, prog_name="heliostat")
+        except SystemExit as e:
+            return e.code if isinstance(e.code, int) else int(bool(e.code))
+        except Exception as e:
+            stderr.write(f"{type(e).__name__}: {e}\n")
+            return 1
+        finally:
+            os.chdir(previous)
+        return 0
+
+
+def serve(path: Path, refresh_interval: float):
+    """Serve requests on ``path`` until interrupted."""
+    SunbeamRockRepo.REFRESH_INTERVAL = refresh_interval
+    component.INDEX_MAX_AGE = refresh_interval
+
+    with Server(path) as server:
+        try:
+            server.serve_forever()
+        finally:
+            path.unlink(missing_ok=True)
@@ -0,0 +1,335 @@
+"""
+Where ``rockcraft pack`` runs.
+
+A build directory holds the patched rockcraft.yaml and any files the
+workarounds need. An executor packs it, either locally, on a remote builder
+over SSH or through the shared build queue of the host (see
+``heliostat.buildqueue``), and leaves the built ``.rock`` files in the build
+directory. The output of ``rockcraft pack`` goes through
+``heliostat.supervisor``. A ``HostPool`` spreads builds over several
+executors, running at most a fixed number of builds on each at a time.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import os
+import shlex
+import socket
+import subprocess
+import tarfile
+import threading
+from collections.abc import Generator
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Protocol
+from urllib.parse import parse_qs, urlparse
+
+import msgspec
+
+from heliostat import supervisor
+from heliostat.trace import span
+
+ROCKCRAFT_BIN = os.environ.get("HELIOSTAT_ROCKCRAFT", "rockcraft")
+SSH_BIN = os.environ.get("HELIOSTAT_SSH", "ssh")
+
+
+class BuildError(RuntimeError):
+    def __init__(self, message: str, returncode: int):
+        super().__init__(message)
+        self.returncode = returncode
+
+
+class Executor(Protocol):
+    name: str
+
+    def pack(self, rock_name: str, build_dir: Path) -> list[Path]:
+        """Run ``rockcraft pack`` on ``build_dir`` and return the built
+        rocks, which are left in ``build_dir``."""
+        ...
+
+
+@dataclass
+class LocalExecutor:
+    name: str = "local"
+
+    def pack(self, rock_name: str, build_dir: Path) -> list[Path]:
+        with span("rockcraft pack", rock=rock_name):
+            returncode = supervisor.call([ROCKCRAFT_BIN, "pack"], build_dir)
+        if returncode != 0:
+            raise BuildError(
+                f"rockcraft pack failed for {rock_name}", returncode
+            )
+        return sorted(build_dir.glob("*.rock"))
+
+
+@dataclass
+class SSHExecutor:
+    """Build on a remote host over SSH.
+
+    The build directory is streamed to a fresh directory on the host as a
+    tar archive over the SSH connection, and the built rocks are streamed
+    back the same way, so the host only needs ``tar`` and ``rockcraft``.
+    """
+
+    host: str
+    port: int | None = None
+    rockcraft: str = "rockcraft"
+    name: str = field(init=False)
+
+    def __post_init__(self):
+        self.name = f"ssh://{self.host}" + (
+            f":{self.port}" if self.port else ""
+        )
+
+    def _ssh(self, command: str) -> list[str]:
+        args = [SSH_BIN, "-o", "BatchMode=yes"]
+        if self.port:
+            args += ["-p", str(self.port)]
+        return [*args, self.host, command]
+
+    def _upload(self, build_dir: Path) -> str:
+        """Unpack the build directory into a new directory on the host and
+        return its path, in a single connection."""
+        with span("upload build dir", host=self.host):
+            process = subprocess.Popen(
+                self._ssh(
+                    "dir=$(mktemp -d -t heliostat.XXXXXXXX) && "
+                    'tar -x -C "$dir" && echo "$dir"'
+                ),
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+            )
+            assert process.stdin is not None and process.stdout is not None
+            uploaded = False
+            try:
+                with tarfile.open(fileobj=process.stdin, mode="w|") as tar:
+                    for path in sorted(build_dir.iterdir()):
+                        tar.add(path, arcname=path.name)
+                process.stdin.close()
+                uploaded = True
+            except OSError:
+                # ssh exited before reading the whole build directory, e.g.
+                # as it could not connect, and its exit code tells why
+                with contextlib.suppress(OSError):
+                    process.stdin.close()
+            remote_dir = process.stdout.read().decode().strip()
+            if process.wait() != 0 or not uploaded or not remote_dir:
+                raise BuildError(
+                    f"Failed to upload the build to {self.host}",
+                    process.returncode,
+                )
+        return remote_dir
+
+    def _download(self, remote_dir: str, build_dir: Path) -> list[Path]:
+        """Stream the built rocks back and remove the remote directory."""
+        quoted = shlex.quote(remote_dir)
+        with span("download rocks", host=self.host):
+            process = subprocess.Popen(
+                self._ssh(
+                    f"cd {quoted} && tar -c -f - *.rock; "
+                    f"status=$?; rm -rf {quoted}; exit $status"
+                ),
+                stdout=subprocess.PIPE,
+            )
+            assert process.stdout is not None
+            rocks = []
+            with tarfile.open(fileobj=process.stdout, mode="r|") as tar:
+                for member in tar:
+                    # Only accept plain .rock files at the top level
+                    if not member.isfile() or "/" in member.name:
+                        continue
+                    if not member.name.endswith(".rock"):
+                        continue
+                    tar.extract(member, build_dir, filter="data")
+                    rocks.append(build_dir / member.name)
+            if process.wait() != 0:
+                raise BuildError(
+                    f"Failed to download the rocks from {self.host}",
+                    process.returncode,
+                )
+        return sorted(rocks)
+
+    def pack(self, rock_name: str, build_dir: Path) -> list[Path]:
+        remote_dir = self._upload(build_dir)
+        with span("rockcraft pack", rock=rock_name, host=self.host):
+            returncode = supervisor.call(
+                self._ssh(
+                    f"cd {shlex.quote(remote_dir)} && "
+                    f"{shlex.quote(self.rockcraft)} pack"
+                )
+            )
+        if returncode != 0:
+            subprocess.run(
+                self._ssh(f"rm -rf {shlex.quote(remote_dir)}"),
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+            )
+            raise BuildError(
+                f"rockcraft pack failed for {rock_name} on {self.host}",
+                returncode,
+            )
+        return self._download(remote_dir, build_dir)
+
+
+def build_queue_path() -> Path:
+    """The socket of the build queue, by default one which only the current
+    user can create. A queue shared by several users is given with
+    $HELIOSTAT_BUILD_QUEUE, e.g. in a directory of their common group."""
+    if path := os.environ.get("HELIOSTAT_BUILD_QUEUE"):
+        return Path(path)
+    if runtime_dir := os.environ.get("XDG_RUNTIME_DIR"):
+        return Path(runtime_dir) / "heliostat-build-queue.sock"
+    return Path("/run/heliostat/build-queue.sock")
+
+
+class BuildRequest(msgspec.Struct):
+    rock: str
+    # The contents of the build directory, by relative path
+    files: dict[str, bytes]
+
+
+@dataclass
+class QueueExecutor:
+    """Build through the shared build queue of the host.
+
+    The build directory is sent to the queue, which builds it at most once
+    however many clients ask for the same build, and the built rocks are
+    streamed back over the socket.
+    """
+
+    path: Path = field(default_factory=build_queue_path)
+    name: str = field(init=False)
+
+    def __post_init__(self):
+        self.name = f"queue://{self.path}"
+
+    def pack(self, rock_name: str, build_dir: Path) -> list[Path]:
+        request = BuildRequest(
+            rock_name,
+            {
+                str(path.relative_to(build_dir)): path.read_bytes()
+                for path in sorted(build_dir.rglob("*"))
+                if path.is_file()
+            },
+        )
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(str(self.path))
+        except OSError as e:
+            sock.close()
+            raise BuildError(f"No build queue at {self.path}: {e}", 1)
+
+        with (
+            span("build queue", rock=rock_name),
+            sock,
+            sock.makefile("rwb") as stream,
+        ):
+            stream.write(msgspec.json.encode(request) + b"\n")
+            stream.flush()
+            rocks = []
+            for line in stream:
+                message = msgspec.json.decode(line)
+                if "status" in message:
+                    supervisor.note(f"Build queue: {message['status']}")
+                elif "error" in message:
+                    supervisor.note(message["error"])
+                    raise BuildError(message["error"], message["returncode"])
+                elif "artifact" in message:
+                    rocks.append(
+                        _receive(
+                            stream,
+                            build_dir,
+                            message["artifact"],
+                            message["size"],
+                        )
+                    )
+                elif message.get("done"):
+                    return sorted(rocks)
+        raise BuildError(
+            f"The build queue dropped the build of {rock_name}", 1
+        )
+
+
+def _receive(stream, build_dir: Path, name: str, size: int) -> Path:
+    # Only accept plain .rock files at the top level
+    if "/" in name or not name.endswith(".rock"):
+        raise BuildError(
+            f"Unexpected artifact {name!r} from the build queue", 1
+        )
+    path = build_dir / name
+    with path.open("wb") as f:
+        while size:
+            chunk = stream.read(min(size, 1 << 20))
+            if not chunk:
+                raise BuildError(f"Truncated artifact {name}", 1)
+            f.write(chunk)
+            size -= len(chunk)
+    return path
+
+
+def parse_builder(spec: str) -> tuple[Executor, int]:
+    """Parse ``local``, ``ssh://[user@]host[:port]`` or ``queue`` (or
+    ``queue:///path/to/socket``) with an optional ``?jobs=N`` into an
+    executor and how many builds it may run at once."""
+    url = urlparse(spec)
+    query = parse_qs(url.query)
+    try:
+        jobs = int(query.pop("jobs", ["1"])[0])
+    except ValueError:
+        raise ValueError(f"Invalid number of jobs in builder '{spec}'")
+    if jobs < 1:
+        raise ValueError(f"Builder '{spec}' needs at least one job")
+
+    executor: Executor
+    if url.scheme == "" and url.path == "local":
+        executor = LocalExecutor()
+    elif url.scheme == "" and url.path == "queue":
+        executor = QueueExecutor()
+    elif url.scheme == "queue" and url.path:
+        executor = QueueExecutor(Path(url.path))
+    elif url.scheme == "ssh" and url.hostname:
+        host = url.hostname
+        if url.username:
+            host = f"{url.username}@{host}"
+        rockcraft = query.pop("rockcraft", ["rockcraft"])[0]
+        executor = SSHExecutor(host, url.port, rockcraft=rockcraft)
+    else:
+        raise ValueError(
+            f"Invalid builder '{spec}', expected local, queue or "
+            "ssh://[user@]host[:port]"
+        )
+    if query:
+        raise ValueError(f"Unknown builder options {', '.join(query)}")
+    return executor, jobs
+
+
+class HostPool:
+    """Hand out executors, running at most ``jobs`` builds on each."""
+
+    def __init__(self, executors: list[tuple[Executor, int]]):
+        if not executors:
+            raise ValueError("A host pool needs at least one executor")
+        self._free = {id(e): jobs for e, jobs in executors}
+        self._executors = [e for e, _ in executors]
+        self.capacity = sum(jobs for _, jobs in executors)
+        self._condition = threading.Condition()
+
+    @classmethod
+    def from_specs(cls, specs: list[str]) -> HostPool:
+        return cls([parse_builder(spec) for spec in specs])
+
+    @contextmanager
+    def acquire(self) -> Generator[Executor]:
+        """Wait for a free slot, preferring the executor with the most."""
+        with self._condition:
+            self._condition.wait_for(lambda: any(self._free.values()))
+            executor = max(self._executors, key=lambda e: self._free[id(e)])
+            self._free[id(executor)] -= 1
+        try:
+            yield executor
+        finally:
+            with self._condition:
+                self._free[id(executor)] += 1
+                self._condition.notify()
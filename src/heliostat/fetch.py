@@ -1,60 +1,153 @@
+import contextlib
+import os
 import subprocess
+import tempfile
+import threading
 from pathlib import Path
 
 import xdg_base_dirs as xdg
 
+from heliostat.trace import span, traced
+
+# Never touch the network, relying on what an earlier run or `heliostat
+# prefetch` left in the cache. Set by --offline or $HELIOSTAT_OFFLINE.
+OFFLINE = os.environ.get("HELIOSTAT_OFFLINE", "") not in ("", "0")
+
+# git takes locks on the shared clone, so concurrent checkouts of different
+# branches must not run git at the same time
+_repo_locks: dict[Path, threading.Lock] = {}
+_repo_locks_guard = threading.Lock()
+
+
+class StaleCacheWarning(UserWarning):
+    """A cached copy was used because the network could not be reached."""
+
 
 def cache_dir() -> Path:
     return xdg.xdg_cache_home() / "heliostat"
 
 
+def write_atomic(path: Path, data: bytes):
+    """Replace ``path`` with ``data`` so that readers never see a partly
+    written file. Every writer, thread or process, writes its own temporary
+    file first."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(
+        prefix=f".{path.name}.", suffix=".tmp", dir=path.parent
+    )
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(tmp)
+        raise
+
+
 def repo_path(name: str) -> Path:
     return cache_dir() / name
 
 
-def ensure_repo(uri: str, branch: str = "main") -> Path:
+def mark_used(path: Path):
+    """Record that a cache entry was used, for least-recently-used eviction
+    by ``heliostat cache gc``."""
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        pass
+
+
+def worktree_path(name: str, branch: str) -> Path:
+    return cache_dir() / "worktrees" / name / branch.replace("/", "-")
+
+
+def _repo_lock(path: Path) -> threading.Lock:
+    with _repo_locks_guard:
+        return _repo_locks.setdefault(path, threading.Lock())
+
+
+@traced("ensure_repo")
+def ensure_repo(uri: str, branch: str = "main", fetch: bool = True) -> Path:
+    """Return a checkout of ``branch`` of the repo at ``uri``.
+
+    Every branch is checked out in its own worktree of a single shared clone,
+    so that different branches can be used side by side.
+    """
     name = uri.split("/")[-1].removesuffix(".git")
     path = repo_path(name)
-    if not path.exists():
-        # Set up parent cache dir
-        path.parent.mkdir(parents=True, exist_ok=True)
-        # shell out to git clone
+    with _repo_lock(path):
+        if not path.exists():
+            if OFFLINE:
+                raise RuntimeError(
+                    f"{name} has not been cloned and heliostat is offline"
+                )
+            # Set up parent cache dir
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # shell out to git clone
+            try:
+                with span("git clone"):
+                    subprocess.check_call(
+                        [
+                            "git",
+                            "clone",
+                            "--",
+                            uri,
+                            path,
+                        ]
+                    )
+            except subprocess.CalledProcessError as e:
+                raise RuntimeError(f"Failed to clone repo: {e}")
+        elif fetch and not OFFLINE:
+            try:
+                with span("git fetch"):
+                    subprocess.check_call(
+                        [
+                            "git",
+                            "fetch",
+                            "--all",
+                        ],
+                        cwd=path,
+                    )
+            except subprocess.CalledProcessError as e:
+                raise RuntimeError(f"Failed to fetch repo: {e}")
+
+        worktree = worktree_path(name, branch)
+        if worktree.exists():
+            command = ["git", "switch", "--detach", f"origin/{branch}"]
+            cwd = worktree
+        else:
+            worktree.parent.mkdir(parents=True, exist_ok=True)
+            command = [
+                "git",
+                "worktree",
+                "add",
+                "--detach",
+                str(worktree),
+                f"origin/{branch}",
+            ]
+            cwd = path
         try:
-            subprocess.check_call(
-                [
-                    "git",
-                    "clone",
-                    "--",
-                    uri,
-                    path,
-                ]
-            )
+            with span("git switch"):
+                subprocess.check_call(command, cwd=cwd)
         except subprocess.CalledProcessError as e:
-            raise RuntimeError(f"Failed to clone repo: {e}")
+            raise RuntimeError(f"Failed to switch to branch: {e}")
 
-    try:
-        subprocess.check_call(
-            [
-                "git",
-                "fetch",
-                "--all",
-            ],
-            cwd=path,
-        )
-    except subprocess.CalledProcessError as e:
-        raise RuntimeError(f"Failed to fetch repo: {e}")
+    mark_used(path)
+    mark_used(worktree)
+    return worktree
 
+
+def repo_commit(path: Path) -> str | None:
+    """The commit checked out at ``path``, if it is a git checkout."""
+    if not (path / ".git").exists():
+        return None
     try:
-        subprocess.check_call(
-            [
-                "git",
-                "switch",
-                "--detach",
-                f"origin/{branch}",
-            ],
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"],
             cwd=path,
-        )
-    except subprocess.CalledProcessError as e:
-        raise RuntimeError(f"Failed to switch to branch: {e}")
-
-    return path
+            text=True,
+            stderr=subprocess.DEVNULL,
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
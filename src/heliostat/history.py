@@ -0,0 +1,130 @@
+"""
+A record of past rock builds, used to predict how long future builds take.
+"""
+
+from __future__ import annotations
+
+import heapq
+import statistics
+import threading
+import time
+from collections.abc import Iterable
+from dataclasses import dataclass
+from pathlib import Path
+
+import msgspec
+
+from heliostat.fetch import cache_dir, write_atomic
+from heliostat.types import Release, Series
+
+# Only the most recent builds are kept, so estimates follow upstream changes
+MAX_RECORDS = 5
+
+
+class BuildRecord(msgspec.Struct, array_like=True):
+    duration: float
+    size: int
+    finished: float
+
+
+def history_path() -> Path:
+    return cache_dir() / "build-history.json"
+
+
+class BuildHistory:
+    """Durations and artifact sizes of past builds by rock, release and
+    series."""
+
+    def __init__(self, path: Path | None = None):
+        self.path = path or history_path()
+        self._lock = threading.Lock()
+        try:
+            self.records = msgspec.json.decode(
+                self.path.read_bytes(), type=dict[str, list[BuildRecord]]
+            )
+        except (FileNotFoundError, msgspec.DecodeError):
+            self.records = {}
+
+    @staticmethod
+    def key(rock: str, release: Release, series: Series) -> str:
+        return f"{rock}/{release}/{series}"
+
+    def record(
+        self,
+        rock: str,
+        release: Release,
+        series: Series,
+        duration: float,
+        size: int,
+    ):
+        with self._lock:
+            records = self.records.setdefault(
+                self.key(rock, release, series), []
+            )
+            records.append(BuildRecord(duration, size, time.time()))
+            del records[:-MAX_RECORDS]
+            self._save()
+
+    def _save(self):
+        write_atomic(self.path, msgspec.json.encode(self.records))
+
+    def estimate(
+        self, rock: str, release: Release, series: Series
+    ) -> float | None:
+        """The median duration of recent builds, if there are any."""
+        records = self.records.get(self.key(rock, release, series))
+        if not records:
+            return None
+        return statistics.median(r.duration for r in records)
+
+
+@dataclass
+class ScheduledBuild[T]:
+    item: T
+    name: str
+    estimate: float
+    known: bool
+    start: float = 0.0
+
+    @property
+    def finish(self) -> float:
+        return self.start + self.estimate
+
+
+def schedule[T](
+    items: Iterable[tuple[str, T]],
+    history: BuildHistory,
+    release: Release,
+    series: Series,
+    jobs: int,
+) -> list[ScheduledBuild[T]]:
+    """Order builds longest-first and predict when each one starts.
+
+    Rocks without any history are assumed to be as slow as the slowest
+    known rock, so that they are started early rather than holding up the
+    end of the batch.
+    """
+    builds = []
+    for name, item in items:
+        estimate = history.estimate(name, release, series)
+        builds.append(
+            ScheduledBuild(item, name, estimate or 0.0, estimate is not None)
+        )
+
+    fallback = max((b.estimate for b in builds if b.known), default=0.0)
+    for build in builds:
+        if not build.known:
+            build.estimate = fallback
+
+    builds.sort(key=lambda b: b.estimate, reverse=True)
+
+    # Each worker picks up the next build as soon as it is free
+    workers = [0.0] * max(jobs, 1)
+    for build in builds:
+        build.start = heapq.heappop(workers)
+        heapq.heappush(workers, build.finish)
+    return builds
+
+
+def makespan(builds: list[ScheduledBuild]) -> float:
+    return max((b.finish for b in builds), default=0.0)
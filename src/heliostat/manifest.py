@@ -0,0 +1,138 @@
+"""
+Sunbeam manifests which deploy the charms of one OpenStack release.
+
+The manifest pins every charm to the channel of the release, and the rocks
+built for it are matched to the oci-image resources of those charms so that
+they can be attached once the deployment is up.
+"""
+
+from __future__ import annotations
+
+from collections.abc import Iterable
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any
+
+from heliostat.charms import SUNBEAM_CHARMS, CharmInfo, charm_infos
+from heliostat.types import Release
+
+# From most to least stable
+RISKS = ("stable", "candidate", "beta", "edge")
+
+# Rocks holding every service of their family, e.g. cinder-consolidated
+CONSOLIDATED_SUFFIX = "-consolidated"
+
+
+@dataclass
+class RockAttachment:
+    charm: str
+    resource: str
+    rock: Path
+
+    @property
+    def application(self) -> str:
+        """The name sunbeam deploys the charm as."""
+        return self.charm.removesuffix("-k8s")
+
+
+@dataclass
+class Manifest:
+    release: Release
+    # Charm name -> channel
+    channels: dict[str, str] = field(default_factory=dict)
+    attachments: list[RockAttachment] = field(default_factory=list)
+    warnings: list[str] = field(default_factory=list)
+
+    def to_yaml(self) -> dict[str, Any]:
+        return {
+            "core": {
+                "software": {
+                    "charms": {
+                        charm: {"channel": channel}
+                        for charm, channel in self.channels.items()
+                    }
+                }
+            }
+        }
+
+
+def pick_channel(info: CharmInfo, track: str, risk: str) -> str | None:
+    """The channel of ``track`` at ``risk``, or else at the next less
+    stable risk which is published."""
+    for candidate in RISKS[RISKS.index(risk) :]:
+        channel = f"{track}/{candidate}"
+        if channel in info.channels:
+            return channel
+    return None
+
+
+def rock_name(rock: Path) -> str:
+    return rock.name.split("_")[0]
+
+
+def generate(
+    release: Release,
+    risk: str = "stable",
+    charms: Iterable[str] = SUNBEAM_CHARMS,
+    rocks: Iterable[Path] = (),
+    jobs: int = 8,
+) -> Manifest:
+    """Pin ``charms`` to the channels of ``release`` and match ``rocks`` to
+    the oci-image resources of the charms in those channels.
+
+    A consolidated rock is matched to every resource of its family's charm
+    which no rock of a single service was matched to.
+    """
+    manifest = Manifest(release)
+    track = release.version()
+    resources: dict[str, tuple[str, str]] = {}
+    for name, info in sorted(charm_infos(charms, jobs=jobs).items()):
+        channel = pick_channel(info, track, risk)
+        if channel is None:
+            manifest.warnings.append(f"{name} has no {track} track, left out")
+            continue
+        if not channel.endswith(f"/{risk}"):
+            manifest.warnings.append(
+                f"{name} is not released to {track}/{risk}, using {channel}"
+            )
+        manifest.channels[name] = channel
+        for resource in info.channels[channel]:
+            resources[resource] = (name, resource)
+
+    # Rocks of single services first, so that a consolidated rock of the
+    # same family only fills in the resources left over
+    taken: set[str] = set()
+    consolidated: list[Path] = []
+    for rock in sorted(rocks):
+        name = rock_name(rock)
+        if name.endswith(CONSOLIDATED_SUFFIX):
+            consolidated.append(rock)
+            continue
+        match = resources.get(f"{name}-image")
+        if match is None:
+            manifest.warnings.append(
+                f"No charm in the manifest takes {rock.name}"
+            )
+            continue
+        manifest.attachments.append(RockAttachment(*match, rock))
+        taken.add(match[1])
+
+    for rock in consolidated:
+        # Every image of the family's charm, e.g. cinder-k8s for cinder
+        charm = f"{rock_name(rock).removesuffix(CONSOLIDATED_SUFFIX)}-k8s"
+        matches = [
+            match
+            for resource, match in resources.items()
+            if match[0] == charm
+            and resource.endswith("-image")
+            and resource not in taken
+        ]
+        if not matches:
+            manifest.warnings.append(
+                f"No charm in the manifest takes {rock.name}"
+            )
+            continue
+        manifest.attachments.extend(
+            RockAttachment(*match, rock) for match in sorted(matches)
+        )
+    return manifest
@@ -0,0 +1,140 @@
+"""
+Prometheus metrics for a heliostat run, written in the format read by the
+node_exporter textfile collector.
+
+Metrics are only collected once :func:`enable` has been called, otherwise
+recording them does nothing. Metric names start with ``heliostat_`` followed
+by the command that produces them.
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+from pathlib import Path
+from typing import Literal
+
+MetricType = Literal["counter", "gauge"]
+
+METRICS: dict[str, tuple[MetricType, str]] = {
+    "heliostat_run_duration_seconds": (
+        "gauge",
+        "Wall time of the heliostat command",
+    ),
+    "heliostat_run_timestamp_seconds": (
+        "gauge",
+        "Unix time at which the heliostat command finished",
+    ),
+    "heliostat_rock_build_duration_seconds": (
+        "gauge",
+        "Time taken to build each rock",
+    ),
+    "heliostat_rock_build_artifact_bytes": (
+        "gauge",
+        "Size of each built rock artifact",
+    ),
+    "heliostat_rock_build_rocks_total": (
+        "counter",
+        "Rocks handled by rock build by result (built, skipped or failed)",
+    ),
+    "heliostat_package_index_requests_total": (
+        "counter",
+        "Package index lookups by in-memory cache result (hit or miss)",
+    ),
+    "heliostat_charm_attach_images_total": (
+        "counter",
+        "Images made available to k8s by result (imported or present)",
+    ),
+    "heliostat_charm_attach_import_bytes_total": (
+        "counter",
+        "Bytes imported with ctr or uploaded to a registry",
+    ),
+    "heliostat_charm_attach_duration_seconds": (
+        "gauge",
+        "Time taken by juju attach-resource for each charm",
+    ),
+}
+
+Labels = tuple[tuple[str, str], ...]
+
+
+class Metrics:
+    def __init__(self):
+        self.samples: dict[str, dict[Labels, float]] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, name: str, labels: dict[str, object]) -> Labels:
+        if name not in METRICS:
+            raise ValueError(f"Unknown metric {name}")
+        return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    def set_value(self, name: str, value: float, **labels: object):
+        key = self._key(name, labels)
+        with self._lock:
+            self.samples.setdefault(name, {})[key] = value
+
+    def inc(self, name: str, value: float = 1, **labels: object):
+        key = self._key(name, labels)
+        with self._lock:
+            series = self.samples.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def render(self) -> str:
+        lines = []
+        for name, series in sorted(self.samples.items()):
+            metric_type, help_text = METRICS[name]
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            for labels, value in sorted(series.items()):
+                lines.append(f"{name}{_format_labels(labels)} {value:g}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: Path):
+        """Atomically replace ``path`` so the collector never reads a
+        partially written file."""
+        tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        tmp.write_text(self.render())
+        os.replace(tmp, path)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    inner = ",".join(f'{k}="{_escape(v)}"' for k, v in labels)
+    return f"{{{inner}}}"
+
+
+_metrics: Metrics | None = None
+
+
+def enable() -> Metrics:
+    global _metrics
+    _metrics = Metrics()
+    return _metrics
+
+
+def disable() -> Metrics | None:
+    global _metrics
+    metrics, _metrics = _metrics, None
+    return metrics
+
+
+def set_value(name: str, value: float, **labels: object):
+    if _metrics is not None:
+        _metrics.set_value(name, value, **labels)
+
+
+def inc(name: str, value: float = 1, **labels: object):
+    if _metrics is not None:
+        _metrics.inc(name, value, **labels)
+
+
+def finish(path: Path):
+    """Stop collecting and write the metrics to ``path``."""
+    metrics = disable()
+    if metrics is not None:
+        metrics.write(path)
@@ -0,0 +1,107 @@
+"""
+Warm every cache heliostat uses for a matrix of releases and series.
+
+A cache directory prepared this way can be baked into CI runner images, so
+that later commands run with ``--offline`` never touch the network.
+"""
+
+from __future__ import annotations
+
+from collections.abc import Callable, Iterable
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Future,
+    ThreadPoolExecutor,
+    wait,
+)
+from dataclasses import dataclass
+
+from heliostat import charms, component
+from heliostat.rocks import SunbeamRockRepo
+from heliostat.types import Release, Series
+
+
+@dataclass
+class PrefetchResult:
+    task: str
+    summary: str = ""
+    error: Exception | None = None
+
+
+def _warm_branch(release: Release, fetch: bool) -> str:
+    repo = SunbeamRockRepo.ensure(release=release, fetch=fetch)
+    return f"{len(repo.catalog())} rocks"
+
+
+def _warm_index(series: Series, release: Release) -> str:
+    if release == series.default_release():
+        index = component.archive_index(series)
+    else:
+        index = component.uca_index(series, release)
+    return f"{len(index)} sources"
+
+
+def _warm_packages(urls: list[str]) -> str:
+    count = sum(len(component.packages_index(url)) for url in urls)
+    return f"{count} packages"
+
+
+def _warm_charm(name: str) -> str:
+    info = charms.charm_info(name)
+    return f"{len(info.channels)} channels"
+
+
+def prefetch(
+    releases: Iterable[Release],
+    series: Iterable[Series],
+    ppas: Iterable[str] = (),
+    jobs: int = 8,
+) -> Iterable[PrefetchResult]:
+    """Fetch the rocks repo branch of every release, the package indexes of
+    every release and series pair and of ``ppas``, and the channels of the
+    sunbeam charms, yielding results as they finish."""
+    releases = list(dict.fromkeys(releases))
+    series = list(dict.fromkeys(series))
+    ppas = list(dict.fromkeys(ppas))
+
+    # One release per branch, as several releases share a branch
+    branches: dict[str, Release] = {}
+    for release in releases:
+        branch = SunbeamRockRepo.RELEASE_BRANCH.get(release, "main")
+        branches.setdefault(branch, release)
+
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        futures: dict[Future[str], str] = {}
+
+        def submit(task: str, func: Callable[..., str], *args):
+            futures[pool.submit(func, *args)] = task
+
+        for s in series:
+            for release in releases:
+                submit(f"index {s}/{release}", _warm_index, s, release)
+                # The binary package versions `rock build --incremental`
+                # compares against
+                urls = component.packages_urls(s, release)
+                submit(f"packages {s}/{release}", _warm_packages, urls)
+            for ppa in ppas:
+                urls = [component.ppa_packages_url(ppa, s)]
+                submit(f"packages {s}/ppa:{ppa}", _warm_packages, urls)
+        for name in charms.SUNBEAM_CHARMS:
+            submit(f"charm {name}", _warm_charm, name)
+
+        # Fetching updates every branch at once, so fetch only for the first
+        # and check out the rest once it is done
+        first, *rest = branches.items()
+        submit(f"repo {first[0]}", _warm_branch, first[1], True)
+
+        while futures:
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                task = futures.pop(future)
+                try:
+                    yield PrefetchResult(task, future.result())
+                except Exception as e:
+                    yield PrefetchResult(task, error=e)
+                if task == f"repo {first[0]}":
+                    for branch, release in rest:
+                        submit(f"repo {branch}", _warm_branch, release, False)
@@ -4,13 +4,18 @@ that they can be accessed by juju.
 """
 
 import json
+import os
 import subprocess
 import tarfile
 
 # https://documentation.ubuntu.com/canonical-kubernetes/latest/snap/howto/image-management/
 from pathlib import Path
 
-CTR_BIN = "/snap/k8s/current/bin/ctr"
+from heliostat.trace import span, traced
+
+CTR_BIN = os.environ.get("HELIOSTAT_CTR", "/snap/k8s/current/bin/ctr")
+# Set HELIOSTAT_SUDO to an empty string when already running as root
+SUDO = os.environ.get("HELIOSTAT_SUDO", "sudo")
 CTR_SOCK = "/run/containerd/containerd.sock"
 K8S_NS = "k8s.io"
 
@@ -18,14 +23,14 @@ FAKE_REGISTRY = "phantom-registry.zmraines.com"
 
 
 def ctr_cmd(*args: str) -> list[str]:
-    return [
-        "sudo",
+    cmd = [
         CTR_BIN,
         "--address",
         CTR_SOCK,
         "--namespace",
         K8S_NS,
     ] + list(args)
+    return [SUDO] + cmd if SUDO else cmd
 
 
 def image_name(rock_name: str) -> str:
@@ -42,18 +47,20 @@ def image_digest(rock_path: Path) -> str:
 
 
 def import_image(rock_path: Path, rock_name: str):
-    subprocess.check_call(
-        ctr_cmd(
-            "images",
-            "import",
-            "--digests",
-            "--base-name",
-            image_name(rock_name),
-            str(rock_path),
+    with span("ctr import", rock=rock_name):
+        subprocess.check_call(
+            ctr_cmd(
+                "images",
+                "import",
+                "--digests",
+                "--base-name",
+                image_name(rock_name),
+                str(rock_path),
+            )
         )
-    )
 
 
+@traced("ctr images ls")
 def has_image(digest: str) -> bool:
     return any(
         line.endswith(digest)
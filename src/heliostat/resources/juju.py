@@ -1,13 +1,23 @@
 """Utilities for updating the oci-image resources associated with Juju k8s
 charms."""
 
+import os
 import shutil
 import subprocess
+import time
 from pathlib import Path
 
+from heliostat import metrics
+from heliostat.trace import span
+
+from . import registry
 from .ctr import has_image, image_digest, image_name, import_image
 
-JUJU_BIN = shutil.which("juju") or "/snap/juju/current/bin/juju"
+JUJU_BIN = (
+    os.environ.get("HELIOSTAT_JUJU")
+    or shutil.which("juju")
+    or "/snap/juju/current/bin/juju"
+)
 SUNBEAM_MODEL = "openstack"
 
 
@@ -18,19 +28,63 @@ def juju_cmd(cmd: str, *args: str) -> list[str]:
 def attach_resource(
     charm_name: str, resource_name: str, image_name: str, digest: str
 ):
-    subprocess.check_call(
-        juju_cmd(
-            "attach-resource",
-            charm_name,
-            f"{resource_name}={image_name}@{digest}",
+    start = time.monotonic()
+    with span("juju attach-resource", charm=charm_name):
+        subprocess.check_call(
+            juju_cmd(
+                "attach-resource",
+                charm_name,
+                f"{resource_name}={image_name}@{digest}",
+            )
         )
+    metrics.set_value(
+        "heliostat_charm_attach_duration_seconds",
+        time.monotonic() - start,
+        charm=charm_name,
+        resource=resource_name,
     )
 
 
-def attach_rock(charm_name: str, rock_path: Path, resource_name: str):
+def attach_rock(
+    charm_name: str,
+    rock_path: Path,
+    resource_name: str,
+    registry_host: str | None = None,
+    insecure: bool = False,
+):
+    """Make the rock available to k8s and attach it to the charm.
+
+    By default the rock is imported into the local containerd image store.
+    If ``registry_host`` is given it is pushed to that registry instead, so
+    that every node in the cluster can pull it, over plain http if
+    ``insecure``.
+    """
     rock_name = rock_path.name.split("_")[0]
-    name = image_name(rock_name)
     digest = image_digest(rock_path)
-    if not has_image(digest):
-        import_image(rock_path, rock_name)
+    if registry_host is None:
+        name = image_name(rock_name)
+        if has_image(digest):
+            result = "present"
+        else:
+            import_image(rock_path, rock_name)
+            result = "imported"
+            metrics.inc(
+                "heliostat_charm_attach_import_bytes_total",
+                rock_path.stat().st_size,
+                method="ctr",
+            )
+    else:
+        name = registry.image_name(rock_name, registry_host)
+        stats = registry.push_rock(
+            rock_path, rock_name, registry_host, insecure=insecure
+        )
+        result = "imported" if stats.uploaded or stats.mounted else "present"
+        metrics.inc(
+            "heliostat_charm_attach_import_bytes_total",
+            stats.uploaded_bytes,
+            method="registry",
+        )
+    metrics.inc(
+        "heliostat_charm_attach_images_total", result=result, rock=rock_name
+    )
     attach_resource(charm_name, resource_name, name, digest)
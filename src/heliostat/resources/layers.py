@@ -0,0 +1,99 @@
+"""
+Where the size of a built rock comes from, by layer and by directory.
+
+Every byte of a rock is copied out of the build, imported with ``ctr`` or
+pushed to a registry and pulled by the k8s nodes, so content the services
+never read at runtime slows down every one of those steps.
+"""
+
+from __future__ import annotations
+
+import json
+import tarfile
+from collections import Counter
+from dataclasses import dataclass, field
+from pathlib import Path, PurePosixPath
+
+from heliostat.resources.registry import INDEX_TYPES, OciArchive
+
+# Content which rocks rarely need at runtime, by path prefix
+SLIMMABLE_PREFIXES = {
+    "docs": ("usr/share/doc/", "usr/share/man/", "usr/share/info/"),
+    "apt lists": ("var/lib/apt/lists/", "var/cache/apt/"),
+    "locale": ("usr/share/locale/", "usr/lib/locale/", "usr/share/i18n/"),
+}
+PYCACHE = "__pycache__"
+
+
+def slimmable_category(path: str) -> str | None:
+    for category, prefixes in SLIMMABLE_PREFIXES.items():
+        if path.startswith(prefixes):
+            return category
+    if PYCACHE in path.split("/"):
+        return PYCACHE
+    return None
+
+
+@dataclass
+class LayerUsage:
+    digest: str
+    media_type: str
+    # Size of the blob as stored in the rock and transferred
+    compressed: int
+    # Total size of the files in the layer
+    size: int = 0
+    files: int = 0
+
+
+@dataclass
+class RockUsage:
+    layers: list[LayerUsage] = field(default_factory=list)
+    directories: Counter[str] = field(default_factory=Counter)
+    categories: Counter[str] = field(default_factory=Counter)
+
+    @property
+    def size(self) -> int:
+        return sum(layer.size for layer in self.layers)
+
+
+def _manifest(archive: OciArchive) -> dict:
+    descriptor = archive.index()["manifests"][0]
+    manifest = json.loads(archive.blob(descriptor["digest"]))
+    # Multi-platform rocks list one manifest per platform
+    while manifest.get("mediaType") in INDEX_TYPES:
+        descriptor = manifest["manifests"][0]
+        manifest = json.loads(archive.blob(descriptor["digest"]))
+    return manifest
+
+
+def _directory(path: str, depth: int) -> str:
+    parents = PurePosixPath(path).parent.parts[:depth]
+    return "/".join(parents) or "/"
+
+
+def analyse(rock_path: Path, depth: int = 2) -> RockUsage:
+    """Sum the size of the files in each layer of a rock, by directory
+    ``depth`` levels deep and by slimmable category."""
+    usage = RockUsage()
+    with OciArchive(rock_path) as archive:
+        for descriptor in _manifest(archive)["layers"]:
+            layer = LayerUsage(
+                descriptor["digest"],
+                descriptor.get("mediaType", ""),
+                descriptor["size"],
+            )
+            blob, _ = archive.open_blob(descriptor["digest"])
+            # Stream mode detects compressed layers by themselves
+            with tarfile.open(fileobj=blob, mode="r|*") as tar:
+                for member in tar:
+                    if not member.isfile():
+                        continue
+                    path = member.name.removeprefix("./")
+                    layer.size += member.size
+                    layer.files += 1
+                    usage.directories[_directory(path, depth)] += member.size
+                    category = slimmable_category(path)
+                    if category is not None:
+                        usage.categories[category] += member.size
+            usage.layers.append(layer)
+    return usage
@@ -0,0 +1,352 @@
+"""
+Tools for pushing built rocks to an OCI registry that the k8s nodes can pull
+from, as an alternative to importing them into containerd with ``ctr``.
+
+Only blobs which the registry does not already have are uploaded. Blobs that
+heliostat has previously pushed to another repository on the same registry
+are cross-repo mounted instead of uploaded again.
+"""
+
+from __future__ import annotations
+
+import json
+import re
+import shutil
+import subprocess
+import tarfile
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import IO, TYPE_CHECKING, Any
+from urllib.parse import urljoin
+
+import msgspec
+
+from heliostat.fetch import cache_dir
+from heliostat.trace import span
+
+if TYPE_CHECKING:
+    import requests
+
+DEFAULT_REGISTRY = "localhost:5000"
+REGISTRY_IMAGE = "docker.io/library/registry:2"
+REGISTRY_CONTAINER = "heliostat-registry"
+
+OCI_INDEX = "application/vnd.oci.image.index.v1+json"
+OCI_MANIFEST = "application/vnd.oci.image.manifest.v1+json"
+DOCKER_LIST = "application/vnd.docker.distribution.manifest.list.v2+json"
+INDEX_TYPES = {OCI_INDEX, DOCKER_LIST}
+
+TAG_REGEX = re.compile(r"[^A-Za-z0-9_.-]")
+
+
+class OciArchive:
+    """Read access to the OCI image layout stored inside a ``.rock`` file."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._tar = tarfile.open(path, "r")
+
+    def __enter__(self) -> OciArchive:
+        return self
+
+    def __exit__(self, *exc):
+        self._tar.close()
+
+    def _member(self, name: str) -> tarfile.TarInfo:
+        for candidate in (name, f"./{name}"):
+            try:
+                return self._tar.getmember(candidate)
+            except KeyError:
+                continue
+        raise ValueError(f"Failed to find {name} in {self.path}")
+
+    def read(self, name: str) -> bytes:
+        f = self._tar.extractfile(self._member(name))
+        if not f:
+            raise ValueError(f"Failed to extract {name} from {self.path}")
+        return f.read()
+
+    def index(self) -> dict[str, Any]:
+        return json.loads(self.read("index.json"))
+
+    def blob_path(self, digest: str) -> str:
+        algorithm, hexdigest = digest.split(":", 1)
+        return f"blobs/{algorithm}/{hexdigest}"
+
+    def blob(self, digest: str) -> bytes:
+        return self.read(self.blob_path(digest))
+
+    def open_blob(self, digest: str) -> tuple[IO[bytes], int]:
+        member = self._member(self.blob_path(digest))
+        f = self._tar.extractfile(member)
+        if not f:
+            raise ValueError(f"Failed to extract {digest} from {self.path}")
+        return f, member.size
+
+
+@dataclass
+class PushStats:
+    """Summary of the work done while pushing an image."""
+
+    uploaded: int = 0
+    uploaded_bytes: int = 0
+    mounted: int = 0
+    existing: int = 0
+    digests: list[str] = field(default_factory=list)
+
+
+class KnownBlobs:
+    """A local record of which repository each pushed blob lives in.
+
+    The registry API offers no way to ask which repositories hold a blob, so
+    heliostat remembers where it put them in order to cross-repo mount.
+    """
+
+    def __init__(self, registry: str):
+        safe = TAG_REGEX.sub("_", registry)
+        self.path = cache_dir() / "registry" / f"{safe}.json"
+        self._blobs: dict[str, str] | None = None
+
+    @property
+    def blobs(self) -> dict[str, str]:
+        if self._blobs is None:
+            try:
+                self._blobs = msgspec.json.decode(
+                    self.path.read_bytes(), type=dict[str, str]
+                )
+            except (FileNotFoundError, msgspec.DecodeError):
+                self._blobs = {}
+        return self._blobs
+
+    def get(self, digest: str) -> str | None:
+        return self.blobs.get(digest)
+
+    def add(self, digest: str, repository: str):
+        self.blobs[digest] = repository
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.path.write_bytes(msgspec.json.encode(self.blobs))
+
+
+class Registry:
+    """A minimal client for the OCI distribution API."""
+
+    def __init__(self, host: str = DEFAULT_REGISTRY, insecure: bool = False):
+        self.host = host
+        scheme = "http" if insecure else "https"
+        self.base = f"{scheme}://{host}/v2/"
+        import requests
+
+        self.session = requests.Session()
+        self.known = KnownBlobs(host)
+
+    def _url(self, path: str) -> str:
+        return urljoin(self.base, path)
+
+    def has_blob(self, repository: str, digest: str) -> bool:
+        response = self.session.head(self._url(f"{repository}/blobs/{digest}"))
+        if response.status_code == 404:
+            return False
+        response.raise_for_status()
+        return True
+
+    def _start_upload(
+        self, repository: str, params: dict[str, str] | None = None
+    ) -> requests.Response:
+        response = self.session.post(
+            self._url(f"{repository}/blobs/uploads/"), params=params
+        )
+        response.raise_for_status()
+        return response
+
+    def mount_blob(
+        self, repository: str, digest: str, source: str
+    ) -> str | None:
+        """Attempt to mount ``digest`` from ``source`` into ``repository``.
+
+        Returns ``None`` if the blob was mounted, otherwise the location of
+        the upload session that the registry opened instead.
+        """
+        response = self._start_upload(
+            repository, params={"mount": digest, "from": source}
+        )
+        if response.status_code == 201:
+            return None
+        return urljoin(self.base, response.headers["Location"])
+
+    def upload_blob(
+        self,
+        repository: str,
+        digest: str,
+        data: IO[bytes] | bytes,
+        size: int,
+        location: str | None = None,
+    ):
+        if location is None:
+            response = self._start_upload(repository)
+            location = urljoin(self.base, response.headers["Location"])
+        response = self.session.put(
+            location,
+            params={"digest": digest},
+            data=data,
+            headers={
+                "Content-Type": "application/octet-stream",
+                "Content-Length": str(size),
+            },
+        )
+        response.raise_for_status()
+
+    def put_manifest(
+        self, repository: str, reference: str, data: bytes, media_type: str
+    ):
+        response = self.session.put(
+            self._url(f"{repository}/manifests/{reference}"),
+            data=data,
+            headers={"Content-Type": media_type},
+        )
+        response.raise_for_status()
+
+    def ensure_blob(
+        self,
+        repository: str,
+        archive: OciArchive,
+        digest: str,
+        stats: PushStats,
+    ):
+        if self.has_blob(repository, digest):
+            stats.existing += 1
+            self.known.add(digest, repository)
+            return
+
+        location = None
+        source = self.known.get(digest)
+        if source is not None and source != repository:
+            location = self.mount_blob(repository, digest, source)
+            if location is None:
+                stats.mounted += 1
+                return
+
+        f, size = archive.open_blob(digest)
+        self.upload_blob(repository, digest, f, size, location=location)
+        self.known.add(digest, repository)
+        stats.uploaded += 1
+        stats.uploaded_bytes += size
+
+    def push_manifest(
+        self,
+        repository: str,
+        archive: OciArchive,
+        descriptor: dict[str, Any],
+        stats: PushStats,
+    ):
+        digest = descriptor["digest"]
+        data = archive.blob(digest)
+        manifest = json.loads(data)
+        media_type = descriptor.get("mediaType") or manifest.get("mediaType")
+
+        if media_type in INDEX_TYPES:
+            for child in manifest["manifests"]:
+                self.push_manifest(repository, archive, child, stats)
+        else:
+            for blob in [manifest["config"], *manifest["layers"]]:
+                self.ensure_blob(repository, archive, blob["digest"], stats)
+
+        self.put_manifest(repository, digest, data, media_type or OCI_MANIFEST)
+        stats.digests.append(digest)
+
+    def push(
+        self, rock_path: Path, repository: str, tag: str | None = None
+    ) -> PushStats:
+        """Push every image in the rock to ``repository``.
+
+        The manifests are always pushed by digest, and additionally by
+        ``tag`` when one is given.
+        """
+        stats = PushStats()
+        with (
+            span("registry push", repository=repository),
+            OciArchive(rock_path) as archive,
+        ):
+            for descriptor in archive.index()["manifests"]:
+                self.push_manifest(repository, archive, descriptor, stats)
+                if tag:
+                    media_type = descriptor.get("mediaType", OCI_MANIFEST)
+                    self.put_manifest(
+                        repository,
+                        tag,
+                        archive.blob(descriptor["digest"]),
+                        media_type,
+                    )
+        self.known.save()
+        return stats
+
+
+def rock_tag(rock_path: Path) -> str | None:
+    """Derive an image tag from a ``<name>_<version>_<arch>.rock`` path."""
+    parts = rock_path.stem.split("_")
+    if len(parts) < 2:
+        return None
+    return TAG_REGEX.sub("-", parts[1])[:128]
+
+
+def image_name(rock_name: str, registry: str = DEFAULT_REGISTRY) -> str:
+    return f"{registry}/{rock_name}"
+
+
+def push_rock(
+    rock_path: Path,
+    rock_name: str,
+    registry: str = DEFAULT_REGISTRY,
+    insecure: bool = False,
+) -> PushStats:
+    return Registry(registry, insecure=insecure).push(
+        rock_path, rock_name, tag=rock_tag(rock_path)
+    )
+
+
+def container_engine() -> str:
+    engine = shutil.which("docker") or shutil.which("podman")
+    if engine is None:
+        raise RuntimeError("Neither docker nor podman is available")
+    return engine
+
+
+def start_registry(port: int = 5000) -> str:
+    """Run a local registry container, reusing it if it already exists.
+
+    Returns the host and port the registry is published on, which for an
+    existing container may differ from ``port``.
+    """
+    engine = container_engine()
+    running = subprocess.check_output(
+        [
+            engine,
+            "ps",
+            "--all",
+            "--quiet",
+            "--filter",
+            f"name=^{REGISTRY_CONTAINER}$",
+        ]
+    ).strip()
+    if running:
+        subprocess.check_call([engine, "start", REGISTRY_CONTAINER])
+    else:
+        subprocess.check_call(
+            [
+                engine,
+                "run",
+                "--detach",
+                "--restart=always",
+                "--publish",
+                f"{port}:5000",
+                "--name",
+                REGISTRY_CONTAINER,
+                REGISTRY_IMAGE,
+            ]
+        )
+    published = subprocess.check_output(
+        [engine, "port", REGISTRY_CONTAINER, "5000/tcp"], text=True
+    )
+    # e.g. "0.0.0.0:5000" and "[::]:5000", one line per address
+    return f"localhost:{published.split()[0].rsplit(':', 1)[1]}"
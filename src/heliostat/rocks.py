@@ -2,16 +2,26 @@ from __future__ import annotations
 
 import copy
 import itertools
+import multiprocessing
+import os
+import threading
+import time
 from collections.abc import Iterable
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Any, Literal, Protocol, Self
+from typing import Any, ClassVar, Literal, Protocol
 
 import msgspec
-from ruamel.yaml import YAML
 
+from heliostat.catalog import (
+    RockRecord,
+    load_catalog,
+    save_catalog,
+)
 from heliostat.component import package_list
-from heliostat.fetch import ensure_repo
+from heliostat.fetch import ensure_repo, repo_commit
+from heliostat.trace import span
 from heliostat.types import Base, Release, Series
 
 
@@ -113,6 +123,15 @@ PackageRepository = (
 )
 
 
+def package_repository(repo: dict[str, Any]) -> PackageRepository:
+    if "ppa" in repo:
+        return msgspec.convert(repo, PpaPackageRepository)
+    elif "cloud" in repo:
+        return msgspec.convert(repo, CloudPackageRepository)
+    else:
+        return msgspec.convert(repo, DebPackageRepository)
+
+
 class RockcraftFile:
     """A rockcraft file for a sunbeam rock."""
 
@@ -125,12 +144,7 @@ class RockcraftFile:
 
     def repositories(self) -> Iterable[PackageRepository]:
         for repo in self.yaml.get(self.REPO_KEY, []):
-            if "ppa" in repo:
-                yield msgspec.convert(repo, PpaPackageRepository)
-            elif "cloud" in repo:
-                yield msgspec.convert(repo, CloudPackageRepository)
-            else:
-                yield msgspec.convert(repo, DebPackageRepository)
+            yield package_repository(repo)
 
     def patch(self, patches: Iterable[Patch]) -> RockcraftFile:
         yaml = copy.deepcopy(self.yaml)
@@ -146,19 +160,113 @@ class RockcraftFile:
 
         return deps
 
+    def base(self) -> str | None:
+        return self.yaml.get(self.BASE_KEY)
+
+    def version(self) -> str | None:
+        version = self.yaml.get(self.VERSION_KEY)
+        return None if version is None else str(version)
+
+
+def rock_family(name: str) -> str:
+    """The family of rocks built from the same project, e.g. ``cinder`` for
+    ``cinder-api`` and ``cinder-consolidated``."""
+    return name.split("-")[0]
+
+
+class RockInfo(msgspec.Struct):
+    name: str
+    family: str
+    base: str | None
+    version: str | None
+    repositories: list[PackageRepository]
+    deps: list[str]
+
+    @classmethod
+    def from_record(cls, record: RockRecord) -> RockInfo:
+        return cls(
+            record.name,
+            record.family,
+            record.base,
+            record.version,
+            [package_repository(repo) for repo in record.repositories],
+            record.deps,
+        )
+
+
+def rock_record(name: str, rockcraft: RockcraftFile) -> RockRecord:
+    return RockRecord(
+        name,
+        rock_family(name),
+        rockcraft.base(),
+        rockcraft.version(),
+        # Plain values rather than ruamel's, for encoding
+        msgspec.json.decode(
+            msgspec.json.encode(rockcraft.yaml.get(RockcraftFile.REPO_KEY, []))
+        ),
+        sorted(rockcraft.deps()),
+    )
+
+
+# Below this many rocks, parsing them in this process beats starting workers
+PARALLEL_CATALOG_MIN = 32
+
+_catalog_pool: ProcessPoolExecutor | None = None
+_catalog_pool_lock = threading.Lock()
+
+
+def _cores() -> int:
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def _get_catalog_pool() -> ProcessPoolExecutor:
+    """A pool of one worker per core, shared by every repo being indexed."""
+    global _catalog_pool
+    with _catalog_pool_lock:
+        if _catalog_pool is None:
+            # Threads may be running, e.g. under `heliostat prefetch`, so
+            # fork workers off a server process instead of this one
+            context = multiprocessing.get_context("forkserver")
+            context.set_forkserver_preload([__name__])
+            _catalog_pool = ProcessPoolExecutor(_cores(), mp_context=context)
+        return _catalog_pool
+
+
+def _encoded_record(rock_dir: Path) -> bytes:
+    """Parse a rock in a worker, returning its record in compact form."""
+    rock = SunbeamRock(rock_dir)
+    return msgspec.msgpack.encode(
+        rock_record(rock.name, rock.rockcraft_yaml())
+    )
+
 
 class SunbeamRock:
     def __init__(self, path: Path):
         self.path = path
+        self._parsed: tuple[tuple[int, int], RockcraftFile] | None = None
 
     @property
     def name(self) -> str:
         return self.path.name
 
     def rockcraft_yaml(self) -> RockcraftFile:
-        yaml = YAML()
-        obj = yaml.load((self.path / "rockcraft.yaml").read_text())
-        return RockcraftFile(obj)
+        """Parse the rockcraft.yaml, reusing the last parse if unchanged."""
+        rockcraft_path = self.path / "rockcraft.yaml"
+        stat = rockcraft_path.stat()
+        key = (stat.st_mtime_ns, stat.st_size)
+        if self._parsed is not None and self._parsed[0] == key:
+            return self._parsed[1]
+
+        from ruamel.yaml import YAML
+
+        with span("parse rockcraft.yaml", rock=self.name):
+            yaml = YAML()
+            obj = yaml.load(rockcraft_path.read_text())
+        rockcraft = RockcraftFile(obj)
+        self._parsed = (key, rockcraft)
+        return rockcraft
 
 
 class SunbeamRockRepo:
@@ -183,15 +291,44 @@ class SunbeamRockRepo:
         Release.FLAMINGO: "main",
     }
 
+    # How long an ensured repo may be reused before fetching again. The CLI
+    # always fetches, long-running processes like ``heliostat serve`` raise
+    # this to keep repos warm between requests.
+    REFRESH_INTERVAL: ClassVar[float] = 0.0
+
+    _ensured: ClassVar[dict[str, tuple[float, SunbeamRockRepo]]] = {}
+
     @classmethod
-    def ensure(cls, release: Release = Release.default()) -> Self:
-        local_path = ensure_repo(
-            cls.REPO_URI, branch=cls.RELEASE_BRANCH.get(release, "main")
-        )
-        return cls(local_path)
+    def ensure(
+        cls, release: Release = Release.default(), fetch: bool = True
+    ) -> SunbeamRockRepo:
+        branch = cls.RELEASE_BRANCH.get(release, "main")
+        cached = cls._ensured.get(branch)
+        if (
+            cached is not None
+            and time.monotonic() - cached[0] < cls.REFRESH_INTERVAL
+        ):
+            return cached[1]
+
+        local_path = ensure_repo(cls.REPO_URI, branch=branch, fetch=fetch)
+        if cached is not None and cached[1].path == local_path:
+            repo = cached[1]
+            repo._catalog = None
+        else:
+            repo = cls(local_path)
+        cls._ensured[branch] = (time.monotonic(), repo)
+        return repo
 
     def __init__(self, path: Path):
         self.path = path
+        self._rocks: dict[Path, SunbeamRock] = {}
+        self._catalog: dict[str, RockRecord] | None = None
+
+    def _rock(self, rock_dir: Path) -> SunbeamRock:
+        rock = self._rocks.get(rock_dir)
+        if rock is None:
+            rock = self._rocks[rock_dir] = SunbeamRock(rock_dir)
+        return rock
 
     def _matching_rocks(
         self, names: set[str] | None = None
@@ -199,15 +336,15 @@ class SunbeamRockRepo:
         """Yield all rocks, optionally filtered by name."""
         for rock_dir in sorted((self.path / "rocks").iterdir()):
             if names is None or rock_dir.name in names:
-                yield SunbeamRock(rock_dir)
+                yield self._rock(rock_dir)
 
     def _consolidate(
         self, rocks: Iterable[SunbeamRock]
     ) -> Iterable[SunbeamRock]:
         """Prefer ``-consolidated`` variants when multiple rocks share"""
         """a prefix."""
-        for _prefix, group in itertools.groupby(
-            rocks, key=lambda r: r.name.split("-")[0]
+        for _family, group in itertools.groupby(
+            rocks, key=lambda r: rock_family(r.name)
         ):
             family = list(group)
             consolidated_rock = next(
@@ -232,6 +369,44 @@ class SunbeamRockRepo:
             raise ValueError(f"No rock found with name '{name}'")
         return result[0]
 
+    def commit(self) -> str | None:
+        """The upstream commit the rocks are read from."""
+        return repo_commit(self.path)
+
+    def catalog(self) -> dict[str, RockRecord]:
+        """The dependencies of every rock, shared on disk by commit."""
+        if self._catalog is not None:
+            return self._catalog
+
+        commit = self.commit()
+        catalog = load_catalog(commit) if commit else None
+        if catalog is None:
+            with span("build catalog"):
+                catalog = {
+                    record.name: record for record in self._parse_records()
+                }
+            if commit:
+                save_catalog(commit, catalog.values())
+        self._catalog = catalog
+        return catalog
+
+    def _parse_records(self) -> list[RockRecord]:
+        rocks = list(self.rocks())
+        if len(rocks) < PARALLEL_CATALOG_MIN or _cores() == 1:
+            return [
+                rock_record(rock.name, rock.rockcraft_yaml()) for rock in rocks
+            ]
+        decoder = msgspec.msgpack.Decoder(RockRecord)
+        chunksize = max(1, len(rocks) // (4 * _cores()))
+        return [
+            decoder.decode(data)
+            for data in _get_catalog_pool().map(
+                _encoded_record,
+                [rock.path for rock in rocks],
+                chunksize=chunksize,
+            )
+        ]
+
     def rocks_for_packages(
         self,
         *sources: str,
@@ -239,11 +414,22 @@ class SunbeamRockRepo:
         release: Release,
         consolidated: bool = False,
     ) -> Iterable[SunbeamRock]:
-        binpkgs = set(
-            package_list(list(sources), series=series, release=release)
-        )
+        if not sources:
+            return iter(())
+        with span("package_list", sources=",".join(sources)):
+            binpkgs = set(
+                package_list(list(sources), series=series, release=release)
+            )
+        return self.rocks_for_binaries(binpkgs, consolidated=consolidated)
+
+    def rocks_for_binaries(
+        self, binpkgs: Iterable[str], consolidated: bool = False
+    ) -> Iterable[SunbeamRock]:
+        """The rocks which install any of the binary packages ``binpkgs``."""
+        binpkgs = set(binpkgs)
+        catalog = self.catalog()
         return (
             rock
             for rock in self.rocks(consolidated=consolidated)
-            if rock.rockcraft_yaml().deps().intersection(binpkgs)
+            if binpkgs.intersection(catalog[rock.name].deps)
         )
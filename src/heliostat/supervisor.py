@@ -0,0 +1,236 @@
+"""
+Output capture for the commands of concurrent builds.
+
+Commands run for a build while its ``BuildLog`` is captured (``rockcraft
+pack``, locally or over SSH) are run by one asyncio event loop, which reads
+the output of all of them as it comes. Each build's output goes to a
+gzip-compressed log under ``cache_dir()/logs`` and to a ring buffer of its
+last lines, so running builds do not mix their output on the terminal, a
+live status view can show what each is doing, and a failed build can show
+where it went wrong.
+"""
+
+from __future__ import annotations
+
+import gzip
+import os
+import re
+import subprocess
+import threading
+import time
+from collections import deque
+from collections.abc import Callable, Generator, Sequence
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from heliostat.fetch import cache_dir
+
+if TYPE_CHECKING:
+    from rich.table import Table
+
+# Lines of output kept in memory for each build
+LOG_TAIL_LINES = 200
+
+_LINE_END = re.compile(rb"\r\n|\r|\n")
+
+
+def logs_dir() -> Path:
+    return cache_dir() / "logs"
+
+
+class BuildLog:
+    """The output and progress of the build of one rock."""
+
+    def __init__(
+        self, rock_name: str, echo: Callable[[str], None] | None = None
+    ):
+        self.rock_name = rock_name
+        # Also pass each line on, e.g. to the terminal
+        self.echo = echo
+        self.path = (
+            logs_dir()
+            / rock_name
+            / f"{datetime.now():%Y%m%d-%H%M%S}-{os.getpid()}.log.gz"
+        )
+        self.tail: deque[str] = deque(maxlen=LOG_TAIL_LINES)
+        self.state = "queued"
+        self.builder: str | None = None
+        self.started: float | None = None
+        self.finished: float | None = None
+        self._file: gzip.GzipFile | None = None
+        self._lock = threading.Lock()
+
+    @property
+    def elapsed(self) -> float | None:
+        if self.started is None:
+            return None
+        return (self.finished or time.monotonic()) - self.started
+
+    def open(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = gzip.open(self.path, "wb")
+        self.state = "building"
+        self.started = time.monotonic()
+
+    def close(self, state: str):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+        self.state = state
+        self.finished = time.monotonic()
+
+    def write(self, line: bytes):
+        with self._lock:
+            if self._file is not None:
+                self._file.write(line + b"\n")
+        text = line.decode("utf-8", errors="replace").rstrip()
+        self.tail.append(text)
+        if self.echo is not None:
+            self.echo(text)
+
+
+_current_log: ContextVar[BuildLog | None] = ContextVar(
+    "current_log", default=None
+)
+
+
+def current_log() -> BuildLog | None:
+    return _current_log.get()
+
+
+@contextmanager
+def capture(log: BuildLog) -> Generator[BuildLog]:
+    """Send the output of the commands run by ``call`` in this thread to
+    ``log`` until the block exits."""
+    log.open()
+    token = _current_log.set(log)
+    state = "failed"
+    try:
+        yield log
+        state = "done"
+    finally:
+        _current_log.reset(token)
+        log.close(state)
+
+
+def note(message: str):
+    """Add a line about the build from heliostat itself to the log being
+    captured, if any."""
+    log = current_log()
+    if log is not None:
+        log.write(message.encode())
+
+
+class _Supervisor:
+    """An event loop, in a thread of its own, running captured commands."""
+
+    def __init__(self):
+        # asyncio is slow to import, so only pay for it when building
+        import asyncio
+
+        self.loop = asyncio.new_event_loop()
+        threading.Thread(
+            target=self.loop.run_forever, name="supervisor", daemon=True
+        ).start()
+
+    async def _run(
+        self, argv: Sequence[str], cwd: Path | None, log: BuildLog
+    ) -> int:
+        import asyncio
+
+        process = await asyncio.create_subprocess_exec(
+            *argv,
+            cwd=cwd,
+            stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.STDOUT,
+        )
+        assert process.stdout is not None
+        pending = b""
+        # Read chunks rather than lines, as progress bars may redraw a
+        # single line for a long time
+        while chunk := await process.stdout.read(1 << 16):
+            *lines, pending = _LINE_END.split(pending + chunk)
+            for line in lines:
+                log.write(line)
+        if pending:
+            log.write(pending)
+        return await process.wait()
+
+    def run(self, argv: Sequence[str], cwd: Path | None, log: BuildLog) -> int:
+        import asyncio
+
+        future = asyncio.run_coroutine_threadsafe(
+            self._run(argv, cwd, log), self.loop
+        )
+        return future.result()
+
+
+_supervisor: _Supervisor | None = None
+_supervisor_lock = threading.Lock()
+
+
+def call(argv: Sequence[str], cwd: Path | None = None) -> int:
+    """Run a command of a build and return its exit code.
+
+    Its output goes to the log being captured, if any, and otherwise
+    straight to the terminal.
+    """
+    log = current_log()
+    if log is None:
+        return subprocess.call(argv, cwd=cwd)
+
+    global _supervisor
+    with _supervisor_lock:
+        if _supervisor is None:
+            _supervisor = _Supervisor()
+    return _supervisor.run(argv, cwd, log)
+
+
+def _format_elapsed(seconds: float | None) -> str:
+    if seconds is None:
+        return ""
+    minutes, seconds = divmod(int(seconds), 60)
+    return f"{minutes}:{seconds:02d}"
+
+
+class StatusBoard:
+    """A live table of the state and last line of output of each build."""
+
+    STYLES = {"building": "cyan", "done": "green", "failed": "bold red"}
+
+    def __init__(self, logs: list[BuildLog]):
+        self.logs = logs
+
+    def render(self) -> Table:
+        from rich.table import Table
+        from rich.text import Text
+
+        counts = {
+            state: sum(log.state == state for log in self.logs)
+            for state in ("queued", "building", "done", "failed")
+        }
+        table = Table(
+            title=", ".join(f"{n} {state}" for state, n in counts.items()),
+            expand=True,
+        )
+        table.add_column("Rock", no_wrap=True)
+        table.add_column("State", no_wrap=True)
+        table.add_column("Builder", no_wrap=True)
+        table.add_column("Time", justify="right", no_wrap=True)
+        table.add_column("Output", no_wrap=True, overflow="ellipsis", ratio=1)
+        # Running and failed builds first, then those still to come
+        order = {"building": 0, "failed": 1, "queued": 2, "done": 3}
+        for log in sorted(self.logs, key=lambda log: order[log.state]):
+            table.add_row(
+                log.rock_name,
+                Text(log.state, style=self.STYLES.get(log.state, "")),
+                log.builder or "",
+                _format_elapsed(log.elapsed),
+                log.tail[-1] if log.tail and log.state == "building" else "",
+            )
+        return table
@@ -0,0 +1,147 @@
+"""
+Lightweight tracing of where heliostat spends its time.
+
+Spans are recorded as Chrome trace-event "complete" events, which can be
+loaded into ``chrome://tracing`` or https://ui.perfetto.dev. Tracing is off
+unless :func:`enable` is called, in which case :func:`span` is close to free.
+"""
+
+from __future__ import annotations
+
+import functools
+import json
+import os
+import threading
+import time
+from collections.abc import Callable, Generator
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any
+
+
+@dataclass
+class Span:
+    name: str
+    start_ns: int
+    duration_ns: int
+    thread: int
+    args: dict[str, Any] = field(default_factory=dict)
+
+
+class Tracer:
+    def __init__(self):
+        self.spans: list[Span] = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name: str, **args: Any) -> Generator[None]:
+        start = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter_ns() - start
+            with self._lock:
+                self.spans.append(
+                    Span(
+                        name, start, duration, threading.get_native_id(), args
+                    )
+                )
+
+    def events(self) -> list[dict[str, Any]]:
+        origin = min((s.start_ns for s in self.spans), default=0)
+        pid = os.getpid()
+        return [
+            {
+                "name": s.name,
+                "ph": "X",
+                "ts": (s.start_ns - origin) / 1000,
+                "dur": s.duration_ns / 1000,
+                "pid": pid,
+                "tid": s.thread,
+                "args": {k: str(v) for k, v in s.args.items()},
+            }
+            for s in sorted(self.spans, key=lambda s: s.start_ns)
+        ]
+
+    def write(self, path: Path):
+        path.write_text(
+            json.dumps({"traceEvents": self.events(), "displayTimeUnit": "ms"})
+        )
+
+    def summary(self) -> list[tuple[str, int, float, float]]:
+        """Return ``(name, count, total, max)`` rows, slowest first."""
+        totals: dict[str, list[float]] = {}
+        for s in self.spans:
+            totals.setdefault(s.name, []).append(s.duration_ns / 1e9)
+        rows = [
+            (name, len(durations), sum(durations), max(durations))
+            for name, durations in totals.items()
+        ]
+        return sorted(rows, key=lambda row: row[2], reverse=True)
+
+
+_tracer: Tracer | None = None
+
+
+def enable() -> Tracer:
+    global _tracer
+    _tracer = Tracer()
+    return _tracer
+
+
+def disable() -> Tracer | None:
+    global _tracer
+    tracer, _tracer = _tracer, None
+    return tracer
+
+
+def current() -> Tracer | None:
+    return _tracer
+
+
+@contextmanager
+def span(name: str, **args: Any) -> Generator[None]:
+    """Record the enclosed block as a span if tracing is enabled."""
+    if _tracer is None:
+        yield
+        return
+    with _tracer.span(name, **args):
+        yield
+
+
+def traced[**P, R](name: str) -> Callable[[Callable[P, R]], Callable[P, R]]:
+    """Decorator recording every call to the function as a span."""
+
+    def decorator(func: Callable[P, R]) -> Callable[P, R]:
+        @functools.wraps(func)
+        def wrapper(*args: P.args, **kwargs: P.kwargs) -> R:
+            with span(name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def print_summary(tracer: Tracer, limit: int = 15):
+    from rich.console import Console
+    from rich.table import Table
+
+    table = Table(title="heliostat trace summary")
+    table.add_column("Phase")
+    table.add_column("Calls", justify="right")
+    table.add_column("Total (s)", justify="right")
+    table.add_column("Max (s)", justify="right")
+    for name, count, total, longest in tracer.summary()[:limit]:
+        table.add_row(name, str(count), f"{total:.3f}", f"{longest:.3f}")
+    Console(stderr=True).print(table)
+
+
+def finish(path: Path):
+    """Stop tracing, write the trace to ``path`` and print a summary."""
+    tracer = disable()
+    if tracer is None:
+        return
+    tracer.write(path)
+    print_summary(tracer)
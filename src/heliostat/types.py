@@ -18,6 +18,26 @@ class Release(StrEnum):
     def default(cls) -> Release:
         return cls.EPOXY
 
+    def version(self) -> str:
+        """The OpenStack version, which is also the track of the charms."""
+        match self:
+            case Release.YOGA | Release.ZED:
+                return str(self)
+            case Release.ANTELOPE:
+                return "2023.1"
+            case Release.BOBCAT:
+                return "2023.2"
+            case Release.CARACAL:
+                return "2024.1"
+            case Release.DALMATIAN:
+                return "2024.2"
+            case Release.EPOXY:
+                return "2025.1"
+            case Release.FLAMINGO:
+                return "2025.2"
+            case Release.GAZPACHO:
+                return "2026.1"
+
 
 class Series(StrEnum):
     JAMMY = "jammy"
@@ -60,3 +80,9 @@ class Pocket(StrEnum):
     @classmethod
     def default(cls) -> Pocket:
         return cls.UPDATES
+
+
+class OutputFormat(StrEnum):
+    TEXT = "text"
+    JSON = "json"
+    JSONL = "jsonl"
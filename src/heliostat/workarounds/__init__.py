@@ -1,9 +1,12 @@
 from heliostat.rocks import SunbeamRock
 from heliostat.types import Release, Series
 
+from .slim import SlimRock
 from .workaround import Workaround
 from .wsgi import WSGIShim
 
+__all__ = ["SlimRock", "Workaround", "WSGIShim", "get_workarounds"]
+
 
 def get_workarounds(
     rock: SunbeamRock, release: Release, series: Series
@@ -0,0 +1,216 @@
+"""Tests for the build queue shared by everyone on a host."""
+
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import pytest
+import typer
+
+from heliostat.buildqueue import BuildQueue, Server
+from heliostat.cli.rock import do_build
+from heliostat.executors import (
+    BuildError,
+    QueueExecutor,
+    build_queue_path,
+    parse_builder,
+)
+from heliostat.rocks import RockcraftFile
+from heliostat.supervisor import BuildLog
+
+
+class FakeExecutor:
+    name = "fake"
+
+    def __init__(self):
+        self.builds: list[str] = []
+        self.running = 0
+        self.most_running = 0
+        self.lock = threading.Lock()
+
+    def pack(self, rock_name: str, build_dir: Path) -> list[Path]:
+        with self.lock:
+            self.builds.append(rock_name)
+            self.running += 1
+            self.most_running = max(self.most_running, self.running)
+        time.sleep(0.2)
+        with self.lock:
+            self.running -= 1
+        text = (build_dir / "rockcraft.yaml").read_text()
+        if "fail" in text:
+            raise BuildError(f"rockcraft pack failed for {rock_name}", 3)
+        rock = build_dir / f"{rock_name}_1.0_amd64.rock"
+        rock.write_text(f"rock {text}")
+        return [rock]
+
+
+@pytest.fixture
+def queue(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    (tmp_path / "tmp").mkdir()
+    monkeypatch.setattr(tempfile, "tempdir", str(tmp_path / "tmp"))
+    executor = FakeExecutor()
+    path = tmp_path / "queue.sock"
+    server = Server(path, BuildQueue(jobs=1, executor=executor))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield path, executor
+    server.shutdown()
+    server.server_close()
+
+
+def build_dir(path: Path, rockcraft: str) -> Path:
+    path.mkdir(parents=True)
+    (path / "rockcraft.yaml").write_text(rockcraft)
+    return path
+
+
+def pack_all(path: Path, builds: list[tuple[str, Path]]) -> list:
+    results: list = [None] * len(builds)
+
+    def pack(i: int, rock_name: str, directory: Path):
+        try:
+            results[i] = QueueExecutor(path).pack(rock_name, directory)
+        except BuildError as e:
+            results[i] = e
+
+    threads = [
+        threading.Thread(target=pack, args=(i, *build))
+        for i, build in enumerate(builds)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_identical_builds_are_built_once(queue, tmp_path):
+    path, executor = queue
+    builds = [
+        ("cinder-api", build_dir(tmp_path / f"client{i}", "name: cinder-api"))
+        for i in range(3)
+    ]
+    results = pack_all(path, builds)
+
+    assert executor.builds == ["cinder-api"]
+    for rocks, (_, directory) in zip(results, builds):
+        assert rocks == [directory / "cinder-api_1.0_amd64.rock"]
+        assert rocks[0].read_text() == "rock name: cinder-api"
+    # The build directory is removed once every client has the rocks,
+    # just after the last one was sent them
+    deadline = time.monotonic() + 5
+    while any((tmp_path / "tmp").iterdir()) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert list((tmp_path / "tmp").iterdir()) == []
+
+
+def test_finished_builds_are_built_again(queue, tmp_path):
+    """A repeat build may pick up packages published since, e.g. a new
+    upload to the PPA, so it is not answered with the earlier rocks."""
+    path, executor = queue
+    first = build_dir(tmp_path / "first", "name: cinder-api")
+    QueueExecutor(path).pack("cinder-api", first)
+
+    later = build_dir(tmp_path / "later", "name: cinder-api")
+    assert QueueExecutor(path).pack("cinder-api", later)
+    assert executor.builds == ["cinder-api", "cinder-api"]
+
+
+def test_distinct_builds_share_the_concurrency_limit(queue, tmp_path):
+    path, executor = queue
+    results = pack_all(
+        path,
+        [
+            ("cinder-api", build_dir(tmp_path / "a", "name: cinder-api")),
+            ("nova-api", build_dir(tmp_path / "b", "name: nova-api")),
+        ],
+    )
+    assert sorted(executor.builds) == ["cinder-api", "nova-api"]
+    assert executor.most_running == 1
+    assert all(isinstance(rocks, list) for rocks in results)
+
+
+def test_failed_build_reaches_every_client_and_is_retried(queue, tmp_path):
+    path, executor = queue
+    builds = [
+        ("cinder-api", build_dir(tmp_path / f"client{i}", "name: fail"))
+        for i in range(2)
+    ]
+    for error in pack_all(path, builds):
+        assert isinstance(error, BuildError)
+        assert error.returncode == 3
+
+    retry = build_dir(tmp_path / "retry", "name: fail")
+    with pytest.raises(BuildError):
+        QueueExecutor(path).pack("cinder-api", retry)
+    assert executor.builds == ["cinder-api", "cinder-api"]
+
+
+def test_socket_is_shared_with_the_group(queue):
+    path, _ = queue
+    assert path.stat().st_mode & 0o777 == 0o660
+
+
+def test_default_socket_is_private(monkeypatch):
+    monkeypatch.delenv("HELIOSTAT_BUILD_QUEUE", raising=False)
+    monkeypatch.setenv("XDG_RUNTIME_DIR", "/run/user/1000")
+    assert build_queue_path() == Path(
+        "/run/user/1000/heliostat-build-queue.sock"
+    )
+    monkeypatch.delenv("XDG_RUNTIME_DIR")
+    assert build_queue_path() == Path("/run/heliostat/build-queue.sock")
+
+
+def test_no_queue_running(tmp_path):
+    directory = build_dir(tmp_path / "build", "name: cinder-api")
+    with pytest.raises(BuildError, match="No build queue"):
+        QueueExecutor(tmp_path / "missing.sock").pack("cinder-api", directory)
+
+
+def test_parse_queue_builder():
+    executor, jobs = parse_builder("queue:///run/heliostat.sock?jobs=4")
+    assert isinstance(executor, QueueExecutor)
+    assert executor.path == Path("/run/heliostat.sock")
+    assert jobs == 4
+
+
+def test_failed_build_is_logged(queue, tmp_path, capsys):
+    path, _ = queue
+    output_dir = tmp_path / "out"
+    output_dir.mkdir()
+    log = BuildLog("cinder-api")
+
+    with pytest.raises(typer.Exit):
+        do_build(
+            "cinder-api",
+            RockcraftFile(yaml={"name": "fail"}),
+            output_dir,
+            [],
+            executor=QueueExecutor(path),
+            log=log,
+        )
+    assert list(log.tail) == [
+        "Build queue: queued",
+        "rockcraft pack failed for cinder-api",
+    ]
+    assert f"Full output in {log.path}" in capsys.readouterr().err
+
+
+def test_unreachable_queue_has_no_log(tmp_path, monkeypatch, capsys):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    log = BuildLog("cinder-api")
+
+    with pytest.raises(typer.Exit):
+        do_build(
+            "cinder-api",
+            RockcraftFile(yaml={"name": "cinder-api"}),
+            tmp_path,
+            [],
+            executor=QueueExecutor(tmp_path / "missing.sock"),
+            log=log,
+        )
+    captured = capsys.readouterr()
+    assert "No build queue" in captured.out
+    assert "Full output" not in captured.err
@@ -0,0 +1,69 @@
+"""Tests for cache accounting and eviction."""
+
+import os
+import time
+
+import pytest
+
+from heliostat import cache
+from heliostat.cache import Category
+
+
+@pytest.fixture
+def cache_root(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path))
+    root = tmp_path / "heliostat"
+    (root / "catalog").mkdir(parents=True)
+    return root
+
+
+def add_file(path, size: int, age_days: float):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(b"x" * size)
+    used = time.time() - age_days * 86400
+    os.utime(path, (used, used))
+
+
+def test_parse_and_format_size():
+    assert cache.parse_size("512") == 512
+    assert cache.parse_size("2K") == 2048
+    assert cache.parse_size("1.5GiB") == 3 << 29
+    assert cache.format_size(3 << 20) == "3.0 MiB"
+    with pytest.raises(ValueError):
+        cache.parse_size("lots")
+
+
+def test_gc_evicts_least_recently_used(cache_root):
+    add_file(cache_root / "catalog" / "old.json", 100, age_days=3)
+    add_file(cache_root / "catalog" / "mid.json", 100, age_days=2)
+    add_file(cache_root / "catalog" / "new.json", 100, age_days=1)
+
+    evicted = cache.gc({Category.CATALOG: 150})
+
+    assert [e.name for e in evicted] == ["old.json", "mid.json"]
+    assert [p.name for p in (cache_root / "catalog").iterdir()] == ["new.json"]
+
+
+def test_gc_uses_cap_from_environment(cache_root, monkeypatch):
+    add_file(cache_root / "indexes" / "abc.data", 100, age_days=2)
+    add_file(cache_root / "indexes" / "abc.parsed.json", 50, age_days=2)
+    add_file(cache_root / "indexes" / "def.data", 100, age_days=1)
+    monkeypatch.setenv("HELIOSTAT_CACHE_MAX_INDEXES", "100")
+
+    [entry] = cache.gc()
+
+    assert entry.name == "abc"
+    assert entry.size == 150
+    assert sorted(p.name for p in (cache_root / "indexes").iterdir()) == [
+        "def.data"
+    ]
+
+
+def test_prune_older_than(cache_root):
+    add_file(cache_root / "catalog" / "old.json", 10, age_days=40)
+    add_file(cache_root / "catalog" / "new.json", 10, age_days=1)
+
+    removed = cache.prune([Category.CATALOG], older_than=30 * 86400)
+
+    assert [e.name for e in removed] == ["old.json"]
+    assert (cache_root / "catalog" / "new.json").exists()
@@ -1,12 +1,19 @@
 """Smoke tests for the heliostat CLI."""
 
-from unittest.mock import MagicMock, patch
+import json
+import time
+from concurrent.futures import CancelledError
+from unittest.mock import MagicMock, call, patch
 
 import pytest
+import typer
 from typer.testing import CliRunner
 
 from heliostat.cli import main
-from heliostat.rocks import RockcraftFile, SunbeamRock
+from heliostat.component import SourcePackage
+from heliostat.history import BuildHistory
+from heliostat.rocks import RockcraftFile, SunbeamRock, rock_record
+from heliostat.types import Release, Series
 
 runner = CliRunner()
 
@@ -48,7 +55,9 @@ CINDER_API_YAML = {
             "overlay-packages": ["sudo", "cinder-api"],
         }
     },
-    "package-repositories": [{"type": "apt", "cloud": "epoxy", "priority": "always"}],
+    "package-repositories": [
+        {"type": "apt", "cloud": "epoxy", "priority": "always"}
+    ],
 }
 
 # Binary packages that cinder source produces
@@ -85,7 +94,7 @@ def mock_repo():
         all_rocks = [mock_cinder_consolidated, mock_cinder_api]
         rocks_by_name = {r.name: r for r in all_rocks}
 
-        def get_rocks(names=None):
+        def get_rocks(names=None, consolidated=False):
             if names is None:
                 return all_rocks
             return [r for r in all_rocks if r.name in names]
@@ -101,12 +110,17 @@ def mock_repo():
 
         # rocks_for_packages returns empty when no sources provided
         mock_instance.rocks_for_packages.return_value = []
+        mock_instance.commit.return_value = "0" * 40
+        mock_instance.catalog.return_value = {
+            rock.name: rock_record(rock.name, rock.rockcraft_yaml())
+            for rock in all_rocks
+        }
 
         yield mock_cls
 
 
 @pytest.fixture
-def mock_package_repo():
+def mock_package_repo(mock_resolve):
     """Mock SunbeamRockRepo for package commands."""
     with patch("heliostat.cli.package.SunbeamRockRepo") as mock_cls:
         mock_instance = MagicMock()
@@ -118,24 +132,33 @@ def mock_package_repo():
         mock_cinder_api = make_mock_rock("cinder-api", CINDER_API_YAML)
 
         all_rocks = [mock_cinder_consolidated, mock_cinder_api]
-        mock_instance.rocks_for_packages.return_value = all_rocks
+        mock_instance.rocks_for_binaries.return_value = all_rocks
 
         yield mock_cls
 
 
 @pytest.fixture
-def mock_package_list():
-    """Mock package_list to return cinder binary packages."""
-    with patch("heliostat.cli.package.package_list") as mock:
-        mock.return_value = CINDER_BINARY_PACKAGES
+def mock_resolve():
+    """Mock resolve to find the cinder binary packages in every target."""
+    with patch("heliostat.cli.package.resolve") as mock:
+        mock.side_effect = lambda sources, targets: {
+            target: {
+                "cinder": SourcePackage("2:26.0.0", CINDER_BINARY_PACKAGES)
+            }
+            for target in targets
+        }
         yield mock
 
 
 @pytest.fixture
-def mock_do_build():
+def mock_do_build(monkeypatch, tmp_path):
     """Mock do_build to avoid running rockcraft subprocess."""
+    # Keep build history out of the real cache, and build records out of
+    # the working tree
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    monkeypatch.chdir(tmp_path)
     with patch("heliostat.cli.rock.do_build") as mock:
-        mock.return_value = None
+        mock.return_value = []
         yield mock
 
 
@@ -190,6 +213,34 @@ class TestRockCommands:
         assert result.exit_code == 0
         assert "CloudPackageRepository" in result.output
 
+    def test_rock_show_all_json(self, mock_repo):
+        """rock show --all --format json describes every rock at once."""
+        result = runner.invoke(
+            main, ["rock", "show", "--all", "--format", "json"]
+        )
+        assert result.exit_code == 0
+        rocks = json.loads(result.output)
+        assert [rock["name"] for rock in rocks] == [
+            "cinder-consolidated",
+            "cinder-api",
+        ]
+        assert rocks[1] == {
+            "name": "cinder-api",
+            "family": "cinder",
+            "base": "ubuntu@24.04",
+            "version": "2024.1",
+            "repositories": [
+                {"type": "apt", "cloud": "epoxy", "priority": "always"}
+            ],
+            "deps": ["cinder-api", "sudo"],
+        }
+        assert mock_repo.ensure.call_count == 1
+
+    def test_rock_show_needs_a_rock(self, mock_repo):
+        """rock show without a name or --all is an error."""
+        result = runner.invoke(main, ["rock", "show"])
+        assert result.exit_code == 2
+
     def test_rock_show_nonexistent(self, mock_repo):
         """rock show with invalid rock name returns error."""
         result = runner.invoke(main, ["rock", "show", "nonexistent-rock"])
@@ -205,17 +256,117 @@ class TestRockCommands:
     def test_rock_patch_with_ppa(self, mock_repo):
         """rock patch --ppa adds PPA to output."""
         result = runner.invoke(
-            main, ["rock", "patch", "cinder-consolidated", "--ppa", "ppa:foo/bar"]
+            main,
+            ["rock", "patch", "cinder-consolidated", "--ppa", "ppa:foo/bar"],
         )
         assert result.exit_code == 0
         assert "foo/bar" in result.output
 
+    def test_rock_patch_slim(self, mock_repo):
+        """rock patch --slim strips docs in the overlay and prime steps."""
+        result = runner.invoke(
+            main, ["rock", "patch", "cinder-consolidated", "--slim"]
+        )
+        assert result.exit_code == 0
+        assert "overlay-script: |" in result.output
+        assert "! -name copyright -delete" in result.output
+        assert "- -usr/share/man" in result.output
+
     def test_rock_build(self, mock_repo, mock_do_build):
         """rock build invokes do_build."""
-        result = runner.invoke(main, ["rock", "build", "--rock", "cinder-consolidated"])
+        result = runner.invoke(
+            main, ["rock", "build", "--rock", "cinder-consolidated"]
+        )
         assert result.exit_code == 0
         mock_do_build.assert_called_once()
 
+    def test_rock_build_dry_run(self, mock_repo, mock_do_build):
+        """rock build --dry-run prints the plan without building."""
+        BuildHistory().record(
+            "cinder-api", Release.EPOXY, Series.NOBLE, 90.0, 1024
+        )
+        result = runner.invoke(
+            main,
+            [
+                "rock",
+                "build",
+                "--rock",
+                "cinder-api",
+                "--rock",
+                "cinder-consolidated",
+                "--dry-run",
+                "-j",
+                "2",
+            ],
+        )
+        assert result.exit_code == 0
+        mock_do_build.assert_not_called()
+        assert "~1m30s" in result.output
+        assert "Estimated finish in 1m30s with 2 jobs" in result.output
+
+    def test_rock_build_records_history(
+        self, mock_repo, mock_do_build, tmp_path
+    ):
+        """Successful builds are recorded for later scheduling."""
+        artifact = tmp_path / "cinder-api_2025.1_amd64.rock"
+        artifact.write_bytes(b"x" * 10)
+        mock_do_build.return_value = [artifact]
+        result = runner.invoke(main, ["rock", "build", "--rock", "cinder-api"])
+        assert result.exit_code == 0
+        history = BuildHistory()
+        assert (
+            history.estimate("cinder-api", Release.EPOXY, Series.NOBLE)
+            is not None
+        )
+        [record] = history.records["cinder-api/epoxy/noble"]
+        assert record.size == 10
+
+    def test_rock_build_failure_stops_pending_builds(
+        self, mock_repo, mock_do_build
+    ):
+        """A failed build in parallel exits 1 without starting more."""
+        extra = [
+            make_mock_rock(name, CINDER_API_YAML)
+            for name in ("cinder-scheduler", "cinder-volume")
+        ]
+        repo = mock_repo.ensure.return_value
+        repo.rocks_for_packages.return_value = extra
+        # Start the failing build first, with the others queued behind it
+        history = BuildHistory()
+        for name, duration in [
+            ("cinder-api", 400.0),
+            ("cinder-consolidated", 300.0),
+            ("cinder-scheduler", 200.0),
+            ("cinder-volume", 100.0),
+        ]:
+            history.record(name, Release.EPOXY, Series.NOBLE, duration, 1024)
+
+        def build(rock_name, *args, **kwargs):
+            if rock_name == "cinder-api":
+                raise typer.Exit(1)
+            time.sleep(0.2)
+            return []
+
+        mock_do_build.side_effect = build
+        result = runner.invoke(
+            main,
+            [
+                "rock",
+                "build",
+                "--rock",
+                "cinder-api",
+                "--rock",
+                "cinder-consolidated",
+                "--source",
+                "cinder",
+                "-j",
+                "2",
+            ],
+        )
+        assert result.exit_code == 1
+        assert not isinstance(result.exception, CancelledError)
+        assert mock_do_build.call_count < 4
+
 
 # =============================================================================
 # Package Command Tests
@@ -229,14 +380,237 @@ class TestPackageCommands:
         assert result.exit_code == 2
         assert "Missing command" in result.output
 
-    def test_package_show(self, mock_package_list):
+    def test_package_show(self, mock_resolve):
         """package show displays binary packages."""
         result = runner.invoke(main, ["package", "show", "cinder"])
         assert result.exit_code == 0
         assert "cinder-api" in result.output
 
+    def test_package_show_jsonl(self, mock_resolve):
+        """package show --format jsonl prints a source and target a line."""
+        result = runner.invoke(
+            main,
+            [
+                "package",
+                "show",
+                "cinder",
+                "nova",
+                "--release",
+                "caracal",
+                "--release",
+                "epoxy",
+                "--format",
+                "jsonl",
+            ],
+        )
+        assert result.exit_code == 0
+        lines = [json.loads(line) for line in result.output.splitlines()]
+        assert [(line["source"], line["release"]) for line in lines] == [
+            ("cinder", "caracal"),
+            ("nova", "caracal"),
+            ("cinder", "epoxy"),
+            ("nova", "epoxy"),
+        ]
+        assert lines[0]["version"] == "2:26.0.0"
+        assert lines[0]["binaries"] == CINDER_BINARY_PACKAGES
+        assert lines[1] == {
+            "source": "nova",
+            "series": "noble",
+            "release": "caracal",
+            "version": None,
+            "binaries": [],
+        }
+
     def test_package_rocks(self, mock_package_repo):
         """package rocks lists rocks containing packages."""
         result = runner.invoke(main, ["package", "rocks", "cinder"])
         assert result.exit_code == 0
         assert "cinder-consolidated" in result.output
+        repo = mock_package_repo.ensure.return_value
+        binpkgs = repo.rocks_for_binaries.call_args[0][0]
+        assert binpkgs == set(CINDER_BINARY_PACKAGES)
+
+    def test_package_rocks_many_releases(self, mock_package_repo):
+        """package rocks lists the rocks of every release under a header."""
+        result = runner.invoke(
+            main,
+            [
+                "package",
+                "rocks",
+                "cinder",
+                "--release",
+                "caracal",
+                "--release",
+                "epoxy",
+                "--series",
+                "jammy",
+                "--series",
+                "noble",
+            ],
+        )
+        assert result.exit_code == 0
+        assert "# caracal/noble" in result.output
+        assert "# epoxy/jammy" in result.output
+        assert result.output.count("cinder-api") == 4
+        # One repo per release, fetched only once
+        assert mock_package_repo.ensure.call_args_list == [
+            call(release=Release.CARACAL, fetch=True),
+            call(release=Release.EPOXY, fetch=False),
+        ]
+
+
+# =============================================================================
+# Tracing Tests
+# =============================================================================
+
+
+class TestTrace:
+    def test_trace_writes_chrome_events(
+        self, mock_repo, mock_do_build, tmp_path
+    ):
+        """--trace writes nested spans and prints a summary."""
+        trace_file = tmp_path / "trace.json"
+        result = runner.invoke(
+            main,
+            [
+                "--trace",
+                str(trace_file),
+                "rock",
+                "build",
+                "--rock",
+                "cinder-api",
+            ],
+        )
+        assert result.exit_code == 0
+        events = json.loads(trace_file.read_text())["traceEvents"]
+        names = {event["name"] for event in events}
+        assert {"heliostat rock", "_get_patched"} <= names
+        assert all(event["ph"] == "X" for event in events)
+        assert "trace summary" in result.output
+
+
+# =============================================================================
+# Metrics Tests
+# =============================================================================
+
+
+class TestMetrics:
+    def test_metrics_textfile(self, mock_repo, mock_do_build, tmp_path):
+        """--metrics writes Prometheus text format for the build."""
+        metrics_file = tmp_path / "heliostat.prom"
+        result = runner.invoke(
+            main,
+            [
+                "--metrics",
+                str(metrics_file),
+                "rock",
+                "build",
+                "--rock",
+                "cinder-api",
+            ],
+        )
+        assert result.exit_code == 0
+        text = metrics_file.read_text()
+        assert "# TYPE heliostat_rock_build_rocks_total counter" in text
+        assert (
+            'heliostat_rock_build_rocks_total{release="epoxy",result="built",'
+            'rock="cinder-api",series="noble"} 1'
+        ) in text
+        assert 'heliostat_run_duration_seconds{command="rock"}' in text
+
+
+# =============================================================================
+# Incremental Build Tests
+# =============================================================================
+
+
+class TestIncrementalBuild:
+    def test_rebuilds_only_when_versions_change(
+        self, mock_repo, mock_do_build, tmp_path
+    ):
+        """rock build --incremental skips rocks with unchanged packages."""
+        output_dir = tmp_path / "out"
+        output_dir.mkdir()
+        artifact = output_dir / "cinder-api_2024.1_amd64.rock"
+        artifact.write_bytes(b"rock")
+        mock_do_build.return_value = [artifact]
+        versions = {"cinder-api": "2:26.0.0-0ubuntu1~cloud0"}
+        args = [
+            "rock",
+            "build",
+            "--rock",
+            "cinder-api",
+            "--output-dir",
+            str(output_dir),
+            "--incremental",
+        ]
+
+        with patch(
+            "heliostat.component.binary_versions", return_value=versions
+        ):
+            result = runner.invoke(main, args)
+            assert "no matching earlier build" in result.output
+            result = runner.invoke(main, args)
+            assert "cinder-api: up to date" in result.output
+        assert mock_do_build.call_count == 1
+
+        versions = {"cinder-api": "2:26.0.0-0ubuntu1~cloud0.1"}
+        with patch(
+            "heliostat.component.binary_versions", return_value=versions
+        ):
+            result = runner.invoke(main, args)
+        assert "cinder-api changed" in result.output
+        assert mock_do_build.call_count == 2
+
+
+class TestOutdated:
+    def test_compares_inputs_of_built_rocks(
+        self, mock_repo, mock_do_build, tmp_path
+    ):
+        """rock outdated reports rocks whose inputs changed since built."""
+        output_dir = tmp_path / "out"
+        output_dir.mkdir()
+        artifact = output_dir / "cinder-api_2024.1_amd64.rock"
+        artifact.write_bytes(b"rock")
+        mock_do_build.return_value = [artifact]
+        result = runner.invoke(
+            main,
+            [
+                "rock",
+                "build",
+                "--rock",
+                "cinder-api",
+                "--output-dir",
+                str(output_dir),
+            ],
+        )
+        assert result.exit_code == 0
+
+        args = ["rock", "outdated", "--output-dir", str(output_dir)]
+        result = runner.invoke(main, args)
+        assert result.exit_code == 0
+        assert result.output == "cinder-api: up to date\n"
+
+        result = runner.invoke(main, [*args, "--slim"])
+        assert result.output == "cinder-api: inputs changed\n"
+
+        result = runner.invoke(main, [*args, "--release", "caracal"])
+        assert result.output == "cinder-api: built for epoxy/noble\n"
+
+        result = runner.invoke(main, [*args, "--ppa", "ppa:foo/bar"])
+        assert result.output == "cinder-api: built with no PPA\n"
+
+        mock_repo.ensure.return_value.commit.return_value = "1" * 40
+        result = runner.invoke(
+            main,
+            [
+                *args,
+                "--rock",
+                "cinder-api",
+                "--rock",
+                "cinder-consolidated",
+                "-q",
+            ],
+        )
+        assert result.output == "cinder-consolidated\ncinder-api\n"
+        assert mock_do_build.call_count == 1
@@ -0,0 +1,307 @@
+"""Tests for downloading and caching package indexes."""
+
+import gzip
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import cast
+
+import pytest
+
+from heliostat import component, fetch
+from heliostat.types import Release, Series
+
+SOURCES = """\
+Package: cinder
+Binary: cinder-api, python3-cinder
+Version: 2:26.0.0-0ubuntu1~cloud0
+Package-List:
+ cinder-api deb net optional arch=all
+ python3-cinder deb python optional arch=all
+"""
+
+
+class FakeArchive(ThreadingHTTPServer):
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), FakeArchiveHandler)
+        self.body = gzip.compress(SOURCES.encode())
+        self.requests = 0
+        self.not_modified = 0
+
+    def url(self, path: str) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}/{path}"
+
+
+class FakeArchiveHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        server = cast(FakeArchive, self.server)
+        server.requests += 1
+        if self.headers.get("If-None-Match") == '"v1"':
+            server.not_modified += 1
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("ETag", '"v1"')
+        self.send_header("Content-Length", str(len(server.body)))
+        self.end_headers()
+        self.wfile.write(server.body)
+
+
+@pytest.fixture
+def archive(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    monkeypatch.setattr(fetch, "OFFLINE", False)
+    component.clear_index_cache()
+    server = FakeArchive()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    component.clear_index_cache()
+
+
+def test_index_revalidated_with_etag(archive):
+    url = archive.url("Sources.gz")
+    expected = {
+        "cinder": component.SourcePackage(
+            "2:26.0.0-0ubuntu1~cloud0", ["cinder-api", "python3-cinder"]
+        )
+    }
+    assert component._load_sources_index(url) == expected
+    assert component._load_sources_index(url) == expected
+    assert archive.requests == 2
+    assert archive.not_modified == 1
+
+
+def test_offline_uses_downloaded_index(archive, monkeypatch):
+    url = archive.url("Sources.gz")
+    component._load_sources_index(url)
+
+    monkeypatch.setattr(fetch, "OFFLINE", True)
+    assert component._load_sources_index(url)["cinder"].binaries == [
+        "cinder-api",
+        "python3-cinder",
+    ]
+    assert archive.requests == 1
+
+    with pytest.raises(RuntimeError, match="offline"):
+        component._download(archive.url("missing/Sources.gz"))
+
+
+def test_unreachable_archive_warns_and_uses_download(archive):
+    url = archive.url("Sources.gz")
+    data = component._download(url)
+    archive.shutdown()
+    archive.server_close()
+
+    with pytest.warns(fetch.StaleCacheWarning, match="Using cached"):
+        assert component._download(url) == data
+
+
+def write_packages(root, path: str, versions: dict[str, str]):
+    index = root / path
+    index.parent.mkdir(parents=True, exist_ok=True)
+    paragraphs = [
+        f"Package: {package}\nVersion: {version}\nArchitecture: all\n"
+        for package, version in versions.items()
+    ]
+    index.write_bytes(gzip.compress("\n".join(paragraphs).encode()))
+
+
+@pytest.fixture
+def mirrors(tmp_path, monkeypatch):
+    """Local file:// mirrors of the archive, cloud archive and PPAs."""
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    for name in ("archive", "uca", "ppa"):
+        (tmp_path / name).mkdir()
+    monkeypatch.setattr(
+        component, "ARCHIVE_BASE_URL", f"file://{tmp_path}/archive/"
+    )
+    monkeypatch.setattr(component, "UCA_BASE_URL", f"file://{tmp_path}/uca/")
+    monkeypatch.setattr(component, "PPA_BASE_URL", f"file://{tmp_path}/ppa/")
+    for suite in ("noble", "noble-updates"):
+        for part in ("main", "universe"):
+            write_packages(
+                tmp_path / "archive",
+                f"{suite}/{part}/binary-amd64/Packages.gz",
+                {},
+            )
+    component.clear_index_cache()
+    yield tmp_path
+    component.clear_index_cache()
+
+
+def test_parse_packages_keeps_newest_version():
+    data = (
+        "Package: cinder-api\nVersion: 2:26.0.0-0ubuntu1\n\n"
+        "Package: cinder-api\nVersion: 2:26.0.0-0ubuntu1.1\n\n"
+        "Package: sudo\nVersion: 1.9.15p5-3ubuntu5\n"
+    )
+    assert component.parse_packages(data) == {
+        "cinder-api": "2:26.0.0-0ubuntu1.1",
+        "sudo": "1.9.15p5-3ubuntu5",
+    }
+
+
+def test_binary_versions_prefers_newest_across_mirrors(mirrors):
+    write_packages(
+        mirrors / "archive",
+        "noble/main/binary-amd64/Packages.gz",
+        {"sudo": "1.9.15p5-3ubuntu5", "tgt": "1:1.0.85-1"},
+    )
+    write_packages(
+        mirrors / "uca",
+        "noble-updates/epoxy/main/binary-amd64/Packages.gz",
+        {"cinder-api": "2:26.0.0-0ubuntu1~cloud0"},
+    )
+    write_packages(
+        mirrors / "ppa",
+        "team/fix/ubuntu/dists/noble/main/binary-amd64/Packages.gz",
+        {"cinder-api": "2:26.0.0-0ubuntu1~cloud0.1"},
+    )
+
+    versions = component.binary_versions(
+        ["cinder-api", "sudo", "missing"],
+        series=Series.NOBLE,
+        release=Release.EPOXY,
+        ppa="team/fix",
+    )
+
+    assert versions == {
+        "cinder-api": "2:26.0.0-0ubuntu1~cloud0.1",
+        "sudo": "1.9.15p5-3ubuntu5",
+    }
+
+
+def write_sources(root, path: str, data: str):
+    index = root / path
+    index.parent.mkdir(parents=True, exist_ok=True)
+    index.write_bytes(gzip.compress(data.encode()))
+
+
+def test_parse_sources_keeps_newest_version():
+    data = (
+        SOURCES.replace("python3-cinder", "cinder-volume")
+        + "\n"
+        + SOURCES.replace("0ubuntu1~cloud0", "0ubuntu2~cloud0")
+    )
+    assert component.parse_sources(data) == {
+        "cinder": component.SourcePackage(
+            "2:26.0.0-0ubuntu2~cloud0",
+            ["cinder-api", "cinder-volume", "python3-cinder"],
+        )
+    }
+
+
+def test_resolve_reads_each_index_once(mirrors, monkeypatch):
+    for series in ("noble", "jammy"):
+        write_sources(
+            mirrors / "uca",
+            f"{series}-updates/epoxy/main/source/Sources.gz",
+            SOURCES,
+        )
+    downloads = []
+    download = component._download
+    monkeypatch.setattr(
+        component,
+        "_download",
+        lambda url: downloads.append(url) or download(url),
+    )
+
+    targets = [
+        component.Target(Series.NOBLE, Release.EPOXY),
+        component.Target(Series.JAMMY, Release.EPOXY),
+    ]
+    resolved = component.resolve(["cinder", "nova", "cinder"], targets * 2)
+
+    assert list(resolved) == targets
+    for found in resolved.values():
+        assert found == {
+            "cinder": component.SourcePackage(
+                "2:26.0.0-0ubuntu1~cloud0", ["cinder-api", "python3-cinder"]
+            )
+        }
+    assert len(downloads) == 2
+
+
+def test_mirror_accepts_urls_and_local_paths(monkeypatch):
+    monkeypatch.setenv("HELIOSTAT_UCA_MIRROR", "/srv/mirror/uca/")
+    assert (
+        component._mirror(
+            "HELIOSTAT_UCA_MIRROR", "https://example.com", "dists/"
+        )
+        == "file:///srv/mirror/uca/dists/"
+    )
+    monkeypatch.setenv("HELIOSTAT_UCA_MIRROR", "http://mirror.lan/ubuntu")
+    assert (
+        component._mirror(
+            "HELIOSTAT_UCA_MIRROR", "https://example.com", "dists/"
+        )
+        == "http://mirror.lan/ubuntu/dists/"
+    )
+    monkeypatch.delenv("HELIOSTAT_UCA_MIRROR")
+    assert (
+        component._mirror("HELIOSTAT_UCA_MIRROR", "https://example.com/")
+        == "https://example.com/"
+    )
+
+
+def test_default_release_resolved_from_mirror_without_madison(
+    mirrors, monkeypatch
+):
+    monkeypatch.setattr(component, "MADISON_URL", None)
+    write_sources(
+        mirrors / "archive",
+        "noble/main/source/Sources.gz",
+        SOURCES.replace("~cloud0", ""),
+    )
+    write_sources(
+        mirrors / "archive",
+        "noble-updates/main/source/Sources.gz",
+        SOURCES.replace("~cloud0", ".1"),
+    )
+    for suite in ("noble", "noble-updates"):
+        write_sources(
+            mirrors / "archive", f"{suite}/universe/source/Sources.gz", ""
+        )
+
+    target = component.Target(Series.NOBLE, Release.CARACAL)
+    assert component.resolve(["cinder", "nova"], [target])[target] == {
+        "cinder": component.SourcePackage(
+            "2:26.0.0-0ubuntu1.1", ["cinder-api", "python3-cinder"]
+        )
+    }
+
+
+def test_archive_indexes_read_once_without_madison(mirrors, monkeypatch):
+    monkeypatch.setattr(component, "MADISON_URL", None)
+    for suite in ("noble", "noble-updates"):
+        for part in ("main", "universe"):
+            path = f"{suite}/{part}/source/Sources.gz"
+            write_sources(mirrors / "archive", path, SOURCES)
+    downloads = []
+    download = component._download
+    monkeypatch.setattr(
+        component,
+        "_download",
+        lambda url: downloads.append(url) or download(url),
+    )
+
+    target = component.Target(Series.NOBLE, Release.CARACAL)
+    sources = ["cinder", *(f"source{i}" for i in range(20))]
+    resolved = component.resolve(sources, [target])
+    assert list(resolved[target]) == ["cinder"]
+    assert len(downloads) == 4
+
+    # Concurrent callers share a single load
+    component.clear_index_cache()
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        indexes = list(
+            pool.map(lambda _: component.archive_index(Series.NOBLE), range(8))
+        )
+    assert all(index is indexes[0] for index in indexes)
+    assert len(downloads) == 8
@@ -0,0 +1,53 @@
+"""Tests for forwarding commands to ``heliostat serve``."""
+
+import io
+import threading
+
+import pytest
+
+from heliostat.client import forward
+from heliostat.daemon import Server
+
+from .test_cli import mock_repo  # noqa: F401
+
+
+@pytest.fixture
+def server(tmp_path):
+    path = tmp_path / "heliostat.sock"
+    server = Server(path)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield path
+    server.shutdown()
+    server.server_close()
+
+
+def test_forward_without_server(tmp_path):
+    assert forward(["rock", "list"], tmp_path / "missing.sock") is None
+
+
+# The server redirects the process-wide sys.stdout while it runs a command,
+# so the client side of these tests writes to its own buffers instead.
+
+
+def test_forward_rock_list(server, mock_repo):  # noqa: F811
+    out = io.StringIO()
+    assert forward(["rock", "list"], server, stdout=out) == 0
+    assert "cinder-consolidated" in out.getvalue()
+
+
+def test_forward_exit_code(server, mock_repo):  # noqa: F811
+    out = io.StringIO()
+    code = forward(["rock", "show", "nonexistent-rock"], server, stdout=out)
+    assert code == 1
+    assert "no rock found" in out.getvalue().lower()
+
+
+def test_forward_rejects_other_commands(server):
+    err = io.StringIO()
+    assert forward(["serve"], server, stderr=err) == 2
+    assert "not supported" in err.getvalue()
+
+
+def test_socket_is_private(server):
+    assert server.stat().st_mode & 0o777 == 0o600
@@ -0,0 +1,139 @@
+"""Tests for local and SSH build executors and the host pool."""
+
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+from heliostat import executors
+from heliostat.executors import (
+    BuildError,
+    HostPool,
+    LocalExecutor,
+    SSHExecutor,
+    parse_builder,
+)
+
+# Runs the remote command locally, like `ssh localhost` would
+FAKE_SSH = """\
+import subprocess, sys
+args = sys.argv[1:]
+while args[0].startswith("-"):
+    args = args[2:]
+sys.exit(subprocess.call(["sh", "-c", args[1]]))
+"""
+
+FAKE_ROCKCRAFT = """\
+import re, sys
+from pathlib import Path
+text = Path("rockcraft.yaml").read_text()
+if "fail" in text:
+    sys.exit(3)
+name = re.search(r"^name: (\\S+)", text, re.M).group(1)
+shim = Path("shim").read_text() if Path("shim").exists() else ""
+Path(f"{name}_1.0_amd64.rock").write_text(f"rock {name} {shim}")
+"""
+
+
+def write_script(path: Path, source: str) -> str:
+    script = path.with_suffix(".py")
+    script.write_text(source)
+    path.write_text(f'#!/bin/sh\nexec {sys.executable} {script} "$@"\n')
+    path.chmod(0o755)
+    return str(path)
+
+
+@pytest.fixture
+def fake_tools(tmp_path, monkeypatch):
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    monkeypatch.setattr(
+        executors, "SSH_BIN", write_script(bin_dir / "ssh", FAKE_SSH)
+    )
+    rockcraft = write_script(bin_dir / "rockcraft", FAKE_ROCKCRAFT)
+    monkeypatch.setattr(executors, "ROCKCRAFT_BIN", rockcraft)
+    return rockcraft
+
+
+def make_build_dir(path: Path, name: str) -> Path:
+    path.mkdir()
+    (path / "rockcraft.yaml").write_text(f"name: {name}\n")
+    (path / "shim").write_text("with-shim")
+    return path
+
+
+def test_local_executor(tmp_path, fake_tools):
+    build_dir = make_build_dir(tmp_path / "build", "cinder-api")
+    [rock] = LocalExecutor().pack("cinder-api", build_dir)
+    assert rock.read_text() == "rock cinder-api with-shim"
+
+
+def test_ssh_executor_round_trip(tmp_path, fake_tools):
+    build_dir = make_build_dir(tmp_path / "build", "cinder-api")
+    executor = SSHExecutor("localhost", rockcraft=fake_tools)
+
+    [rock] = executor.pack("cinder-api", build_dir)
+
+    assert rock.parent == build_dir
+    assert rock.name == "cinder-api_1.0_amd64.rock"
+    assert rock.read_text() == "rock cinder-api with-shim"
+
+
+def test_ssh_executor_failure(tmp_path, fake_tools):
+    build_dir = make_build_dir(tmp_path / "build", "fail")
+    executor = SSHExecutor("localhost", rockcraft=fake_tools)
+    with pytest.raises(BuildError) as error:
+        executor.pack("fail", build_dir)
+    assert error.value.returncode == 3
+
+
+def test_parse_builder():
+    executor, jobs = parse_builder("ssh://ubuntu@builder1:2222?jobs=4")
+    assert isinstance(executor, SSHExecutor)
+    assert (executor.host, executor.port, jobs) == ("ubuntu@builder1", 2222, 4)
+    assert isinstance(parse_builder("local")[0], LocalExecutor)
+    with pytest.raises(ValueError):
+        parse_builder("ftp://builder1")
+    with pytest.raises(ValueError):
+        parse_builder("local?jobs=0")
+
+
+def test_host_pool_limits_each_host():
+    hosts = HostPool([(LocalExecutor("a"), 2), (LocalExecutor("b"), 1)])
+    assert hosts.capacity == 3
+    running: dict[str, int] = {"a": 0, "b": 0}
+    peak: dict[str, int] = {"a": 0, "b": 0}
+    lock = threading.Lock()
+
+    def build():
+        with hosts.acquire() as executor:
+            with lock:
+                running[executor.name] += 1
+                peak[executor.name] = max(
+                    peak[executor.name], running[executor.name]
+                )
+            time.sleep(0.01)
+            with lock:
+                running[executor.name] -= 1
+
+    threads = [threading.Thread(target=build) for _ in range(12)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert peak == {"a": 2, "b": 1}
+
+
+def test_ssh_executor_unreachable_host(tmp_path, fake_tools, monkeypatch):
+    bin_dir = tmp_path / "bin"
+    ssh = write_script(bin_dir / "ssh-down", "import sys\nsys.exit(255)\n")
+    monkeypatch.setattr(executors, "SSH_BIN", ssh)
+    build_dir = make_build_dir(tmp_path / "build", "cinder-api")
+    # More than a pipe buffer, so writing fails once ssh is gone
+    (build_dir / "large").write_bytes(b"x" * (4 << 20))
+
+    with pytest.raises(BuildError) as error:
+        SSHExecutor("localhost").pack("cinder-api", build_dir)
+    assert error.value.returncode == 255
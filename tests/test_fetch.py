@@ -0,0 +1,129 @@
+"""Tests for per-branch worktrees of the rocks repo and for prefetch."""
+
+import subprocess
+
+import pytest
+
+from heliostat import component, fetch, prefetch
+from heliostat.fetch import ensure_repo
+from heliostat.rocks import SunbeamRockRepo
+from heliostat.types import Release, Series
+
+from .test_rocks import ROCKCRAFT, make_repo
+
+
+def git(*args, cwd):
+    subprocess.run(["git", *args], cwd=cwd, check=True, capture_output=True)
+
+
+@pytest.fixture
+def upstream(tmp_path, monkeypatch):
+    """A bare rocks repo with a main and a stable/2024.1 branch."""
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    for who in ("AUTHOR", "COMMITTER"):
+        monkeypatch.setenv(f"GIT_{who}_NAME", "heliostat")
+        monkeypatch.setenv(f"GIT_{who}_EMAIL", "heliostat@example.com")
+
+    work = tmp_path / "work"
+    work.mkdir()
+    git("init", "-b", "main", cwd=work)
+    make_repo(work, 2)
+    git("add", ".", cwd=work)
+    git("commit", "-m", "epoxy", cwd=work)
+    git("switch", "-c", "stable/2024.1", cwd=work)
+    for name in ("svc1-consolidated", "svc1-api"):
+        (work / "rocks" / name).mkdir()
+        (work / "rocks" / name / "rockcraft.yaml").write_text(
+            ROCKCRAFT.format(name=name, family="svc1")
+        )
+    git("add", ".", cwd=work)
+    git("commit", "-m", "caracal", cwd=work)
+
+    bare = tmp_path / "ubuntu-openstack-rocks.git"
+    git("clone", "--bare", str(work), str(bare), cwd=tmp_path)
+    monkeypatch.setattr(SunbeamRockRepo, "REPO_URI", str(bare))
+    monkeypatch.setattr(SunbeamRockRepo, "_ensured", {})
+    return str(bare)
+
+
+@pytest.fixture
+def git_commands(monkeypatch):
+    """The git subcommands run by ``ensure_repo``."""
+    commands = []
+    check_call = subprocess.check_call
+
+    def record(args, *rest, **kwargs):
+        commands.append(args[1])
+        return check_call(args, *rest, stdout=subprocess.DEVNULL, **kwargs)
+
+    monkeypatch.setattr(fetch.subprocess, "check_call", record)
+    return commands
+
+
+def test_branches_get_separate_worktrees(upstream, git_commands):
+    main = ensure_repo(upstream, "main")
+    stable = ensure_repo(upstream, "stable/2024.1")
+
+    assert main != stable
+    assert main == fetch.worktree_path("ubuntu-openstack-rocks", "main")
+    assert not (main / "rocks" / "svc1-api").exists()
+    assert (stable / "rocks" / "svc1-api").is_dir()
+    # Both are worktrees of the one clone
+    assert git_commands == ["clone", "worktree", "fetch", "worktree"]
+
+
+def test_worktree_is_reused(upstream, git_commands):
+    first = ensure_repo(upstream, "main")
+    second = ensure_repo(upstream, "main", fetch=False)
+
+    assert first == second
+    assert git_commands == ["clone", "worktree", "switch"]
+
+
+def test_prefetch_fetches_once_and_reports_failures(
+    upstream, git_commands, monkeypatch
+):
+    ensure_repo(upstream, "main")
+    git_commands.clear()
+
+    def warm_index(series, release):
+        if release == Release.CARACAL:
+            raise ConnectionError("archive unreachable")
+        return "10 sources"
+
+    warmed = set()
+
+    def packages_index(url):
+        warmed.add(url)
+        return {"sudo": "1.9.15p5-3ubuntu5", "tgt": "1:1.0.85-1"}
+
+    monkeypatch.setattr(prefetch, "_warm_index", warm_index)
+    monkeypatch.setattr(prefetch.component, "packages_index", packages_index)
+    monkeypatch.setattr(prefetch.charms, "SUNBEAM_CHARMS", ("keystone-k8s",))
+    monkeypatch.setattr(prefetch, "_warm_charm", lambda name: "3 channels")
+
+    results = {
+        result.task: result
+        for result in prefetch.prefetch(
+            [Release.EPOXY, Release.CARACAL],
+            [Series.NOBLE],
+            ppas=["team/fix"],
+            jobs=4,
+        )
+    }
+
+    assert git_commands.count("fetch") == 1
+    assert git_commands.count("clone") == 0
+    assert results["repo main"].summary == "2 rocks"
+    assert results["repo stable/2024.1"].summary == "4 rocks"
+    assert results["index noble/epoxy"].error is None
+    assert isinstance(results["index noble/caracal"].error, ConnectionError)
+    assert results["charm keystone-k8s"].summary == "3 channels"
+    # The series' own release comes from the Ubuntu archive alone
+    assert results["packages noble/caracal"].summary == "8 packages"
+    assert results["packages noble/epoxy"].summary == "10 packages"
+    assert results["packages noble/ppa:team/fix"].summary == "2 packages"
+    # Everything `rock build --incremental` reads is cached
+    for release in (Release.EPOXY, Release.CARACAL):
+        urls = component.packages_urls(Series.NOBLE, release, "team/fix")
+        assert warmed.issuperset(urls)
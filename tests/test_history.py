@@ -0,0 +1,45 @@
+"""Tests for build history and longest-first scheduling."""
+
+from heliostat.history import MAX_RECORDS, BuildHistory, makespan, schedule
+from heliostat.types import Release, Series
+
+RELEASE, SERIES = Release.EPOXY, Series.NOBLE
+
+
+def make_history(tmp_path, durations: dict[str, float]) -> BuildHistory:
+    history = BuildHistory(tmp_path / "history.json")
+    for rock, duration in durations.items():
+        history.record(rock, RELEASE, SERIES, duration, 0)
+    return history
+
+
+def test_history_persists_recent_records(tmp_path):
+    history = make_history(tmp_path, {})
+    for duration in range(MAX_RECORDS + 3):
+        history.record("nova-api", RELEASE, SERIES, float(duration), 0)
+
+    reloaded = BuildHistory(tmp_path / "history.json")
+    assert len(reloaded.records["nova-api/epoxy/noble"]) == MAX_RECORDS
+    assert reloaded.estimate("nova-api", RELEASE, SERIES) == 5.0
+    assert reloaded.estimate("nova-api", Release.DALMATIAN, SERIES) is None
+
+
+def test_schedule_longest_first(tmp_path):
+    history = make_history(tmp_path, {"a": 10.0, "b": 30.0, "c": 20.0})
+    plan = schedule(
+        [(name, name) for name in "abc"], history, RELEASE, SERIES, jobs=2
+    )
+    assert [b.name for b in plan] == ["b", "c", "a"]
+    assert [b.start for b in plan] == [0.0, 0.0, 20.0]
+    assert makespan(plan) == 30.0
+
+
+def test_schedule_unknown_rocks_use_slowest_estimate(tmp_path):
+    history = make_history(tmp_path, {"a": 10.0, "b": 30.0})
+    plan = schedule(
+        [(name, name) for name in "abn"], history, RELEASE, SERIES, jobs=1
+    )
+    [new] = [b for b in plan if b.name == "n"]
+    assert not new.known
+    assert new.estimate == 30.0
+    assert makespan(plan) == 70.0
@@ -0,0 +1,56 @@
+"""Tests for the layer size analysis of built rocks."""
+
+import gzip
+import io
+import tarfile
+
+from heliostat.resources.layers import analyse, slimmable_category
+
+from .test_registry import make_rock
+
+
+def make_layer(files: dict[str, int], compress: bool = False) -> bytes:
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w") as tar:
+        for name, size in files.items():
+            info = tarfile.TarInfo(name)
+            info.size = size
+            tar.addfile(info, io.BytesIO(b"x" * size))
+    data = buffer.getvalue()
+    return gzip.compress(data) if compress else data
+
+
+def test_slimmable_category():
+    assert slimmable_category("usr/share/doc/tgt/README") == "docs"
+    assert slimmable_category("var/lib/apt/lists/archive_Packages") == (
+        "apt lists"
+    )
+    assert slimmable_category("usr/lib/python3/x/__pycache__/a.pyc") == (
+        "__pycache__"
+    )
+    assert slimmable_category("usr/bin/cinder-api") is None
+
+
+def test_analyse_sums_layers_and_directories(tmp_path):
+    rock = tmp_path / "cinder-api_2025.1_amd64.rock"
+    make_rock(
+        rock,
+        [
+            make_layer({"usr/bin/cinder-api": 100, "./usr/share/doc/a": 30}),
+            make_layer(
+                {"usr/share/locale/de/LC_MESSAGES/cinder.mo": 20},
+                compress=True,
+            ),
+        ],
+    )
+
+    usage = analyse(rock, depth=2)
+
+    assert [layer.size for layer in usage.layers] == [130, 20]
+    assert [layer.files for layer in usage.layers] == [2, 1]
+    assert usage.size == 150
+    assert usage.directories == {
+        "usr/bin": 100,
+        "usr/share": 50,
+    }
+    assert usage.categories == {"docs": 30, "locale": 20}
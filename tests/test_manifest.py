@@ -0,0 +1,180 @@
+"""Tests for looking up charms and generating sunbeam manifests."""
+
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import cast
+
+import msgspec
+import pytest
+from typer.testing import CliRunner
+
+from heliostat import charms, fetch
+from heliostat.charms import CharmInfo
+from heliostat.cli import main
+from heliostat.manifest import generate
+from heliostat.types import Release
+
+runner = CliRunner()
+
+CINDER_INFO = {
+    "name": "cinder-k8s",
+    "channel-map": [
+        {
+            "channel": {"name": "2024.1/stable"},
+            "resources": [
+                {"name": "cinder-api-image", "type": "oci-image"},
+                {"name": "cinder-scheduler-image", "type": "oci-image"},
+            ],
+        },
+        {
+            "channel": {"name": "2025.1/edge"},
+            "resources": [{"name": "cinder-api-image", "type": "oci-image"}],
+        },
+    ],
+}
+
+
+class FakeCharmhub(ThreadingHTTPServer):
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), FakeCharmhubHandler)
+        self.requests: list[str] = []
+
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+
+class FakeCharmhubHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        cast(FakeCharmhub, self.server).requests.append(self.path)
+        body = json.dumps(CINDER_INFO).encode()
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    monkeypatch.setattr(fetch, "OFFLINE", False)
+    return tmp_path / "cache" / "heliostat"
+
+
+@pytest.fixture
+def charmhub(cache, monkeypatch):
+    server = FakeCharmhub()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setattr(charms, "CHARMHUB_URL", server.url())
+    yield server
+    server.shutdown()
+
+
+def cache_charm(name: str, channels: dict[str, list[str]]):
+    path = charms.charm_info_path(name)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(msgspec.json.encode(CharmInfo(name, channels)))
+
+
+def test_charm_info_looked_up_once(charmhub):
+    info = charms.charm_info("cinder-k8s")
+    assert info.channels == {
+        "2024.1/stable": ["cinder-api-image", "cinder-scheduler-image"],
+        "2025.1/edge": ["cinder-api-image"],
+    }
+    assert charms.charm_info("cinder-k8s").channels == info.channels
+    assert len(charmhub.requests) == 1
+
+
+def test_offline_needs_cached_charm(cache, monkeypatch):
+    monkeypatch.setattr(fetch, "OFFLINE", True)
+    with pytest.raises(RuntimeError, match="offline"):
+        charms.charm_info("cinder-k8s")
+
+
+def test_generate_pins_release_track_and_matches_rocks(cache, tmp_path):
+    cache_charm("cinder-k8s", {"2025.1/edge": ["cinder-api-image"]})
+    cache_charm("keystone-k8s", {"2025.1/stable": ["keystone-image"]})
+    cache_charm("heat-k8s", {"2024.1/stable": ["heat-api-image"]})
+
+    rocks = [
+        tmp_path / "cinder-api_2025.1-heliostat_amd64.rock",
+        tmp_path / "nova-api_2025.1-heliostat_amd64.rock",
+    ]
+    manifest = generate(
+        Release.EPOXY,
+        charms=["cinder-k8s", "keystone-k8s", "heat-k8s"],
+        rocks=rocks,
+    )
+    assert manifest.to_yaml() == {
+        "core": {
+            "software": {
+                "charms": {
+                    "cinder-k8s": {"channel": "2025.1/edge"},
+                    "keystone-k8s": {"channel": "2025.1/stable"},
+                }
+            }
+        }
+    }
+    assert [(a.application, a.resource) for a in manifest.attachments] == [
+        ("cinder", "cinder-api-image")
+    ]
+    assert manifest.warnings == [
+        "cinder-k8s is not released to 2025.1/stable, using 2025.1/edge",
+        "heat-k8s has no 2025.1 track, left out",
+        "No charm in the manifest takes nova-api_2025.1-heliostat_amd64.rock",
+    ]
+
+
+def test_generate_matches_consolidated_rock_to_family_images(cache, tmp_path):
+    cache_charm(
+        "cinder-k8s",
+        {"2025.1/stable": ["cinder-api-image", "cinder-scheduler-image"]},
+    )
+    cache_charm(
+        "nova-k8s",
+        {"2025.1/stable": ["nova-api-image", "nova-scheduler-image"]},
+    )
+
+    rocks = [
+        tmp_path / "cinder-consolidated_2025.1-heliostat_amd64.rock",
+        tmp_path / "nova-api_2025.1-heliostat_amd64.rock",
+        tmp_path / "nova-consolidated_2025.1-heliostat_amd64.rock",
+        tmp_path / "glance-consolidated_2025.1-heliostat_amd64.rock",
+    ]
+    manifest = generate(
+        Release.EPOXY, charms=["cinder-k8s", "nova-k8s"], rocks=rocks
+    )
+
+    assert [
+        (a.application, a.resource, a.rock.name.split("_")[0])
+        for a in manifest.attachments
+    ] == [
+        ("nova", "nova-api-image", "nova-api"),
+        ("cinder", "cinder-api-image", "cinder-consolidated"),
+        ("cinder", "cinder-scheduler-image", "cinder-consolidated"),
+        # nova-api-image already has the rock of its own service
+        ("nova", "nova-scheduler-image", "nova-consolidated"),
+    ]
+    assert manifest.warnings == [
+        "No charm in the manifest takes "
+        "glance-consolidated_2025.1-heliostat_amd64.rock"
+    ]
+
+
+def test_manifest_generate_command(cache, tmp_path):
+    cache_charm("cinder-k8s", {"2024.1/stable": ["cinder-api-image"]})
+    output = tmp_path / "manifest.yaml"
+    result = runner.invoke(
+        main,
+        [
+            "manifest", "generate", "--release", "caracal",
+            "--charm", "cinder-k8s", "-o", str(output),
+        ],
+    )  # fmt: skip
+    assert result.exit_code == 0
+    assert "channel: 2024.1/stable" in output.read_text()
@@ -0,0 +1,223 @@
+"""Tests for pushing rocks to an OCI registry."""
+
+import hashlib
+import io
+import json
+import tarfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import cast
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from heliostat.resources.ctr import image_digest
+from heliostat.resources.registry import (
+    Registry,
+    rock_tag,
+    start_registry,
+)
+
+from .test_executors import write_script
+
+
+def _digest(data: bytes) -> str:
+    return "sha256:" + hashlib.sha256(data).hexdigest()
+
+
+def make_rock(path, layers: list[bytes]):
+    """Write a minimal single-manifest OCI archive to ``path``."""
+    config = json.dumps({"architecture": "amd64"}).encode()
+    manifest = json.dumps(
+        {
+            "schemaVersion": 2,
+            "mediaType": "application/vnd.oci.image.manifest.v1+json",
+            "config": {"digest": _digest(config), "size": len(config)},
+            "layers": [
+                {"digest": _digest(layer), "size": len(layer)}
+                for layer in layers
+            ],
+        }
+    ).encode()
+    index = json.dumps(
+        {
+            "schemaVersion": 2,
+            "manifests": [
+                {
+                    "mediaType": "application/vnd.oci.image.manifest.v1+json",
+                    "digest": _digest(manifest),
+                    "size": len(manifest),
+                }
+            ],
+        }
+    ).encode()
+
+    with tarfile.open(path, "w") as tar:
+        files = {"index.json": index}
+        for blob in [config, manifest, *layers]:
+            files[f"blobs/sha256/{_digest(blob).split(':')[1]}"] = blob
+        for name, data in files.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+    return _digest(manifest)
+
+
+class FakeRegistry(ThreadingHTTPServer):
+    """Just enough of the distribution API to exercise the push logic."""
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), FakeRegistryHandler)
+        self.blobs: dict[str, set[str]] = {}
+        self.manifests: dict[tuple[str, str], bytes] = {}
+        self.uploaded_bytes = 0
+        self.mounts = 0
+
+    @property
+    def host(self) -> str:
+        return f"127.0.0.1:{self.server_address[1]}"
+
+
+class FakeRegistryHandler(BaseHTTPRequestHandler):
+    @property
+    def registry(self) -> FakeRegistry:
+        return cast(FakeRegistry, self.server)
+
+    def log_message(self, format, *args):
+        pass
+
+    def _route(self):
+        url = urlparse(self.path)
+        parts = url.path.removeprefix("/v2/").split("/")
+        return parts, {k: v[0] for k, v in parse_qs(url.query).items()}
+
+    def _reply(self, code: int, headers: dict[str, str] | None = None):
+        self.send_response(code)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_HEAD(self):
+        (repo, _, digest), _ = self._route()
+        found = repo in self.registry.blobs.get(digest, set())
+        self._reply(200 if found else 404)
+
+    def do_POST(self):
+        (repo, *_), query = self._route()
+        if "mount" in query:
+            holders = self.registry.blobs.get(query["mount"], set())
+            if query.get("from") in holders:
+                holders.add(repo)
+                self.registry.mounts += 1
+                return self._reply(201)
+        self._reply(202, {"Location": f"/v2/{repo}/blobs/uploads/session"})
+
+    def do_PUT(self):
+        parts, query = self._route()
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        repo = parts[0]
+        if parts[1] == "manifests":
+            self.registry.manifests[(repo, parts[2])] = body
+        else:
+            assert _digest(body) == query["digest"]
+            self.registry.blobs.setdefault(query["digest"], set()).add(repo)
+            self.registry.uploaded_bytes += len(body)
+        self._reply(201)
+
+
+@pytest.fixture
+def fake_registry(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    server = FakeRegistry()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+
+
+def test_push_uploads_blobs_and_manifest(tmp_path, fake_registry):
+    rock = tmp_path / "cinder-api_2024.1-heliostat_amd64.rock"
+    digest = make_rock(rock, [b"layer-one", b"layer-two"])
+
+    stats = Registry(fake_registry.host, insecure=True).push(
+        rock, "cinder-api", tag="v1"
+    )
+
+    assert stats.uploaded == 3
+    assert digest == image_digest(rock)
+    assert ("cinder-api", digest) in fake_registry.manifests
+    assert ("cinder-api", "v1") in fake_registry.manifests
+
+
+def test_repeat_push_uploads_nothing(tmp_path, fake_registry):
+    rock = tmp_path / "cinder-api_2024.1_amd64.rock"
+    make_rock(rock, [b"layer-one", b"layer-two"])
+    Registry(fake_registry.host, insecure=True).push(rock, "cinder-api")
+    uploaded = fake_registry.uploaded_bytes
+
+    stats = Registry(fake_registry.host, insecure=True).push(
+        rock, "cinder-api"
+    )
+
+    assert stats.uploaded == 0
+    assert stats.existing == 3
+    assert fake_registry.uploaded_bytes == uploaded
+
+
+def test_shared_layers_are_mounted(tmp_path, fake_registry):
+    api = tmp_path / "cinder-api_2024.1_amd64.rock"
+    scheduler = tmp_path / "cinder-scheduler_2024.1_amd64.rock"
+    make_rock(api, [b"base-layer", b"api-layer"])
+    make_rock(scheduler, [b"base-layer", b"scheduler-layer"])
+
+    Registry(fake_registry.host, insecure=True).push(api, "cinder-api")
+    stats = Registry(fake_registry.host, insecure=True).push(
+        scheduler, "cinder-scheduler"
+    )
+
+    # The config blob is identical too, so both it and the base layer mount
+    assert stats.mounted == 2
+    assert stats.uploaded == 1
+    assert fake_registry.mounts == 2
+
+
+def test_rock_tag():
+    rock = Path("cinder-api_2024.1+heliostat_amd64.rock")
+    assert rock_tag(rock) == "2024.1-heliostat"
+    assert rock_tag(rock.with_name("cinder.rock")) is None
+
+
+def test_registry_defaults_to_https(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    assert Registry("registry.example.com").base == (
+        "https://registry.example.com/v2/"
+    )
+    assert Registry("localhost:5000", insecure=True).base == (
+        "http://localhost:5000/v2/"
+    )
+
+
+FAKE_DOCKER = """\
+import sys
+from pathlib import Path
+Path(sys.argv[0]).with_suffix(".log").open("a").write(sys.argv[1] + "\\n")
+if sys.argv[1] == "ps":
+    print("0123456789ab")
+elif sys.argv[1] == "port":
+    print("0.0.0.0:5001")
+    print("[::]:5001")
+"""
+
+
+def test_start_registry_reports_published_port(tmp_path, monkeypatch):
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    write_script(bin_dir / "docker", FAKE_DOCKER)
+    monkeypatch.setenv("PATH", str(bin_dir))
+
+    # The existing container was started with another port
+    assert start_registry(5000) == "localhost:5001"
+    commands = (bin_dir / "docker.log").read_text().split()
+    assert commands == ["ps", "start", "port"]
@@ -0,0 +1,52 @@
+"""Tests for reading the rocks of an ubuntu-openstack-rocks checkout."""
+
+from heliostat import rocks
+from heliostat.rocks import SunbeamRockRepo
+
+ROCKCRAFT = """\
+name: {name}
+base: ubuntu@24.04
+version: "2025.1"
+package-repositories:
+  - type: apt
+    cloud: epoxy
+    priority: always
+parts:
+  {family}:
+    plugin: nil
+    overlay-packages:
+      - sudo
+      - {name}
+"""
+
+
+def make_repo(path, n_rocks: int):
+    for i in range(n_rocks):
+        family = f"svc{i // 2}"
+        name = f"{family}-{'api' if i % 2 else 'consolidated'}"
+        (path / "rocks" / name).mkdir(parents=True)
+        (path / "rocks" / name / "rockcraft.yaml").write_text(
+            ROCKCRAFT.format(name=name, family=family)
+        )
+    return path
+
+
+def test_catalog_built_in_parallel_matches_serial(tmp_path, monkeypatch):
+    path = make_repo(tmp_path, 40)
+    monkeypatch.setattr(rocks, "PARALLEL_CATALOG_MIN", 1000)
+    serial = SunbeamRockRepo(path).catalog()
+
+    monkeypatch.setattr(rocks, "PARALLEL_CATALOG_MIN", 1)
+    monkeypatch.setattr(rocks, "_cores", lambda: 2)
+    parallel = SunbeamRockRepo(path).catalog()
+
+    assert parallel == serial
+    assert len(parallel) == 40
+    record = parallel["svc3-api"]
+    assert record.family == "svc3"
+    assert record.base == "ubuntu@24.04"
+    assert record.version == "2025.1"
+    assert record.repositories == [
+        {"type": "apt", "cloud": "epoxy", "priority": "always"}
+    ]
+    assert record.deps == ["sudo", "svc3-api"]
@@ -0,0 +1,57 @@
+"""Tests that the CLI defers its heavy imports until they are needed."""
+
+import subprocess
+import sys
+
+import pytest
+
+HEAVY_MODULES = ["requests", "ruamel.yaml", "debian.deb822"]
+
+CHECK_IMPORTS = """
+import sys
+from heliostat.cli import main
+try:
+    main(args=sys.argv[1:], prog_name="heliostat")
+except SystemExit:
+    pass
+print(",".join(m for m in {heavy!r} if m in sys.modules))
+print(",".join(m for m in sys.modules if m.startswith("heliostat.cli.")))
+"""
+
+
+def imported_modules(*args: str) -> tuple[set[str], set[str]]:
+    result = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            CHECK_IMPORTS.format(heavy=HEAVY_MODULES),
+            *args,
+        ],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    heavy, subcommands = result.stdout.splitlines()[-2:]
+    return set(filter(None, heavy.split(","))), set(
+        filter(None, subcommands.split(","))
+    )
+
+
+def test_help_imports_no_subcommands():
+    heavy, subcommands = imported_modules("--help")
+    assert heavy == set()
+    assert subcommands == set()
+
+
+@pytest.mark.parametrize(
+    "args",
+    [
+        ["rock", "list", "--help"],
+        ["package", "show", "--help"],
+        ["charm", "attach", "--help"],
+    ],
+)
+def test_subcommand_help_imports_no_heavy_modules(args):
+    heavy, subcommands = imported_modules(*args)
+    assert heavy == set()
+    assert subcommands == {f"heliostat.cli.{args[0]}"}
@@ -0,0 +1,126 @@
+"""Tests for capturing the output of builds into per-rock logs."""
+
+import gzip
+import threading
+
+import pytest
+import typer
+
+from heliostat import executors, supervisor
+from heliostat.cli.rock import do_build
+from heliostat.executors import BuildError, LocalExecutor
+from heliostat.rocks import RockcraftFile
+from heliostat.supervisor import BuildLog, StatusBoard, capture
+
+from .test_executors import write_script
+
+FAKE_ROCKCRAFT = """\
+import sys, time
+from pathlib import Path
+name = Path("rockcraft.yaml").read_text().split()[1]
+for i in range(500):
+    print(f"{name} step {i}", flush=True)
+print("progress 50%\\rprogress 100%", flush=True)
+if name == "broken":
+    print("error: no such package", file=sys.stderr, flush=True)
+    sys.exit(3)
+Path(f"{name}_1.0_amd64.rock").write_text(name)
+"""
+
+
+@pytest.fixture(autouse=True)
+def cache_home(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+
+
+@pytest.fixture
+def fake_rockcraft(tmp_path, monkeypatch):
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    rockcraft = write_script(bin_dir / "rockcraft", FAKE_ROCKCRAFT)
+    monkeypatch.setattr(executors, "ROCKCRAFT_BIN", rockcraft)
+
+
+def make_build_dir(path, name):
+    path.mkdir()
+    (path / "rockcraft.yaml").write_text(f"name: {name}\n")
+    return path
+
+
+def test_keeps_only_the_last_lines(tmp_path, fake_rockcraft):
+    log = BuildLog("keystone")
+    build_dir = make_build_dir(tmp_path / "build", "keystone")
+
+    with capture(log):
+        rocks = LocalExecutor().pack("keystone", build_dir)
+
+    assert [rock.name for rock in rocks] == ["keystone_1.0_amd64.rock"]
+    assert log.state == "done"
+    assert len(log.tail) == supervisor.LOG_TAIL_LINES
+    assert list(log.tail)[-3:] == [
+        "keystone step 499",
+        "progress 50%",
+        "progress 100%",
+    ]
+    lines = gzip.decompress(log.path.read_bytes()).decode().splitlines()
+    assert len(lines) == 502
+    assert lines[0] == "keystone step 0"
+    assert log.path.is_relative_to(supervisor.logs_dir() / "keystone")
+
+
+def test_captures_concurrent_builds_separately(tmp_path, fake_rockcraft):
+    logs = [BuildLog("nova"), BuildLog("glance")]
+
+    def build(log):
+        build_dir = make_build_dir(tmp_path / log.rock_name, log.rock_name)
+        with capture(log):
+            LocalExecutor().pack(log.rock_name, build_dir)
+
+    threads = [threading.Thread(target=build, args=(log,)) for log in logs]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    for log in logs:
+        content = gzip.decompress(log.path.read_bytes()).decode()
+        assert content.count(log.rock_name) == 500
+    title = StatusBoard(logs).render().title
+    assert title == "0 queued, 0 building, 2 done, 0 failed"
+
+
+def test_echoes_lines_as_they_come(tmp_path, fake_rockcraft):
+    echoed = []
+    log = BuildLog("nova", echo=echoed.append)
+    build_dir = make_build_dir(tmp_path / "build", "nova")
+
+    with capture(log):
+        LocalExecutor().pack("nova", build_dir)
+
+    assert len(echoed) == 502
+
+
+def test_failed_build_shows_the_tail(tmp_path, fake_rockcraft, capsys):
+    log = BuildLog("broken")
+    rockcraft = RockcraftFile(yaml={"name": "broken"})
+    output_dir = tmp_path / "out"
+    output_dir.mkdir()
+
+    with pytest.raises(typer.Exit):
+        do_build("broken", rockcraft, output_dir, [], log=log)
+
+    assert log.state == "failed"
+    err = capsys.readouterr().err
+    assert "  error: no such package" in err
+    assert str(log.path) in err
+    # Only the tail is shown, the rest is in the log
+    assert "broken step 0\n" not in err
+
+
+def test_pack_without_log_raises_build_error(tmp_path, fake_rockcraft):
+    build_dir = make_build_dir(tmp_path / "build", "broken")
+
+    with pytest.raises(BuildError) as e:
+        LocalExecutor().pack("broken", build_dir)
+
+    assert e.value.returncode == 3